@@ -14,6 +14,8 @@
 """
 
 import os
+import re
+import fnmatch
 import json
 import csv
 import xml.etree.ElementTree as ET
@@ -25,6 +27,7 @@ from pathlib import Path
 from datetime import datetime
 import time
 import mmap
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 
 def example_01_basic_file_operations():
@@ -333,7 +336,14 @@ def example_03_context_managers():
     print("\n4. Контекстный менеджер с обработкой ошибок:")
     
     class SafeFileManager:
-        """Безопасный файловый менеджер с обработкой ошибок"""
+        """
+        Безопасный файловый менеджер с обработкой ошибок
+        
+        При записи ('w') данные пишутся во временный файл рядом с
+        исходным и заменяют его атомарным переименованием только при
+        успешном завершении. Исходный файл не копируется в резервную
+        копию: до os.replace он просто не изменяется.
+        """
         
         def __init__(self, filename, mode, encoding='utf-8', backup=True):
             self.filename = filename
@@ -341,17 +351,20 @@ def example_03_context_managers():
             self.encoding = encoding
             self.backup = backup
             self.file = None
-            self.backup_file = None
+            self.temp_path = None
         
         def __enter__(self):
-            # Создаем резервную копию при записи
-            if self.backup and 'w' in self.mode and os.path.exists(self.filename):
-                self.backup_file = self.filename + '.backup'
-                shutil.copy2(self.filename, self.backup_file)
-                print(f"💾 Создана резервная копия: {self.backup_file}")
-            
             try:
-                self.file = open(self.filename, self.mode, encoding=self.encoding)
+                if self.backup and 'w' in self.mode:
+                    # Пишем во временный файл в той же директории (тот же том для rename)
+                    fd, self.temp_path = tempfile.mkstemp(
+                        dir=os.path.dirname(os.path.abspath(self.filename)),
+                        prefix=os.path.basename(self.filename) + '.',
+                        suffix='.tmp'
+                    )
+                    self.file = os.fdopen(fd, self.mode, encoding=self.encoding)
+                else:
+                    self.file = open(self.filename, self.mode, encoding=self.encoding)
                 return self.file
             except Exception as e:
                 print(f"❌ Ошибка открытия файла: {e}")
@@ -359,22 +372,27 @@ def example_03_context_managers():
         
         def __exit__(self, exc_type, exc_val, exc_tb):
             if self.file:
+                if self.temp_path and not exc_type:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
                 self.file.close()
             
             if exc_type:
                 print(f"❌ Ошибка во время работы с файлом: {exc_val}")
                 
-                # Восстанавливаем из резервной копии
-                if self.backup_file and os.path.exists(self.backup_file):
-                    shutil.move(self.backup_file, self.filename)
-                    print(f"🔄 Файл восстановлен из резервной копии")
+                # Исходный файл не тронут - достаточно удалить временный
+                if self.temp_path and os.path.exists(self.temp_path):
+                    os.unlink(self.temp_path)
+                    print(f"🔄 Изменения отменены, исходный файл не изменен")
                 
                 return False
             else:
-                # Удаляем резервную копию при успешном завершении
-                if self.backup_file and os.path.exists(self.backup_file):
-                    os.unlink(self.backup_file)
-                    print(f"🗑️ Резервная копия удалена")
+                if self.temp_path:
+                    # mkstemp создает файл с правами 0600 - переносим права исходного
+                    if os.path.exists(self.filename):
+                        shutil.copymode(self.filename, self.temp_path)
+                    os.replace(self.temp_path, self.filename)
+                    print(f"✅ Файл атомарно заменен")
                 
                 return True
     
@@ -447,6 +465,81 @@ def example_03_context_managers():
     print("Демонстрация контекстных менеджеров завершена")
 
 
+def compile_exclude_patterns(patterns):
+    """Объединяет glob-шаблоны исключений в одно регулярное выражение"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+def scan_tree(root, exclude=None, workers=8, follow_symlinks=False):
+    """
+    Параллельный рекурсивный обход директории
+    
+    Генератор пар (путь относительно root, os.DirEntry) для всех файлов.
+    Каждая директория читается через os.scandir в пуле потоков, и там же
+    вызывается stat(): результат кешируется в DirEntry, поэтому повторный
+    entry.stat() у вызывающего кода системного вызова не делает.
+    
+    exclude - glob-шаблоны или результат compile_exclude_patterns;
+    они проверяются по пути записи (для директорий - и с разделителем
+    на конце), исключенные директории не обходятся вовсе.
+    
+    Символические ссылки на файлы возвращаются всегда (stat - цели ссылки),
+    а в ссылки на директории обход заходит только при follow_symlinks=True:
+    так по умолчанию исключены циклы и повторный обход одного дерева.
+    """
+    if exclude is not None and not hasattr(exclude, 'match'):
+        exclude = compile_exclude_patterns(exclude)
+    
+    def excluded(entry, is_dir):
+        if exclude is None:
+            return False
+        return bool(exclude.match(entry.path) or is_dir and exclude.match(entry.path + os.sep))
+    
+    def scan_one(path, relative):
+        files = []
+        subdirs = []
+        
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    entry_relative = os.path.join(relative, entry.name) if relative else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                        if excluded(entry, is_dir):
+                            continue
+                        
+                        if is_dir:
+                            subdirs.append((entry.path, entry_relative))
+                        elif entry.is_file():
+                            entry.stat()  # Заполняем кеш DirEntry в рабочем потоке
+                            files.append((entry_relative, entry))
+                    except OSError:
+                        continue  # Файл удален во время обхода или нет доступа
+        except OSError:
+            pass  # Директория недоступна
+        
+        return files, subdirs
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_one, os.fspath(root), '')}
+        
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    files, subdirs = future.result()
+                    for path, relative in subdirs:
+                        pending.add(executor.submit(scan_one, path, relative))
+                    yield from files
+        finally:
+            # Генератор закрыт досрочно - незапущенные задачи не нужны
+            for future in pending:
+                future.cancel()
+
+
 def example_04_path_operations():
     """
     Пример 4: Работа с путями и директориями
@@ -544,13 +637,12 @@ def example_04_path_operations():
     
     print("\n5. Фильтрация файлов:")
     
-    def find_files_by_criteria(directory, **criteria):
+    def find_files_by_criteria(directory, exclude=None, **criteria):
         """Находит файлы по различным критериям"""
         results = []
         
-        for file_path in Path(directory).rglob('*'):
-            if not file_path.is_file():
-                continue
+        for relative_path, entry in scan_tree(directory, exclude=exclude):
+            file_path = Path(entry.path)
             
             # Фильтр по расширению
             if 'extension' in criteria:
@@ -559,12 +651,12 @@ def example_04_path_operations():
             
             # Фильтр по размеру
             if 'min_size' in criteria:
-                if file_path.stat().st_size < criteria['min_size']:
+                if entry.stat().st_size < criteria['min_size']:
                     continue
             
             # Фильтр по имени
             if 'name_contains' in criteria:
-                if criteria['name_contains'].lower() not in file_path.name.lower():
+                if criteria['name_contains'].lower() not in entry.name.lower():
                     continue
             
             results.append(file_path)
@@ -578,6 +670,10 @@ def example_04_path_operations():
     files_with_main = find_files_by_criteria(test_dir, name_contains='main')
     print(f"Файлы с 'main' в имени: {[f.name for f in files_with_main]}")
     
+    # Исключенные директории не обходятся вовсе
+    not_temp = find_files_by_criteria(test_dir, exclude=['*/temp'])
+    print(f"Файлы вне temp/: {sorted(f.name for f in not_temp)}")
+    
     print("\n6. Операции с файлами:")
     
     # Копирование
@@ -1030,15 +1126,12 @@ def example_06_archives_and_compression():
     def create_filtered_archive(source_dir, archive_name, extensions=None):
         """Создает архив только с файлами определенных расширений"""
         with zipfile.ZipFile(archive_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in source_dir.rglob('*'):
-                if not file_path.is_file():
+            # Сортировка делает порядок записей в архиве воспроизводимым
+            for arcname, entry in sorted(scan_tree(source_dir), key=lambda item: item[0]):
+                if extensions and os.path.splitext(entry.name)[1].lower() not in extensions:
                     continue
                 
-                if extensions and file_path.suffix.lower() not in extensions:
-                    continue
-                
-                arcname = file_path.relative_to(source_dir)
-                zipf.write(file_path, arcname)
+                zipf.write(entry.path, arcname)
                 print(f"  ✓ {arcname}")
     
     # Архивируем только текстовые файлы
@@ -1072,10 +1165,8 @@ def example_06_archives_and_compression():
                 if source.is_file():
                     zipf.write(source, source.name)
                 else:
-                    for file_path in source.rglob('*'):
-                        if file_path.is_file():
-                            arcname = file_path.relative_to(source.parent)
-                            zipf.write(file_path, arcname)
+                    for relative_path, entry in sorted(scan_tree(source), key=lambda item: item[0]):
+                        zipf.write(entry.path, os.path.join(source.name, relative_path))
         
         @staticmethod
         def _create_tar(source, archive):
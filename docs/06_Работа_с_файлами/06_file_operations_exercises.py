@@ -480,21 +480,113 @@ def exercise_03_file_synchronizer():
     
     import hashlib
     import fnmatch
+    import re
     from typing import List, Set, Tuple
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    import sqlite3
+    import stat
+    
+    # Все glob-шаблоны исключений объединяются в одно регулярное выражение
+    def compile_exclude_patterns(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+    
+    
+    # Параллельный обход директории: генератор (относительный путь, os.DirEntry)
+    # для всех файлов. Директории читаются через os.scandir в пуле потоков, и там же
+    # вызывается stat() - он кешируется в DirEntry. Исключенные директории
+    # (шаблон совпал с путем или с путем и разделителем на конце) не обходятся.
+    def scan_tree(root, exclude=None, workers=8, follow_symlinks=False):
+        if exclude is not None and not hasattr(exclude, 'match'):
+            exclude = compile_exclude_patterns(exclude)
+        
+        def excluded(entry, is_dir):
+            if exclude is None:
+                return False
+            return bool(exclude.match(entry.path) or is_dir and exclude.match(entry.path + os.sep))
+        
+        def scan_one(path, relative):
+            files = []
+            subdirs = []
+            
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        entry_relative = os.path.join(relative, entry.name) if relative else entry.name
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                            if excluded(entry, is_dir):
+                                continue
+                            
+                            if is_dir:
+                                subdirs.append((entry.path, entry_relative))
+                            # Ссылка на файл - тоже файл; follow_symlinks влияет только
+                            # на заход в ссылки на директории
+                            elif entry.is_file():
+                                entry.stat()  # Заполняем кеш DirEntry в рабочем потоке
+                                files.append((entry_relative, entry))
+                        except OSError:
+                            continue  # Файл удален во время обхода или нет доступа
+            except OSError:
+                pass  # Директория недоступна
+            
+            return files, subdirs
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(scan_one, os.fspath(root), '')}
+            
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    
+                    for future in done:
+                        files, subdirs = future.result()
+                        for path, relative in subdirs:
+                            pending.add(executor.submit(scan_one, path, relative))
+                        yield from files
+            finally:
+                # Генератор закрыт досрочно - незапущенные задачи не нужны
+                for future in pending:
+                    future.cancel()
+    
     
     class FileSynchronizer:
-        def __init__(self, log_file='sync.log'):
+        def __init__(self, log_file='sync.log', block_size=4096, hash_workers=4,
+                     state_db=None, log_buffer_size=100, delta_min_size=64 * 1024,
+                     delta_min_match=0.5):
             self.log_file = log_file
             self.exclude_patterns = []
+            self._exclude_re = None           # Все шаблоны исключений одним regex
+            self.block_size = block_size      # Размер блока для дельта-передачи
+            
+            # Дельта-режим окупается только на больших и мало изменившихся файлах:
+            # меньшие delta_min_size копируются целиком, а если доля совпавших
+            # блоков падает ниже delta_min_match - дельта прерывается в пользу копии
+            self.delta_min_size = delta_min_size
+            self.delta_min_match = delta_min_match
+            self.delta_chunk_size = max(block_size * 64, 1024 * 1024)
+            self.hash_workers = hash_workers  # Потоки для параллельного хеширования
+            
+            # Журнал состояния: что и в каком виде было синхронизировано в прошлый раз
+            self.state_db = state_db
+            if state_db:
+                self._init_state_db()
+            
+            # Пути, о которых сообщил наблюдатель (inotify/watchdog);
+            # None - наблюдатель не активен, нужно обходить дерево источника
+            self.changed_paths = None
+            
+            # Буфер лога: записи сбрасываются в файл пачками
+            self.log_buffer_size = log_buffer_size
+            self._log_buffer = []
         
         def add_exclude_pattern(self, pattern):
             self.exclude_patterns.append(pattern)
+            self._exclude_re = compile_exclude_patterns(self.exclude_patterns)
         
         def _should_exclude(self, path):
-            for pattern in self.exclude_patterns:
-                if fnmatch.fnmatch(str(path), pattern):
-                    return True
-            return False
+            return self._exclude_re is not None and self._exclude_re.match(str(path)) is not None
         
         def _calculate_hash(self, file_path):
             hash_obj = hashlib.md5()
@@ -512,31 +604,300 @@ def exercise_03_file_synchronizer():
             if target:
                 message += f" -> {target}"
             
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(message + '\n')
+            self._log_buffer.append(message)
+            if len(self._log_buffer) >= self.log_buffer_size:
+                self.flush_log()
             print(message)
         
-        def _get_file_info(self, directory):
-            file_info = {}
+        def flush_log(self):
+            # Один open/write на пачку записей вместо открытия файла на каждую
+            if not self._log_buffer:
+                return
             
-            for file_path in Path(directory).rglob('*'):
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(self._log_buffer) + '\n')
+            self._log_buffer = []
+        
+        # --- Журнал состояния синхронизации ---
+        
+        def _init_state_db(self):
+            conn = sqlite3.connect(self.state_db)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    pair TEXT,
+                    rel_path TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    hash TEXT,
+                    PRIMARY KEY (pair, rel_path)
+                )
+            ''')
+            
+            conn.commit()
+            conn.close()
+        
+        def _load_state(self, pair, directory):
+            conn = sqlite3.connect(self.state_db)
+            cursor = conn.cursor()
+            cursor.execute('SELECT rel_path, size, mtime, hash FROM sync_state WHERE pair = ?', (pair,))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            return {
+                rel_path: {
+                    'size': size,
+                    'mtime': mtime,
+                    'hash': file_hash,
+                    'full_path': Path(directory) / rel_path
+                }
+                for rel_path, size, mtime, file_hash in rows
+            }
+        
+        def _save_state(self, pair, source_dir, target_dir, touched, removed):
+            # Журнал обновляется точечно: stat только для затронутых путей,
+            # совпадающие после синхронизации файлы добавляются/обновляются,
+            # остальные и исчезнувшие (removed) удаляются из журнала
+            rows = []
+            stale = set(removed)
+            for rel_path in touched:
+                try:
+                    source_stat = (source_dir / rel_path).stat()
+                    target_stat = (target_dir / rel_path).stat()
+                except FileNotFoundError:
+                    stale.add(rel_path)
+                    continue
+                
+                if (source_stat.st_size != target_stat.st_size or
+                        source_stat.st_mtime != target_stat.st_mtime):
+                    stale.add(rel_path)
+                    continue
+                
+                known = self._known_hashes.get(rel_path)
+                if known and known[:2] != (source_stat.st_size, source_stat.st_mtime):
+                    known = None
+                rows.append((pair, rel_path, source_stat.st_size, source_stat.st_mtime,
+                             known[2] if known else None))
+            
+            conn = sqlite3.connect(self.state_db)
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM sync_state WHERE pair = ? AND rel_path = ?',
+                               [(pair, rel_path) for rel_path in stale])
+            cursor.executemany('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)', rows)
+            conn.commit()
+            conn.close()
+        
+        def mark_changed(self, rel_path):
+            # Вызывается обработчиком событий файловой системы
+            if self.changed_paths is None:
+                self.changed_paths = set()
+            self.changed_paths.add(str(rel_path))
+        
+        def _scan_changed(self, source_dir, state):
+            # Источник = прошлое состояние + изменения, о которых сообщил наблюдатель
+            file_info = {
+                rel_path: dict(info, full_path=source_dir / rel_path)
+                for rel_path, info in state.items()
+            }
+            
+            for rel_path in self.changed_paths:
+                file_path = source_dir / rel_path
                 if file_path.is_file() and not self._should_exclude(file_path):
-                    relative_path = file_path.relative_to(directory)
                     stat = file_path.stat()
-                    
-                    file_info[str(relative_path)] = {
+                    file_info[rel_path] = {
                         'size': stat.st_size,
                         'mtime': stat.st_mtime,
-                        'hash': self._calculate_hash(file_path),
+                        'hash': None,
                         'full_path': file_path
                     }
+                else:
+                    file_info.pop(rel_path, None)
+            
+            self.changed_paths = set()
+            return file_info
+        
+        def _get_file_info(self, directory):
+            # Собираем только stat - хеши считаются позже и лишь там, где нужно
+            file_info = {}
+            
+            # stat берется из кеша DirEntry, исключенные директории не обходятся
+            for relative_path, entry in scan_tree(directory, exclude=self._exclude_re):
+                stat = entry.stat()
+                
+                file_info[relative_path] = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'hash': None,
+                    'full_path': Path(entry.path)
+                }
             
             return file_info
         
+        def _stat_paths(self, directory, rel_paths):
+            # Точечный stat вместо обхода дерева: отсутствующие файлы в результат не попадают
+            file_info = {}
+            for rel_path in rel_paths:
+                file_path = directory / rel_path
+                try:
+                    file_stat = file_path.stat()
+                except OSError:
+                    continue
+                if not stat.S_ISREG(file_stat.st_mode):
+                    continue
+                
+                file_info[rel_path] = {
+                    'size': file_stat.st_size,
+                    'mtime': file_stat.st_mtime,
+                    'hash': None,
+                    'full_path': file_path
+                }
+            
+            return file_info
+        
+        def _fill_hashes(self, infos):
+            # Хеши из журнала состояния уже известны - считаем только остальные
+            infos = [info for info in infos if info['hash'] is None]
+            
+            # Хеширование упирается в I/O, а hashlib отпускает GIL -
+            # поэтому пул потоков дает реальное ускорение
+            with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                hashes = executor.map(self._calculate_hash, [info['full_path'] for info in infos])
+                for info, file_hash in zip(infos, hashes):
+                    info['hash'] = file_hash
+        
         def _copy_file(self, source_path, target_path):
             target_path.parent.mkdir(parents=True, exist_ok=True)
             shutil.copy2(source_path, target_path)
         
+        # --- Дельта-передача в стиле rsync ---
+        
+        @staticmethod
+        def _weak_checksum(block):
+            # Кольцевая контрольная сумма rsync: a - сумма байтов,
+            # b - взвешенная сумма; обе по модулю 2**16
+            a = sum(block) % 65536
+            b = sum((len(block) - i) * byte for i, byte in enumerate(block)) % 65536
+            return a, b
+        
+        def _block_signatures(self, file_path):
+            # Сигнатуры блоков целевого файла: слабая сумма -> [(номер блока, md5)]
+            signatures = {}
+            with open(file_path, 'rb') as f:
+                for index, block in enumerate(iter(lambda: f.read(self.block_size), b"")):
+                    a, b = self._weak_checksum(block)
+                    strong = hashlib.md5(block).hexdigest()
+                    signatures.setdefault(a | (b << 16), []).append((index, strong))
+            return signatures
+        
+        def _compute_delta(self, source_path, signatures):
+            # Генератор операций: ('copy', номер блока цели) или ('data', байты источника).
+            # Источник читается кусками delta_chunk_size - в памяти только текущий кусок.
+            # Посимвольный сдвиг окна дорог, поэтому, если после первых 16 блоков
+            # доля совпавших байт ниже delta_min_match, выдается ('abort', None)
+            size = self.block_size
+            chunk_size = self.delta_chunk_size
+            probe = size * 16
+            literal = bytearray()
+            matched = processed = 0
+            
+            with open(source_path, 'rb') as f:
+                data = b""
+                eof = False
+                pos = 0
+                a = b = None
+                while True:
+                    # Для сдвига окна нужен еще один байт сверх блока
+                    while len(data) - pos <= size and not eof:
+                        chunk = f.read(chunk_size)
+                        if chunk:
+                            data = data[pos:] + chunk
+                            pos = 0
+                        else:
+                            eof = True
+                    
+                    if len(data) - pos < size:
+                        break
+                    
+                    if a is None:
+                        a, b = self._weak_checksum(data[pos:pos + size])
+                    
+                    match = None
+                    candidates = signatures.get(a | (b << 16))
+                    if candidates:
+                        strong = hashlib.md5(data[pos:pos + size]).hexdigest()
+                        match = next((index for index, s in candidates if s == strong), None)
+                    
+                    if match is not None:
+                        if literal:
+                            yield ('data', bytes(literal))
+                            literal = bytearray()
+                        yield ('copy', match)
+                        pos += size
+                        matched += size
+                        processed += size
+                        a = b = None
+                        continue
+                    
+                    # Сдвигаем окно на один байт, пересчитывая сумму за O(1)
+                    out_byte = data[pos]
+                    literal.append(out_byte)
+                    pos += 1
+                    processed += 1
+                    
+                    if processed >= probe and matched < processed * self.delta_min_match:
+                        yield ('abort', None)
+                        return
+                    
+                    if len(literal) >= chunk_size:
+                        yield ('data', bytes(literal))
+                        literal = bytearray()
+                    
+                    if pos + size <= len(data):
+                        in_byte = data[pos + size - 1]
+                        a = (a - out_byte + in_byte) % 65536
+                        b = (b - size * out_byte + a) % 65536
+            
+            literal.extend(data[pos:])
+            if literal:
+                yield ('data', bytes(literal))
+        
+        def _apply_delta(self, target_path, delta):
+            # Собираем новый файл во временном файле и атомарно заменяем цель.
+            # Возвращает число переданных байт или None, если дельта прервана
+            target_path = Path(target_path)
+            temp_path = target_path.with_name(target_path.name + '.sync_tmp')
+            sent = 0
+            aborted = False
+            
+            with open(target_path, 'rb') as old, open(temp_path, 'wb') as new:
+                for op, value in delta:
+                    if op == 'abort':
+                        aborted = True
+                        break
+                    if op == 'copy':
+                        old.seek(value * self.block_size)
+                        new.write(old.read(self.block_size))
+                    else:
+                        new.write(value)
+                        sent += len(value)
+            
+            if aborted:
+                os.remove(temp_path)
+                return None
+            
+            os.replace(temp_path, target_path)
+            return sent
+        
+        def _delta_copy(self, source_path, target_path):
+            # Возвращает количество байт, которое пришлось "передать",
+            # или None, если выгоднее скопировать файл целиком
+            signatures = self._block_signatures(target_path)
+            sent = self._apply_delta(target_path, self._compute_delta(source_path, signatures))
+            if sent is not None:
+                shutil.copystat(source_path, target_path)
+            return sent
+        
         def _create_backup(self, file_path, backup_dir):
             backup_dir = Path(backup_dir)
             backup_dir.mkdir(parents=True, exist_ok=True)
@@ -548,89 +909,166 @@ def exercise_03_file_synchronizer():
             shutil.copy2(file_path, backup_path)
             return backup_path
         
-        def sync_directories(self, source_dir, target_dir, bidirectional=False, backup_dir=None):
+        def _update_file(self, source_path, target_path, delta):
+            # Полное копирование или передача только отличающихся блоков
+            size = Path(source_path).stat().st_size
+            if delta and size >= self.delta_min_size and Path(target_path).exists():
+                sent = self._delta_copy(source_path, target_path)
+                if sent is not None:
+                    self.bytes_sent += sent
+                    return f"DELTA({sent} из {size} байт)"
+            
+            self._copy_file(source_path, target_path)
+            self.bytes_sent += Path(source_path).stat().st_size
+            return "COPY"
+        
+        def sync_directories(self, source_dir, target_dir, bidirectional=False, backup_dir=None,
+                             delta=False):
             source_dir = Path(source_dir)
             target_dir = Path(target_dir)
+            self.bytes_sent = 0
             
             self._log_operation("SYNC_START", f"{source_dir} -> {target_dir}")
             
-            # Получаем информацию о файлах
-            source_files = self._get_file_info(source_dir)
-            target_files = self._get_file_info(target_dir)
-            
-            # Файлы только в источнике (нужно копировать)
-            source_only = set(source_files.keys()) - set(target_files.keys())
-            
-            # Файлы только в цели (нужно удалить или скопировать обратно)
-            target_only = set(target_files.keys()) - set(source_files.keys())
-            
-            # Общие файлы (нужно сравнить)
-            common_files = set(source_files.keys()) & set(target_files.keys())
-            
-            # Копируем новые файлы из источника
-            for rel_path in source_only:
-                source_path = source_files[rel_path]['full_path']
-                target_path = target_dir / rel_path
+            try:
+                # Получаем информацию о файлах
+                pair = f"{source_dir.resolve()} -> {target_dir.resolve()}"
+                state = self._load_state(pair, target_dir) if self.state_db else {}
                 
-                self._copy_file(source_path, target_path)
-                self._log_operation("COPY", source_path, target_path)
-            
-            # Обрабатываем общие файлы
-            for rel_path in common_files:
-                source_info = source_files[rel_path]
-                target_info = target_files[rel_path]
+                if state and self.changed_paths is not None:
+                    source_files = self._scan_changed(source_dir, state)
+                else:
+                    source_files = self._get_file_info(source_dir)
+                    # Полный обход уже учел все изменения - накопленные события не нужны
+                    if self.changed_paths is not None:
+                        self.changed_paths = set()
+                
+                if state and not bidirectional:
+                    # Цель не обходим, но проверяем stat путей из журнала и из источника:
+                    # файл могли изменить или удалить в обход синхронизатора. Удаленные
+                    # выпадают, а у измененных хеш из журнала не подойдет и будет пересчитан
+                    target_files = self._stat_paths(target_dir, set(state) | set(source_files))
+                else:
+                    target_files = self._get_file_info(target_dir)
+                
+                # Хеши из журнала годятся, если размер и mtime не изменились
+                for files in (source_files, target_files):
+                    for rel_path, info in files.items():
+                        saved = state.get(rel_path)
+                        if (saved and info['hash'] is None and
+                                (saved['size'], saved['mtime']) == (info['size'], info['mtime'])):
+                            info['hash'] = saved['hash']
+                
+                # Файлы только в источнике (нужно копировать)
+                source_only = set(source_files.keys()) - set(target_files.keys())
+                
+                # Файлы только в цели (нужно удалить или скопировать обратно)
+                target_only = set(target_files.keys()) - set(source_files.keys())
+                
+                # Общие файлы (нужно сравнить)
+                common_files = set(source_files.keys()) & set(target_files.keys())
+                
+                # Быстрый фильтр: совпадают размер и mtime - файл не менялся,
+                # хешировать его не нужно (copy2 сохраняет mtime при синхронизации)
+                suspect_files = [
+                    rel_path for rel_path in common_files
+                    if (source_files[rel_path]['size'] != target_files[rel_path]['size'] or
+                        source_files[rel_path]['mtime'] != target_files[rel_path]['mtime'])
+                ]
+                
+                self._fill_hashes([source_files[f] for f in suspect_files] +
+                                  [target_files[f] for f in suspect_files])
+                
+                changed_files = [f for f in suspect_files
+                                 if source_files[f]['hash'] != target_files[f]['hash']]
+                
+                self._known_hashes = {
+                    rel_path: (info['size'], info['mtime'], info['hash'])
+                    for rel_path, info in source_files.items() if info['hash']
+                }
                 
-                # Сравниваем по хешу
-                if source_info['hash'] != target_info['hash']:
+                # Копируем новые файлы из источника
+                for rel_path in source_only:
+                    source_path = source_files[rel_path]['full_path']
+                    target_path = target_dir / rel_path
+                    
+                    self._copy_file(source_path, target_path)
+                    self.bytes_sent += source_files[rel_path]['size']
+                    self._log_operation("COPY", source_path, target_path)
+                
+                # Обрабатываем измененные файлы
+                for rel_path in changed_files:
+                    source_info = source_files[rel_path]
+                    target_info = target_files[rel_path]
+                    
                     # Создаем резервную копию если нужно
                     if backup_dir:
                         backup_path = self._create_backup(
-                            target_info['full_path'], 
+                            target_info['full_path'],
                             Path(backup_dir) / 'target'
                         )
                         self._log_operation("BACKUP", target_info['full_path'], backup_path)
                     
                     # Копируем более новую версию
                     if source_info['mtime'] > target_info['mtime']:
-                        self._copy_file(source_info['full_path'], target_info['full_path'])
-                        self._log_operation("UPDATE", source_info['full_path'], target_info['full_path'])
+                        method = self._update_file(source_info['full_path'], target_info['full_path'], delta)
+                        self._log_operation(f"UPDATE [{method}]", source_info['full_path'], target_info['full_path'])
                     elif bidirectional and target_info['mtime'] > source_info['mtime']:
-                        self._copy_file(target_info['full_path'], source_info['full_path'])
-                        self._log_operation("UPDATE_BACK", target_info['full_path'], source_info['full_path'])
-            
-            # Обрабатываем файлы только в цели
-            if bidirectional:
-                for rel_path in target_only:
-                    target_path = target_files[rel_path]['full_path']
-                    source_path = source_dir / rel_path
-                    
-                    self._copy_file(target_path, source_path)
-                    self._log_operation("COPY_BACK", target_path, source_path)
-            
-            self._log_operation("SYNC_COMPLETE", f"{source_dir} -> {target_dir}")
-            
-            return {
-                'copied': len(source_only),
-                'updated': len([f for f in common_files 
-                               if source_files[f]['hash'] != target_files[f]['hash']]),
-                'copied_back': len(target_only) if bidirectional else 0
-            }
+                        method = self._update_file(target_info['full_path'], source_info['full_path'], delta)
+                        self._log_operation(f"UPDATE_BACK [{method}]", target_info['full_path'], source_info['full_path'])
+                
+                # Обрабатываем файлы только в цели
+                if bidirectional:
+                    for rel_path in target_only:
+                        target_path = target_files[rel_path]['full_path']
+                        source_path = source_dir / rel_path
+                        
+                        self._copy_file(target_path, source_path)
+                        self._log_operation("COPY_BACK", target_path, source_path)
+                
+                if self.state_db:
+                    # В журнал пишутся только пути, чье состояние могло измениться:
+                    # скопированные, подозрительные и расходящиеся с журналом
+                    touched = source_only | set(suspect_files)
+                    if bidirectional:
+                        touched |= target_only
+                    touched |= {
+                        rel_path for rel_path in common_files
+                        if rel_path not in state or
+                        (state[rel_path]['size'], state[rel_path]['mtime']) !=
+                        (source_files[rel_path]['size'], source_files[rel_path]['mtime'])
+                    }
+                    removed = set(state) - common_files - touched
+                    self._save_state(pair, source_dir, target_dir, touched, removed)
+                
+                self._log_operation("SYNC_COMPLETE", f"{source_dir} -> {target_dir}")
+                
+                return {
+                    'copied': len(source_only),
+                    'updated': len(changed_files),
+                    'copied_back': len(target_only) if bidirectional else 0,
+                    'hashed': len(suspect_files),
+                    'bytes_sent': self.bytes_sent
+                }
+            finally:
+                # Лог сбрасывается и при ошибке посреди синхронизации
+                self.flush_log()
         
         def create_archive_backup(self, directory, archive_path):
             directory = Path(directory)
             archive_path = Path(archive_path)
             
             with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in directory.rglob('*'):
-                    if file_path.is_file() and not self._should_exclude(file_path):
-                        arcname = file_path.relative_to(directory)
-                        zipf.write(file_path, arcname)
+                for arcname, entry in sorted(scan_tree(directory, exclude=self._exclude_re),
+                                             key=lambda item: item[0]):
+                    zipf.write(entry.path, arcname)
             
             self._log_operation("ARCHIVE_CREATED", directory, archive_path)
+            self.flush_log()
             return archive_path
     
     # Пример использования
-    synchronizer = FileSynchronizer()
+    synchronizer = FileSynchronizer(state_db='sync_state.db')
     
     # Добавляем исключения
     synchronizer.add_exclude_pattern('*.tmp')
@@ -646,13 +1084,36 @@ def exercise_03_file_synchronizer():
     
     print(f"Результат синхронизации: {result}")
     
+    # Повторная синхронизация в дельта-режиме: файлы с совпадающими
+    # размером и mtime не хешируются, а изменения крупных файлов передаются блоками
+    (source_dir / 'file1.txt').write_text('Содержимое файла 1 (дополнено)', encoding='utf-8')
+    result = synchronizer.sync_directories(source_dir, target_dir, delta=True)
+    print(f"Дельта-синхронизация: {result}")
+    
+    # Наблюдатель (например, watchdog) сообщает об изменениях -
+    # синхронизатор не обходит деревья, а сверяется с журналом состояния
+    (source_dir / 'subdir' / 'nested.txt').write_text('Вложенный файл v2', encoding='utf-8')
+    synchronizer.mark_changed(Path('subdir') / 'nested.txt')
+    result = synchronizer.sync_directories(source_dir, target_dir, delta=True)
+    print(f"Синхронизация по событиям: {result}")
+    
+    # Журнал не скрывает изменений цели в обход синхронизатора:
+    # более новая версия в цели сохраняется, удаленный файл восстанавливается
+    (target_dir / 'file2.txt').write_text('Изменено прямо в цели', encoding='utf-8')
+    (target_dir / 'subdir' / 'nested.txt').unlink()
+    result = synchronizer.sync_directories(source_dir, target_dir)
+    assert (target_dir / 'file2.txt').read_text(encoding='utf-8') == 'Изменено прямо в цели'
+    assert (target_dir / 'subdir' / 'nested.txt').read_text(encoding='utf-8') == 'Вложенный файл v2'
+    print(f"Изменения в цели учтены: {result}")
+    
     # Создаем архивную копию
     archive_path = synchronizer.create_archive_backup(source_dir, 'source_backup.zip')
     print(f"Архив создан: {archive_path}")
     """
     
     # Очистка
-    cleanup_items = [source_dir, target_dir, 'sync_backups', 'sync.log', 'source_backup.zip']
+    cleanup_items = [source_dir, target_dir, 'sync_backups', 'sync.log', 'source_backup.zip',
+                     'sync_state.db']
     for item in cleanup_items:
         try:
             if Path(item).is_dir():
@@ -663,6 +1124,18 @@ def exercise_03_file_synchronizer():
             pass
 
 
+# Процессор для дочерних процессов process_file_parallel. DataProcessor
+# объявлен внутри упражнения, а его фильтры - лямбды, поэтому воркер
+# на уровне модуля берет процессор, унаследованный процессом через fork.
+_parallel_processor = None
+
+
+def _process_range(task):
+    """Обработка одного диапазона CSV файла в дочернем процессе"""
+    index, filename, start, end, fieldnames, fragment_file = task
+    return index, _parallel_processor.process_range(filename, start, end, fieldnames, fragment_file)
+
+
 def exercise_04_data_processor():
     """
     Упражнение 4: Обработчик больших данных
@@ -709,60 +1182,104 @@ def exercise_04_data_processor():
     """
     # РЕШЕНИЕ:
     
-    from typing import Iterator, Dict, Any, Callable
+    from typing import Iterator, Dict, Any, Callable, List
+    import operator
+    import numpy as np
     import pandas as pd  # Для более эффективной обработки
     
+    # Операторы декларативных фильтров: ('Sales', '>', 100), ('Region', 'in', [...])
+    FILTER_OPERATORS = {
+        '>': operator.gt,
+        '>=': operator.ge,
+        '<': operator.lt,
+        '<=': operator.le,
+        '==': operator.eq,
+        '!=': operator.ne,
+    }
+    
     class DataProcessor:
+        NUMERIC_FIELDS = ['Sales', 'Quantity', 'Price']
+        
         def __init__(self, chunk_size=1000):
             self.chunk_size = chunk_size
             self.filters = []
             self.transformations = []
             self.aggregations = {}
         
-        def add_filter(self, condition: Callable[[Dict], bool]):
+        def add_filter(self, condition):
+            # condition - функция от строки или кортеж (поле, оператор, значение);
+            # кортежи компилируются в векторные маски в колоночном режиме
+            if isinstance(condition, tuple):
+                field, op, value = condition
+                if op != 'in' and op not in FILTER_OPERATORS:
+                    raise ValueError(f"Неизвестный оператор фильтра: {op}")
             self.filters.append(condition)
         
-        def add_transformation(self, field: str, transform_func: Callable):
-            self.transformations.append((field, transform_func))
+        def add_transformation(self, field: str, transform_func: Callable, vectorized: Callable = None):
+            # vectorized - та же трансформация над целой колонкой (pd.Series)
+            self.transformations.append((field, transform_func, vectorized))
+        
+        @staticmethod
+        def _row_predicate(condition):
+            if not isinstance(condition, tuple):
+                return condition
+            
+            field, op, value = condition
+            if op == 'in':
+                allowed = set(value)
+                return lambda row: row[field] in allowed
+            compare = FILTER_OPERATORS[op]
+            return lambda row: compare(row[field], value)
         
         def add_aggregation(self, field: str, agg_type: str, group_by=None):
             if group_by not in self.aggregations:
                 self.aggregations[group_by] = {}
             self.aggregations[group_by][field] = agg_type
         
+        def _counted_lines(self, f):
+            # Считаем прочитанные байты: tell() в текстовом режиме
+            # недоступен во время итерации, а прогресс нужен по смещению
+            for line in f:
+                self.bytes_read += len(line)
+                yield line.decode('utf-8')
+        
         def read_csv_chunks(self, filename: str) -> Iterator[List[Dict]]:
-            with open(filename, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                chunk = []
-                for row in reader:
-                    try:
-                        # Преобразуем числовые поля
-                        for field in ['Sales', 'Quantity', 'Price']:
-                            if field in row:
-                                row[field] = float(row[field])
-                        
-                        chunk.append(row)
-                        
-                        if len(chunk) >= self.chunk_size:
-                            yield chunk
-                            chunk = []
+            self.bytes_read = 0
+            
+            with open(filename, 'rb') as f:
+                yield from self._chunk_rows(csv.DictReader(self._counted_lines(f)))
+        
+        def _chunk_rows(self, reader) -> Iterator[List[Dict]]:
+            chunk = []
+            for row in reader:
+                try:
+                    # Преобразуем числовые поля
+                    for field in self.NUMERIC_FIELDS:
+                        if field in row:
+                            row[field] = float(row[field])
                     
-                    except ValueError as e:
-                        print(f"Ошибка в строке: {row}, пропускаем: {e}")
-                        continue
+                    chunk.append(row)
+                    
+                    if len(chunk) >= self.chunk_size:
+                        yield chunk
+                        chunk = []
                 
-                if chunk:
-                    yield chunk
+                except ValueError as e:
+                    print(f"Ошибка в строке: {row}, пропускаем: {e}")
+                    continue
+            
+            if chunk:
+                yield chunk
         
         def process_chunk(self, chunk: List[Dict]) -> List[Dict]:
             processed = []
+            filters = [self._row_predicate(condition) for condition in self.filters]
             
             for row in chunk:
                 # Применяем фильтры
-                if all(filter_func(row) for filter_func in self.filters):
+                if all(filter_func(row) for filter_func in filters):
                     # Применяем трансформации
-                    for field, transform_func in self.transformations:
+                    for field, transform_func, _ in self.transformations:
                         if field in row:
                             try:
                                 row[field] = transform_func(row[field])
@@ -773,33 +1290,93 @@ def exercise_04_data_processor():
             
             return processed
         
-        def process_file(self, input_file: str, output_file: str = None):
-            results = []
-            total_rows = 0
-            processed_rows = 0
-            
-            # Подсчитываем общее количество строк для прогресса
-            with open(input_file, 'r', encoding='utf-8') as f:
-                total_rows = sum(1 for _ in f) - 1  # -1 для заголовка
-            
-            print(f"Обрабатываем {total_rows} строк...")
+        def _chunk_partials(self, chunk: List[Dict]) -> Dict:
+            # Частичные агрегаты чанка в том же формате, что и _frame_partials
+            partials = {}
             
-            # Обрабатываем по частям
-            for chunk_num, chunk in enumerate(self.read_csv_chunks(input_file)):
-                processed_chunk = self.process_chunk(chunk)
-                results.extend(processed_chunk)
+            for group_field, aggs in self.aggregations.items():
+                group_states = partials.setdefault(group_field, {})
                 
-                processed_rows += len(chunk)
-                progress = (processed_rows / total_rows) * 100
-                print(f"Прогресс: {progress:.1f}% ({processed_rows}/{total_rows})")
+                for row in chunk:
+                    group = None if group_field is None else row.get(group_field, 'Unknown')
+                    fields = group_states.setdefault(group, {})
+                    
+                    for field in aggs:
+                        if field not in row:
+                            continue
+                        value = float(row[field])
+                        state = fields.get(field)
+                        if state is None:
+                            fields[field] = [1, value, value, value]
+                        else:
+                            state[0] += 1
+                            state[1] += value
+                            if value < state[2]:
+                                state[2] = value
+                            if value > state[3]:
+                                state[3] = value
+            
+            return partials
+        
+        def _open_output(self, filename: str):
+            # Возвращает функцию записи чанка и функцию завершения файла
+            suffix = Path(filename).suffix.lower()
+            f = open(filename, 'w', newline='', encoding='utf-8')
+            state = {'writer': None, 'first': True}
+            
+            def write_chunk(rows):
+                if suffix == '.json':
+                    for row in rows:
+                        f.write('[\n' if state['first'] else ',\n')
+                        f.write(json.dumps(row, ensure_ascii=False))
+                        state['first'] = False
+                elif rows:
+                    if state['writer'] is None:
+                        state['writer'] = csv.DictWriter(f, fieldnames=rows[0].keys())
+                        state['writer'].writeheader()
+                    state['writer'].writerows(rows)
+            
+            def close():
+                if suffix == '.json':
+                    f.write('[]' if state['first'] else '\n]')
+                f.close()
+            
+            return write_chunk, close
+        
+        def process_file(self, input_file: str, output_file: str = None) -> Dict:
+            # Потоковая обработка: память ограничена размером чанка.
+            # Агрегаты копятся по мере чтения, результат пишется по чанкам
+            total_bytes = os.path.getsize(input_file)
+            partials = {}
+            processed_rows = 0
+            kept_rows = 0
             
-            print(f"Обработано {len(results)} строк из {total_rows}")
+            print(f"Обрабатываем {total_bytes:,} байт...")
             
-            # Сохраняем результаты если указан файл
+            write_chunk, close_output = self._open_output(output_file) if output_file else (None, None)
+            
+            try:
+                # Обрабатываем по частям
+                for chunk in self.read_csv_chunks(input_file):
+                    processed_chunk = self.process_chunk(chunk)
+                    self.merge_partials(partials, self._chunk_partials(processed_chunk))
+                    
+                    if write_chunk:
+                        write_chunk(processed_chunk)
+                    
+                    processed_rows += len(chunk)
+                    kept_rows += len(processed_chunk)
+                    progress = (self.bytes_read / total_bytes) * 100 if total_bytes else 100
+                    print(f"Прогресс: {progress:.1f}% ({processed_rows} строк)")
+            finally:
+                if close_output:
+                    close_output()
+            
+            print(f"Обработано {kept_rows} строк из {processed_rows}")
             if output_file:
-                self.save_results(results, output_file)
+                print(f"Результаты сохранены в {output_file}")
             
-            return results
+            return self.finalize_aggregations(partials)
         
         def calculate_aggregations(self, data: List[Dict]):
             from collections import defaultdict
@@ -867,17 +1444,318 @@ def exercise_04_data_processor():
                         writer.writerows(data)
             
             print(f"Результаты сохранены в {filename}")
+        
+        # --- Колоночный (векторизованный) режим ---
+        
+        def read_csv_frames(self, filename: str) -> Iterator[pd.DataFrame]:
+            # Парсер pandas на C читает сразу колонки, а не словари строк
+            reader = pd.read_csv(filename, chunksize=self.chunk_size, encoding='utf-8')
+            
+            for frame in reader:
+                for field in self.NUMERIC_FIELDS:
+                    if field in frame:
+                        frame[field] = pd.to_numeric(frame[field], errors='coerce')
+                
+                numeric = [f for f in self.NUMERIC_FIELDS if f in frame]
+                bad_rows = frame[numeric].isna().any(axis=1)
+                if bad_rows.any():
+                    print(f"Пропущено строк с ошибками: {int(bad_rows.sum())}")
+                    frame = frame[~bad_rows]
+                
+                yield frame
+        
+        def _filter_mask(self, frame: pd.DataFrame) -> np.ndarray:
+            mask = np.ones(len(frame), dtype=bool)
+            
+            for condition in self.filters:
+                if isinstance(condition, tuple):
+                    field, op, value = condition
+                    column = frame[field]
+                    if op == 'in':
+                        mask &= column.isin(list(value)).to_numpy()
+                    else:
+                        mask &= FILTER_OPERATORS[op](column, value).to_numpy()
+                else:
+                    # Произвольная функция - медленный путь по строкам
+                    records = frame.to_dict('records')
+                    mask &= np.fromiter((bool(condition(row)) for row in records),
+                                        dtype=bool, count=len(records))
+            
+            return mask
+        
+        def process_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+            frame = frame[self._filter_mask(frame)].copy()
+            
+            for field, transform_func, vectorized in self.transformations:
+                if field in frame:
+                    if vectorized is not None:
+                        frame[field] = vectorized(frame[field])
+                    else:
+                        frame[field] = frame[field].map(transform_func)
+            
+            return frame
+        
+        def _frame_partials(self, frame: pd.DataFrame) -> Dict:
+            # Частичные агрегаты чанка: {группировка: {группа: {поле: [count, sum, min, max]}}}
+            partials = {}
+            
+            for group_field, aggs in self.aggregations.items():
+                if group_field is None:
+                    codes = np.zeros(len(frame), dtype=np.intp)
+                    groups = [None]
+                else:
+                    # factorize - хеш-кодирование групп в целые числа
+                    codes, uniques = pd.factorize(frame[group_field].fillna('Unknown'))
+                    groups = uniques.tolist()
+                
+                size = len(groups)
+                counts = np.bincount(codes, minlength=size)
+                group_states = {group: {} for group in groups}
+                
+                for field in aggs:
+                    values = frame[field].to_numpy(dtype=float)
+                    sums = np.bincount(codes, weights=values, minlength=size)
+                    mins = np.full(size, np.inf)
+                    maxs = np.full(size, -np.inf)
+                    np.minimum.at(mins, codes, values)
+                    np.maximum.at(maxs, codes, values)
+                    
+                    for i, group in enumerate(groups):
+                        group_states[group][field] = [
+                            int(counts[i]), float(sums[i]), float(mins[i]), float(maxs[i])
+                        ]
+                
+                partials[group_field] = group_states
+            
+            return partials
+        
+        @staticmethod
+        def merge_partials(total: Dict, partial: Dict) -> Dict:
+            # Частичные агрегаты ассоциативны: их можно объединять в любом порядке
+            for group_field, group_states in partial.items():
+                total_groups = total.setdefault(group_field, {})
+                for group, fields in group_states.items():
+                    total_fields = total_groups.setdefault(group, {})
+                    for field, (count, total_sum, low, high) in fields.items():
+                        state = total_fields.get(field)
+                        if state is None:
+                            total_fields[field] = [count, total_sum, low, high]
+                        else:
+                            state[0] += count
+                            state[1] += total_sum
+                            state[2] = min(state[2], low)
+                            state[3] = max(state[3], high)
+            return total
+        
+        def finalize_aggregations(self, partials: Dict) -> Dict:
+            # Тот же формат результата, что и у calculate_aggregations
+            aggregated = {}
+            
+            for group_field, aggs in self.aggregations.items():
+                group_results = {}
+                for group, fields in partials.get(group_field, {}).items():
+                    result = {}
+                    for field, agg_type in aggs.items():
+                        count, total_sum, low, high = fields.get(field, [0, 0.0, 0, 0])
+                        if agg_type == 'sum':
+                            result[f"{field}_sum"] = total_sum
+                        elif agg_type == 'avg':
+                            result[f"{field}_avg"] = total_sum / count if count else 0
+                        elif agg_type == 'count':
+                            result[f"{field}_count"] = count
+                        elif agg_type == 'min':
+                            result[f"{field}_min"] = low if count else 0
+                        elif agg_type == 'max':
+                            result[f"{field}_max"] = high if count else 0
+                    group_results[group] = result
+                
+                if group_field is None:
+                    aggregated['global'] = group_results.get(None, {})
+                else:
+                    aggregated[f'by_{group_field}'] = group_results
+            
+            return aggregated
+        
+        def process_file_columnar(self, input_file: str, output_file: str = None) -> Dict:
+            # Один проход: фильтры, трансформации, агрегаты и запись по чанкам
+            partials = {}
+            rows_in = rows_out = 0
+            first_chunk = True
+            
+            if output_file and Path(output_file).suffix.lower() == '.json':
+                raise ValueError("Колоночный режим пишет результаты в CSV")
+            
+            for frame in self.read_csv_frames(input_file):
+                rows_in += len(frame)
+                frame = self.process_frame(frame)
+                rows_out += len(frame)
+                
+                self.merge_partials(partials, self._frame_partials(frame))
+                
+                if output_file:
+                    frame.to_csv(output_file, mode='w' if first_chunk else 'a',
+                                 header=first_chunk, index=False)
+                    first_chunk = False
+            
+            print(f"Колоночный режим: обработано {rows_out} строк из {rows_in}")
+            return self.finalize_aggregations(partials)
+        
+        # --- Параллельная обработка диапазонов файла ---
+        
+        @staticmethod
+        def split_csv(filename: str, parts: int):
+            # Делим файл на диапазоны байт, выровненные по началу строки.
+            # Считаем, что поля не содержат переводов строк внутри кавычек
+            with open(filename, 'rb') as f:
+                header = f.readline()
+                fieldnames = next(csv.reader([header.decode('utf-8')]))
+                data_start = f.tell()
+                file_size = os.path.getsize(filename)
+                
+                step = max((file_size - data_start) // parts, 1)
+                bounds = [data_start]
+                for i in range(1, parts):
+                    f.seek(max(data_start + i * step - 1, bounds[-1]))
+                    f.readline()  # Дочитываем до конца текущей строки
+                    position = f.tell()
+                    if position >= file_size:
+                        break
+                    if position > bounds[-1]:
+                        bounds.append(position)
+                bounds.append(file_size)
+            
+            ranges = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+            return fieldnames, ranges
+        
+        def process_range(self, filename: str, start: int, end: int, fieldnames, fragment_file=None):
+            # Обработка одного диапазона: частичные агрегаты + фрагмент вывода без заголовка
+            partials = {}
+            rows_in = rows_out = 0
+            
+            def range_lines(f):
+                f.seek(start)
+                while f.tell() < end:
+                    line = f.readline()
+                    if not line:
+                        break
+                    yield line.decode('utf-8')
+            
+            out = open(fragment_file, 'w', newline='', encoding='utf-8') if fragment_file else None
+            writer = csv.DictWriter(out, fieldnames=fieldnames) if out else None
+            
+            try:
+                with open(filename, 'rb') as f:
+                    reader = csv.DictReader(range_lines(f), fieldnames=fieldnames)
+                    for chunk in self._chunk_rows(reader):
+                        processed = self.process_chunk(chunk)
+                        self.merge_partials(partials, self._chunk_partials(processed))
+                        if writer:
+                            writer.writerows(processed)
+                        rows_in += len(chunk)
+                        rows_out += len(processed)
+            finally:
+                if out:
+                    out.close()
+            
+            return partials, rows_in, rows_out
+        
+        def process_file_parallel(self, input_file: str, output_file: str = None,
+                                  workers: int = None, preserve_order: bool = True) -> Dict:
+            # Диапазоны файла обрабатываются в пуле процессов; агрегаты
+            # объединяются по мере готовности, фрагменты вывода склеиваются
+            # в порядке входного файла (или в порядке готовности)
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            global _parallel_processor
+            
+            workers = workers or os.cpu_count() or 1
+            fieldnames, ranges = self.split_csv(input_file, workers * 4)
+            fragment_dir = Path(tempfile.mkdtemp(prefix='data_processor_'))
+            
+            tasks = [
+                (index, input_file, start, end, fieldnames,
+                 str(fragment_dir / f"part_{index:05d}.csv") if output_file else None)
+                for index, (start, end) in enumerate(ranges)
+            ]
+            
+            partials = {}
+            rows_in = rows_out = 0
+            completed = []
+            
+            # Лямбды фильтров не сериализуются pickle - воркеры получают процессор через fork
+            _parallel_processor = self
+            try:
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    futures = [executor.submit(_process_range, task) for task in tasks]
+                    for future in as_completed(futures):
+                        index, (partial, chunk_in, chunk_out) = future.result()
+                        self.merge_partials(partials, partial)
+                        rows_in += chunk_in
+                        rows_out += chunk_out
+                        completed.append(index)
+                        print(f"Прогресс: {len(completed)}/{len(tasks)} диапазонов")
+                
+                if output_file:
+                    order = range(len(tasks)) if preserve_order else completed
+                    with open(output_file, 'wb') as out:
+                        out.write((','.join(fieldnames) + '\r\n').encode('utf-8'))
+                        for index in order:
+                            with open(tasks[index][5], 'rb') as fragment:
+                                shutil.copyfileobj(fragment, out, 1024 * 1024)
+            finally:
+                _parallel_processor = None
+                shutil.rmtree(fragment_dir, ignore_errors=True)
+            
+            print(f"Параллельно ({workers} процессов): обработано {rows_out} строк из {rows_in}")
+            return self.finalize_aggregations(partials)
+    
+    def benchmark_parallel_scaling(processor, csv_file, target_rows=10_000_000,
+                                   worker_counts=(1, 2, 4, 8)):
+        # Масштабируем сгенерированный файл до target_rows строк
+        # и сравниваем однопроцессную и параллельную обработку
+        big_file = f"{Path(csv_file).stem}_{target_rows // 1_000_000}m.csv"
+        
+        with open(csv_file, 'rb') as src:
+            header = src.readline()
+            rows = src.readlines()
+        
+        with open(big_file, 'wb') as out:
+            out.write(header)
+            written = 0
+            while written < target_rows:
+                batch = rows[:target_rows - written]
+                out.writelines(batch)
+                written += len(batch)
+        
+        size_mb = os.path.getsize(big_file) / 1024 / 1024
+        print(f"Бенчмарк: {target_rows:,} строк, {size_mb:.0f} МБ")
+        
+        start = time.perf_counter()
+        processor.process_file(big_file)
+        baseline = time.perf_counter() - start
+        print(f"  process_file: {baseline:.2f}с ({target_rows / baseline:,.0f} строк/с)")
+        
+        for workers in worker_counts:
+            start = time.perf_counter()
+            processor.process_file_parallel(big_file, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"  {workers} процессов: {elapsed:.2f}с, ускорение x{baseline / elapsed:.2f}")
+        
+        os.unlink(big_file)
     
     # Пример использования
     processor = DataProcessor(chunk_size=500)
     
-    # Добавляем фильтры
-    processor.add_filter(lambda row: row['Sales'] > 100)  # Продажи больше 100
-    processor.add_filter(lambda row: row['Region'] in ['North', 'South'])  # Только север и юг
+    # Добавляем фильтры (кортежи работают в обоих режимах)
+    processor.add_filter(('Sales', '>', 100))  # Продажи больше 100
+    processor.add_filter(('Region', 'in', ['North', 'South']))  # Только север и юг
     
     # Добавляем трансформации
-    processor.add_transformation('Product', lambda x: x.upper())  # Продукты в верхнем регистре
-    processor.add_transformation('Sales', lambda x: round(x, 0))  # Округляем продажи
+    processor.add_transformation('Product', lambda x: x.upper(),  # Продукты в верхнем регистре
+                                 vectorized=lambda column: column.str.upper())
+    processor.add_transformation('Sales', lambda x: round(x, 0),  # Округляем продажи
+                                 vectorized=lambda column: column.round(0))
     
     # Добавляем агрегации
     processor.add_aggregation('Sales', 'sum')
@@ -887,11 +1765,8 @@ def exercise_04_data_processor():
     processor.add_aggregation('Sales', 'sum', group_by='Region')
     processor.add_aggregation('Sales', 'avg', group_by='Product')
     
-    # Обрабатываем файл
-    filtered_data = processor.process_file(csv_file, 'filtered_sales.csv')
-    
-    # Вычисляем агрегации
-    aggregations = processor.calculate_aggregations(filtered_data)
+    # Обрабатываем файл: агрегации считаются в том же проходе
+    aggregations = processor.process_file(csv_file, 'filtered_sales.csv')
     
     # Сохраняем агрегации
     with open('sales_aggregations.json', 'w', encoding='utf-8') as f:
@@ -900,10 +1775,23 @@ def exercise_04_data_processor():
     print("Агрегации:")
     for key, value in aggregations.items():
         print(f"  {key}: {value}")
+    
+    # Колоночный режим: тот же результат за один проход векторными операциями
+    columnar_aggregations = processor.process_file_columnar(csv_file, 'filtered_sales_columnar.csv')
+    print(f"Колоночные агрегации: {columnar_aggregations['global']}")
+    
+    # Параллельная обработка с сохранением порядка строк в выходном файле
+    parallel_aggregations = processor.process_file_parallel(csv_file, 'filtered_sales_parallel.csv')
+    print(f"Параллельные агрегации: {parallel_aggregations['global']}")
+    
+    # Масштабирование на 10 млн строк (~430 МБ, выполняется несколько минут)
+    benchmark_parallel_scaling(processor, csv_file)
     """
     
     # Очистка
-    cleanup_files = [csv_file, 'filtered_sales.csv', 'sales_aggregations.json']
+    cleanup_files = [csv_file, 'filtered_sales.csv', 'sales_aggregations.json',
+                     'filtered_sales_columnar.csv', 'filtered_sales_parallel.csv',
+                     'large_sales_data_10m.csv']
     for filename in cleanup_files:
         try:
             os.unlink(filename)
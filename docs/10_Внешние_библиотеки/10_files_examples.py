@@ -14,11 +14,22 @@
 
 import os
 import sys
+import builtins
+import io
 import json
+import logging
+import codecs
 import csv
+import mmap
+import re
 import tempfile
 import shutil
+import threading
 import time
+import unicodedata
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from contextlib import contextmanager
 from typing import List, Dict, Any, Generator, Optional
@@ -152,6 +163,38 @@ def example_01_basic_file_operations():
             print(f"\nФайл {test_file} удален")
 
 
+def _transcode_range(task):
+    """
+    Перекодировка диапазона байтов файла в отдельный файл
+    
+    Функция вынесена на уровень модуля: пул процессов передает в
+    дочерний процесс ссылку на функцию, а вложенные функции примеров
+    сериализовать нельзя.
+    """
+    (source_file, target_file, start, end,
+     from_encoding, to_encoding, errors, buffer_size, prefix) = task
+    
+    decoder = codecs.getincrementaldecoder(from_encoding)(errors)
+    encoder = codecs.getincrementalencoder(to_encoding)(errors)
+    
+    with open(source_file, 'rb') as src, open(target_file, 'wb') as dst:
+        dst.write(prefix)
+        src.seek(start)
+        remaining = end - start
+        
+        while remaining > 0:
+            chunk = src.read(min(buffer_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            dst.write(encoder.encode(decoder.decode(chunk)))
+        
+        # Незавершенная последовательность в конце диапазона - ошибка кодека
+        dst.write(encoder.encode(decoder.decode(b'', final=True), final=True))
+    
+    return end - start
+
+
 def example_02_encoding_handling():
     """
     Пример 2: Работа с кодировками
@@ -191,17 +234,142 @@ def example_02_encoding_handling():
             except UnicodeEncodeError as e:
                 print(f"   ❌ {filename}: Ошибка кодирования {encoding} - {e}")
     
+    class EncodingDetector:
+        """
+        Статистический детектор кодировки по ограниченному префиксу файла
+        
+        Порядок проверки: BOM, чистый ASCII, корректный UTF-8, затем
+        оценка однобайтовых кодировок. Для каждой из них префикс одним
+        вызовом bytes.translate отображается в строку классов символов,
+        а частоты пар классов подсчитываются bytes.count - без цикла
+        по байтам на Python.
+        """
+        
+        BOMS = [
+            # UTF-32 LE проверяется раньше UTF-16 LE: их BOM начинаются одинаково
+            (codecs.BOM_UTF32_LE, 'utf-32'),
+            (codecs.BOM_UTF32_BE, 'utf-32'),
+            (codecs.BOM_UTF8, 'utf-8-sig'),
+            (codecs.BOM_UTF16_LE, 'utf-16'),
+            (codecs.BOM_UTF16_BE, 'utf-16'),
+        ]
+        
+        # Однобайтовая кодировка -> алфавит, ожидаемый в старших байтах
+        SINGLE_BYTE = {
+            'cp1251': 'cyrillic',
+            'koi8-r': 'cyrillic',
+            'iso-8859-1': 'latin',
+        }
+        
+        # Веса пар классов: l/u - буква алфавита в нижнем/верхнем регистре,
+        # a - ASCII-буква. Кириллица идет сплошными словами, а латинские
+        # буквы с диакритикой - вкраплениями в ASCII-слова.
+        PAIR_WEIGHTS = {
+            'cyrillic': {b'll': 2, b'ul': 1, b'lu': -2, b'al': -2, b'la': -2},
+            'latin': {b'al': 2, b'la': 2, b'ua': 1, b'll': -2, b'lu': -2, b'ul': -1, b'uu': -1},
+        }
+        
+        # Класс x - управляющий или неопределенный в кодировке символ
+        INVALID_PENALTY = 5
+        
+        HIGH_BYTES = bytes(range(0x80, 0x100))
+        
+        def __init__(self, sample_size=64 * 1024):
+            self.sample_size = sample_size
+            self.tables = {
+                encoding: self._class_table(encoding, alphabet)
+                for encoding, alphabet in self.SINGLE_BYTE.items()
+            }
+        
+        @staticmethod
+        def _class_table(encoding, alphabet):
+            """Таблица для bytes.translate: байт -> класс символа"""
+            table = bytearray(b'.' * 256)
+            
+            for byte in range(0x80):
+                if chr(byte).isalpha():
+                    table[byte] = ord('a')
+            
+            for byte in range(0x80, 0x100):
+                char = bytes([byte]).decode(encoding, errors='ignore')
+                if not char or unicodedata.category(char).startswith('C'):
+                    table[byte] = ord('x')
+                elif char.isalpha() and (alphabet == 'latin' or '\u0400' <= char <= '\u04FF'):
+                    table[byte] = ord('l') if char.islower() else ord('u')
+            
+            return bytes(table)
+        
+        def detect(self, sample, complete=True):
+            """
+            Определение кодировки по префиксу файла
+            
+            complete=False означает, что префикс обрезан и последний
+            символ UTF-8 может быть неполным.
+            Возвращает (кодировка, уверенность от 0 до 1, метод).
+            """
+            for bom, encoding in self.BOMS:
+                if sample.startswith(bom):
+                    return encoding, 1.0, 'bom'
+            
+            if sample.isascii():
+                return 'ascii', 1.0, 'ascii'
+            
+            try:
+                codecs.getincrementaldecoder('utf-8')().decode(sample, final=complete)
+                return 'utf-8', 0.99, 'utf-8'
+            except UnicodeDecodeError:
+                pass
+            
+            return self._score_single_byte(sample)
+        
+        def _score_single_byte(self, sample):
+            """Оценка однобайтовых кодировок по частотам пар классов"""
+            high_count = len(sample) - len(sample.translate(None, self.HIGH_BYTES))
+            scores = {}
+            
+            for encoding, table in self.tables.items():
+                classes = sample.translate(table)
+                weights = self.PAIR_WEIGHTS[self.SINGLE_BYTE[encoding]]
+                
+                score = sum(weight * classes.count(pair) for pair, weight in weights.items())
+                score -= self.INVALID_PENALTY * classes.count(b'x')
+                scores[encoding] = score / high_count
+            
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            margin = scores[ranked[0]] - scores[ranked[1]]
+            confidence = min(0.95, margin / (margin + 1))
+            
+            return ranked[0], confidence, 'statistics'
+        
+        def detect_file(self, filename):
+            """Определение кодировки файла по первым sample_size байтам"""
+            with open(filename, 'rb') as file:
+                # Лишний байт показывает, обрезан ли префикс
+                sample = file.read(self.sample_size + 1)
+            
+            complete = len(sample) <= self.sample_size
+            return self.detect(sample[:self.sample_size], complete)
+        
+        def detect_many(self, filenames, workers=8):
+            """Пакетное определение: {файл: (кодировка, уверенность, метод)}"""
+            filenames = list(filenames)
+            
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return dict(zip(filenames, executor.map(self.detect_file, filenames)))
+    
+    detector = EncodingDetector()
+    
     print(f"\n2. Анализ созданных файлов ({len(created_files)} файлов):")
     
     def analyze_file_encoding(filename):
         """Анализ кодировки файла"""
         print(f"\n   Анализ файла: {filename}")
         
-        # Читаем в бинарном режиме
+        # Читаем в бинарном режиме только префикс
         with open(filename, 'rb') as file:
-            raw_bytes = file.read()
+            raw_bytes = file.read(detector.sample_size)
         
-        print(f"     Размер: {len(raw_bytes)} байт")
+        print(f"     Размер: {os.path.getsize(filename)} байт")
         print(f"     Первые байты: {raw_bytes[:20]}")
         
         # Пробуем различные кодировки
@@ -213,6 +381,9 @@ def example_02_encoding_handling():
                 print(f"     {encoding:>12}: ✅ {decoded}")
             except UnicodeDecodeError as e:
                 print(f"     {encoding:>12}: ❌ {str(e)[:50]}...")
+        
+        encoding, confidence, method = detector.detect_file(filename)
+        print(f"     Детектор: {encoding} (уверенность {confidence:.2f}, {method})")
     
     # Анализируем несколько файлов
     for filename, original_encoding, original_text in created_files[:3]:
@@ -230,7 +401,7 @@ def example_02_encoding_handling():
         for strategy in error_strategies:
             try:
                 with open(filename, 'r', encoding=target_encoding, errors=strategy) as file:
-                    content = file.read()
+                    content = file.read(256)  # Для превью достаточно начала файла
                 
                 print(f"     {strategy:>18}: {repr(content[:50])}...")
                 
@@ -245,63 +416,249 @@ def example_02_encoding_handling():
     
     print("\n4. Автоматическое определение кодировки:")
     
-    def detect_encoding_simple(filename):
-        """Простое определение кодировки методом попыток"""
-        
-        common_encodings = ['utf-8', 'cp1251', 'iso-8859-1', 'ascii']
+    def detect_encoding(filename):
+        """Определение кодировки статистическим детектором по префиксу файла"""
         
-        with open(filename, 'rb') as file:
-            sample = file.read(1024)  # Читаем образец
+        encoding, confidence, method = detector.detect_file(filename)
         
         print(f"\n   Определение кодировки для: {filename}")
+        print(f"     {encoding:>12}: уверенность {confidence:.2f} ({method})")
         
-        for encoding in common_encodings:
-            try:
-                decoded = sample.decode(encoding)
-                
-                # Простая эвристика: проверяем наличие русских символов
-                has_cyrillic = any('\u0400' <= char <= '\u04FF' for char in decoded)
-                has_extended = any(ord(char) > 127 for char in decoded)
-                
-                confidence = "высокая" if not has_extended else "средняя"
-                if has_cyrillic and encoding == 'cp1251':
-                    confidence = "высокая"
-                
-                print(f"     {encoding:>12}: ✅ {confidence} - {repr(decoded[:30])}...")
-                return encoding
-                
-            except UnicodeDecodeError:
-                print(f"     {encoding:>12}: ❌")
-        
-        return 'utf-8'  # Fallback
+        return encoding
+    
+    def same_encoding(detected, original):
+        """Сравнение кодировок с учетом синонимов; ASCII совместим со всеми"""
+        return detected == 'ascii' or codecs.lookup(detected).name == codecs.lookup(original).name
     
     # Определяем кодировку для нескольких файлов
     for filename, original_encoding, _ in created_files[::3]:  # Каждый третий
-        detected = detect_encoding_simple(filename)
-        match = "✅" if detected == original_encoding else "❌"
+        detected = detect_encoding(filename)
+        match = "✅" if same_encoding(detected, original_encoding) else "❌"
         print(f"     Исходная: {original_encoding}, определена: {detected} {match}")
     
+    def benchmark_detector(files_per_text=25, workers=8):
+        """Точность и пропускная способность детектора на сгенерированном корпусе"""
+        
+        def trial_decode(filename):
+            """Прежний способ: первая кодировка, которой удалось декодировать 1 KiB"""
+            with open(filename, 'rb') as file:
+                sample = file.read(1024)
+            for encoding in ['utf-8', 'cp1251', 'iso-8859-1', 'ascii']:
+                try:
+                    sample.decode(encoding)
+                    return encoding
+                except UnicodeDecodeError:
+                    pass
+            return 'utf-8'
+        
+        corpus = {}
+        
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            # Файлы разной длины: от одной строки до нескольких сотен
+            for text_name, text in test_texts.items():
+                for encoding in ['utf-8', 'cp1251', 'koi8-r', 'iso-8859-1']:
+                    for i in range(files_per_text):
+                        filename = os.path.join(corpus_dir, f"{text_name}_{encoding}_{i}.txt")
+                        try:
+                            data = '\n'.join([text] * (1 + i * i)).encode(encoding)
+                        except UnicodeEncodeError:
+                            break
+                        with open(filename, 'wb') as file:
+                            file.write(data)
+                        corpus[filename] = encoding
+            
+            filenames = list(corpus)
+            sampled_bytes = sum(min(os.path.getsize(f), detector.sample_size) for f in filenames)
+            
+            start_time = time.perf_counter()
+            results = detector.detect_many(filenames, workers=workers)
+            elapsed = time.perf_counter() - start_time
+            
+            correct = sum(
+                same_encoding(results[f][0], corpus[f]) for f in filenames
+            )
+            trial_correct = sum(
+                same_encoding(trial_decode(f), corpus[f]) for f in filenames
+            )
+        
+        print(f"\n   Корпус: {len(filenames)} файлов, {sampled_bytes:,} байт в префиксах")
+        print(f"     Точность детектора: {correct / len(filenames):.1%}")
+        print(f"     Точность перебора кодировок: {trial_correct / len(filenames):.1%}")
+        print(f"     Пропускная способность: {len(filenames) / elapsed:,.0f} файлов/с, "
+              f"{sampled_bytes / elapsed / (1024 * 1024):.1f} MB/с")
+    
+    benchmark_detector()
+    
     print("\n5. Конвертация между кодировками:")
     
-    def convert_file_encoding(source_file, target_file, from_encoding, to_encoding):
-        """Конвертация файла из одной кодировки в другую"""
+    class StreamingTranscoder:
+        """
+        Потоковая перекодировка файлов на инкрементальных кодеках
+        
+        Файл читается блоками по buffer_size байт, поэтому расход
+        памяти не зависит от размера файла. BOM исходного файла
+        снимается, BOM целевого файла записывается явно, а сами данные
+        перекодируются кодеками без BOM. Поэтому вход UTF-8 можно
+        разрезать по границам символов и перекодировать части в
+        отдельных процессах.
+        """
+        
+        # Кодек с BOM -> кодеки без BOM; первый соответствует little-endian
+        BOM_FAMILIES = {
+            'utf-8-sig': ['utf-8'],
+            'utf-16': ['utf-16-le', 'utf-16-be'],
+            'utf-32': ['utf-32-le', 'utf-32-be'],
+        }
         
-        try:
-            # Читаем в исходной кодировке
-            with open(source_file, 'r', encoding=from_encoding) as src:
-                content = src.read()
+        UNICODE_BOMS = {
+            'utf-8': codecs.BOM_UTF8,
+            'utf-16-le': codecs.BOM_UTF16_LE,
+            'utf-16-be': codecs.BOM_UTF16_BE,
+            'utf-32-le': codecs.BOM_UTF32_LE,
+            'utf-32-be': codecs.BOM_UTF32_BE,
+        }
+        
+        # Вход этих кодировок можно резать перед любым байтом, кроме байта продолжения
+        SPLITTABLE = ('utf-8', 'ascii')
+        
+        def __init__(self, buffer_size=1024 * 1024, errors='strict'):
+            self.buffer_size = buffer_size
+            self.errors = errors
+        
+        def _native(self, name):
+            """Кодек без BOM, который Python выбирает для кодека с BOM"""
+            family = self.BOM_FAMILIES[name]
+            return family[-1] if sys.byteorder == 'big' else family[0]
+        
+        def _source_codec(self, source_file, encoding):
+            """(длина BOM в начале файла, кодек без BOM) для исходного файла"""
+            name = codecs.lookup(encoding).name
+            
+            with open(source_file, 'rb') as file:
+                head = file.read(4)
+            
+            # BOM снимается и для кодека без BOM (utf-8 при файле с BOM)
+            for codec in self.BOM_FAMILIES.get(name, [name]):
+                bom = self.UNICODE_BOMS.get(codec)
+                if bom and head.startswith(bom):
+                    return len(bom), codec
+            
+            if name in self.BOM_FAMILIES:
+                return 0, self._native(name)
+            return 0, name
+        
+        def _target_codec(self, encoding, bom):
+            """(BOM для записи, кодек без BOM) для целевого файла"""
+            name = codecs.lookup(encoding).name
+            
+            if name in self.BOM_FAMILIES:
+                codec = self._native(name)
+                return (b'' if bom is False else self.UNICODE_BOMS[codec]), codec
             
-            # Записываем в целевой кодировке
-            with open(target_file, 'w', encoding=to_encoding) as dst:
-                dst.write(content)
+            if bom:
+                if name not in self.UNICODE_BOMS:
+                    raise ValueError(f"Кодировка {encoding} не поддерживает BOM")
+                return self.UNICODE_BOMS[name], name
+            
+            return b'', name
+        
+        @staticmethod
+        def _split_ranges(source_file, start, end, parts):
+            """Деление [start, end) на части, не начинающиеся с байта продолжения UTF-8"""
+            bounds = [start]
+            
+            with open(source_file, 'rb') as file:
+                for i in range(1, parts):
+                    position = max(bounds[-1], start + (end - start) * i // parts)
+                    file.seek(position)
+                    # Символ UTF-8 занимает не более 4 байт
+                    head = file.read(4)
+                    shift = next(
+                        (k for k, byte in enumerate(head) if byte & 0xC0 != 0x80),
+                        len(head)
+                    )
+                    bounds.append(position + shift)
+            
+            bounds.append(end)
+            return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+        
+        def transcode(self, source_file, target_file, from_encoding, to_encoding,
+                      bom=None, workers=1):
+            """
+            Перекодировка файла
+            
+            bom: None - как принято для целевой кодировки (utf-16 с BOM,
+            utf-8 без), True - добавить BOM, False - не записывать.
+            workers > 1 включает параллельный режим для входа UTF-8.
+            Возвращает статистику с пропускной способностью.
+            """
+            start_time = time.perf_counter()
+            
+            offset, source_codec = self._source_codec(source_file, from_encoding)
+            prefix, target_codec = self._target_codec(to_encoding, bom)
+            size = os.path.getsize(source_file)
+            
+            if workers > 1 and source_codec in self.SPLITTABLE:
+                ranges = self._split_ranges(source_file, offset, size, workers)
+            else:
+                ranges = [(offset, size)]
+            
+            if len(ranges) <= 1:
+                _transcode_range((source_file, target_file, offset, size, source_codec,
+                                  target_codec, self.errors, self.buffer_size, prefix))
+            else:
+                self._transcode_parallel(source_file, target_file, ranges,
+                                         source_codec, target_codec, prefix)
+            
+            elapsed = time.perf_counter() - start_time
+            
+            return {
+                'bytes_read': size,
+                'bytes_written': os.path.getsize(target_file),
+                'parts': len(ranges),
+                'seconds': elapsed,
+                'mb_per_s': size / (1024 * 1024) / elapsed if elapsed else 0.0
+            }
+        
+        def _transcode_parallel(self, source_file, target_file, ranges,
+                                source_codec, target_codec, prefix):
+            """Перекодировка частей в пуле процессов и склейка по порядку"""
+            target_dir = os.path.dirname(os.path.abspath(target_file))
+            
+            with tempfile.TemporaryDirectory(dir=target_dir) as parts_dir:
+                tasks = [
+                    (source_file, os.path.join(parts_dir, f"part_{i:04d}"), start, end,
+                     source_codec, target_codec, self.errors, self.buffer_size,
+                     prefix if i == 0 else b'')
+                    for i, (start, end) in enumerate(ranges)
+                ]
+                
+                with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+                    list(executor.map(_transcode_range, tasks))
+                
+                with open(target_file, 'wb') as dst:
+                    for task in tasks:
+                        with open(task[1], 'rb') as part:
+                            shutil.copyfileobj(part, dst, self.buffer_size)
+    
+    transcoder = StreamingTranscoder()
+    
+    def convert_file_encoding(source_file, target_file, from_encoding, to_encoding,
+                              bom=None, workers=1):
+        """Потоковая конвертация файла из одной кодировки в другую"""
+        
+        try:
+            stats = transcoder.transcode(source_file, target_file, from_encoding,
+                                         to_encoding, bom=bom, workers=workers)
             
             print(f"   ✅ {source_file} → {target_file}: {from_encoding} → {to_encoding}")
             
             # Проверяем размеры
-            src_size = os.path.getsize(source_file)
-            dst_size = os.path.getsize(target_file)
-            print(f"      Размеры: {src_size} → {dst_size} байт")
+            print(f"      Размеры: {stats['bytes_read']} → {stats['bytes_written']} байт")
+            print(f"      Скорость: {stats['mb_per_s']:.1f} MB/с, частей: {stats['parts']}")
             
+            return stats
+        
         except (UnicodeDecodeError, UnicodeEncodeError) as e:
             print(f"   ❌ Ошибка конвертации: {e}")
     
@@ -360,12 +717,46 @@ def example_02_encoding_handling():
     
     create_file_with_bom()
     
+    print("\n   Перекодировка с управлением BOM:")
+    
+    # UTF-8 с BOM → UTF-8 без BOM (BOM снимается при чтении)
+    convert_file_encoding('utf8_with_bom.txt', 'utf8_with_bom_to_utf8.txt',
+                          'utf-8', 'utf-8')
+    # UTF-16 → UTF-8 с BOM
+    convert_file_encoding('utf16_with_bom.txt', 'utf16_with_bom_to_utf8_sig.txt',
+                          'utf-16', 'utf-8', bom=True)
+    
+    for filename in ['utf8_with_bom_to_utf8.txt', 'utf16_with_bom_to_utf8_sig.txt']:
+        with open(filename, 'rb') as file:
+            print(f"   {filename}: первые байты {file.read(4)}")
+    
+    print("\n   Потоковая перекодировка большого файла:")
+    
+    large_source = 'large_utf8_source.txt'
+    line = "Строка с кириллицей и латиницей: Привет, мир! Hello, world!\n"
+    
+    with open(large_source, 'w', encoding='utf-8') as file:
+        for _ in range(16):
+            file.write(line * 10000)
+    
+    sequential = convert_file_encoding(large_source, 'large_utf8_to_cp1251.txt',
+                                       'utf-8', 'cp1251')
+    parallel = convert_file_encoding(large_source, 'large_utf8_to_cp1251_parallel.txt',
+                                     'utf-8', 'cp1251', workers=4)
+    
+    with open('large_utf8_to_cp1251.txt', 'rb') as first, \
+         open('large_utf8_to_cp1251_parallel.txt', 'rb') as second:
+        identical = first.read() == second.read()
+    
+    print(f"   Результаты совпадают: {'✅' if identical else '❌'}, "
+          f"ускорение: {sequential['seconds'] / parallel['seconds']:.2f}x")
+    
     # Очистка
     print("\n7. Очистка созданных файлов:")
     
     all_test_files = [f[0] for f in created_files]
     all_test_files.extend([
-        'utf8_with_bom.txt', 'utf16_with_bom.txt'
+        'utf8_with_bom.txt', 'utf16_with_bom.txt', 'large_utf8_source.txt'
     ])
     
     # Добавляем конвертированные файлы
@@ -539,79 +930,283 @@ def example_03_large_file_processing():
     
     print("\n4. Фильтрация и поиск в большом файле:")
     
-    def search_in_file(filename, search_term, max_results=5):
-        """Поиск строк содержащих определенный термин"""
+    class MappedFileScanner:
+        """
+        Байтовый движок для сканирования больших файлов через mmap
         
-        print(f"   Поиск строк содержащих '{search_term}':")
+        Файл отображается в память, а поиск, подсчет строк и чтение
+        хвоста выполняются методами bytes/mmap (find, rfind, count,
+        скомпилированные байтовые regex) без декодирования каждой
+        строки в str. Декодируются только строки, которые выводятся.
         
-        found_count = 0
-        total_lines = 0
+        При workers > 1 файл делится на непересекающиеся диапазоны,
+        выровненные по границам строк, и диапазоны сканируются в пуле
+        потоков. Операции bytes/re удерживают GIL, поэтому реальный
+        параллелизм дают free-threaded сборки CPython; по умолчанию
+        сканирование однопоточное.
+        """
         
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line_num, line in enumerate(file, 1):
-                total_lines += 1
+        # Строка содержит хотя бы одну цифру
+        DIGIT_LINE = re.compile(rb'^[^\n\d]*\d', re.MULTILINE)
+        # Байты продолжения UTF-8 (10xxxxxx) не начинают новый символ
+        CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+        
+        def __init__(self, filename, workers=1, block_size=4 * 1024 * 1024):
+            self.filename = filename
+            self.workers = max(1, workers)
+            self.block_size = block_size
+        
+        @contextmanager
+        def mapped(self):
+            """Отображение файла в память только для чтения"""
+            with open(self.filename, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    # Пустой файл отобразить нельзя
+                    yield b''
+                    return
                 
-                if search_term.lower() in line.lower():
-                    found_count += 1
-                    
-                    if found_count <= max_results:
-                        print(f"     {line_num:6d}: {line.strip()[:80]}...")
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+        
+        @staticmethod
+        def _line_end(mm, position, end):
+            """Позиция сразу после строки, содержащей position"""
+            newline = mm.find(b'\n', position, end)
+            return end if newline == -1 else newline + 1
+        
+        def _count_newlines(self, mm, start, end):
+            """Подсчет переводов строк в [start, end) блоками фиксированного размера"""
+            return sum(
+                mm[position:min(position + self.block_size, end)].count(b'\n')
+                for position in range(start, end, self.block_size)
+            )
+        
+        def split_ranges(self, mm, parts):
+            """Деление файла на parts диапазонов, выровненных по строкам"""
+            size = len(mm)
+            bounds = [0]
+            
+            for i in range(1, parts):
+                position = max(bounds[-1], size * i // parts)
+                if position > 0:
+                    position = self._line_end(mm, position - 1, size)
+                bounds.append(position)
+            
+            bounds.append(size)
+            return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+        
+        def iter_blocks(self, mm, start, end):
+            """Блоки диапазона [start, end), заканчивающиеся на границе строки"""
+            position = start
+            
+            while position < end:
+                block_end = min(position + self.block_size, end)
+                if block_end < end:
+                    newline = mm.rfind(b'\n', position, block_end)
+                    if newline == -1:
+                        block_end = self._line_end(mm, block_end, end)
+                    else:
+                        block_end = newline + 1
+                
+                yield mm[position:block_end]
+                position = block_end
+        
+        def map_ranges(self, func):
+            """Применение func(mm, start, end) к диапазонам файла"""
+            with self.mapped() as mm:
+                ranges = self.split_ranges(mm, self.workers) or [(0, 0)]
+                
+                if len(ranges) == 1:
+                    return [func(mm, *ranges[0])]
+                
+                with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                    return list(executor.map(lambda bounds: func(mm, *bounds), ranges))
+        
+        def count_lines(self, mm, start, end):
+            """Количество строк в диапазоне (последняя может быть без перевода строки)"""
+            lines = self._count_newlines(mm, start, end)
+            if end > start and mm[end - 1:end] != b'\n':
+                lines += 1
+            return lines
+        
+        @staticmethod
+        def compile_pattern(term, ignore_case=True):
+            """
+            Байтовый шаблон для поиска term
+            
+            Если регистр не влияет на термин, возвращается литерал для
+            mm.find, иначе regex, где каждый символ заменен вариантами
+            в обоих регистрах (работает и для кириллицы в UTF-8).
+            """
+            parts = []
+            literal = True
+            
+            for char in term:
+                variants = {char, char.lower(), char.upper()} if ignore_case else {char}
+                encoded = sorted(re.escape(variant.encode('utf-8')) for variant in variants)
+                if len(encoded) == 1:
+                    parts.append(encoded[0])
+                else:
+                    parts.append(b'(?:' + b'|'.join(encoded) + b')')
+                    literal = False
+            
+            if literal:
+                return term.encode('utf-8')
+            return re.compile(b''.join(parts))
+        
+        def _search_range(self, mm, start, end, pattern, max_results):
+            """Поиск в диапазоне: (строк в диапазоне, найдено строк, первые совпадения)"""
+            if isinstance(pattern, bytes):
+                def find(position):
+                    return mm.find(pattern, position, end)
+            else:
+                def find(position):
+                    match = pattern.search(mm, position, end)
+                    return match.start() if match else -1
+            
+            matches = []
+            found_count = 0
+            line_number = 0
+            counted_to = start
+            position = find(start)
+            
+            while position != -1:
+                line_start = max(mm.rfind(b'\n', start, position) + 1, start)
+                line_end = self._line_end(mm, position, end)
+                found_count += 1
+                
+                if len(matches) < max_results:
+                    line_number += self._count_newlines(mm, counted_to, line_start)
+                    counted_to = line_start
+                    matches.append((line_number + 1, mm[line_start:line_end]))
+                
+                # Каждая строка учитывается один раз
+                position = find(line_end) if line_end < end else -1
+            
+            return self.count_lines(mm, start, end), found_count, matches
+        
+        def search(self, term, max_results=5, ignore_case=True):
+            """Поиск строк, содержащих term"""
+            pattern = self.compile_pattern(term, ignore_case)
+            results = self.map_ranges(
+                lambda mm, start, end: self._search_range(mm, start, end, pattern, max_results)
+            )
+            
+            total_lines = 0
+            found_count = 0
+            matches = []
+            
+            for range_lines, range_found, range_matches in results:
+                matches.extend((total_lines + number, line) for number, line in range_matches)
+                total_lines += range_lines
+                found_count += range_found
+            
+            return {
+                'total_lines': total_lines,
+                'found_count': found_count,
+                'matches': matches[:max_results]
+            }
+        
+        def _stats_range(self, mm, start, end):
+            """Статистика диапазона; длины строк считаются в байтах"""
+            stats = {
+                'total_lines': 0,
+                'total_chars': 0,
+                'total_words': 0,
+                'min_line_length': float('inf'),
+                'max_line_length': 0,
+                'empty_lines': 0,
+                'lines_with_numbers': 0
+            }
+            
+            for block in self.iter_blocks(mm, start, end):
+                lines = block.split(b'\n')
+                if block.endswith(b'\n'):
+                    lines.pop()
+                
+                lengths = list(map(len, map(bytes.strip, lines)))
+                non_empty = list(filter(None, lengths))
+                
+                stats['total_lines'] += len(lines)
+                stats['total_chars'] += len(block.translate(None, self.CONTINUATION_BYTES))
+                stats['total_words'] += len(block.split())
+                stats['empty_lines'] += len(lengths) - len(non_empty)
+                stats['lines_with_numbers'] += len(self.DIGIT_LINE.findall(block))
+                
+                if non_empty:
+                    stats['min_line_length'] = min(stats['min_line_length'], min(non_empty))
+                    stats['max_line_length'] = max(stats['max_line_length'], max(non_empty))
+            
+            return stats
+        
+        def stats(self):
+            """Статистика файла, собранная по диапазонам и объединенная"""
+            results = self.map_ranges(self._stats_range)
+            stats = results[0]
+            
+            for partial in results[1:]:
+                for key in ('total_lines', 'total_chars', 'total_words',
+                            'empty_lines', 'lines_with_numbers'):
+                    stats[key] += partial[key]
+                stats['min_line_length'] = min(stats['min_line_length'], partial['min_line_length'])
+                stats['max_line_length'] = max(stats['max_line_length'], partial['max_line_length'])
+            
+            return stats
+        
+        def tail(self, num_lines=5):
+            """Последние num_lines непустых строк через rfind по отображению"""
+            lines = []
+            
+            with self.mapped() as mm:
+                end = len(mm)
                 
-                # Показываем прогресс каждые 10000 строк
-                if line_num % 10000 == 0:
-                    print(f"\r   Обработано: {line_num:,} строк", end='', flush=True)
+                while end > 0 and len(lines) < num_lines:
+                    start = mm.rfind(b'\n', 0, end) + 1
+                    line = mm[start:end]
+                    if line:  # Пропускаем пустые строки
+                        lines.append(line.decode('utf-8', errors='replace'))
+                    end = start - 1
+            
+            lines.reverse()
+            return lines
+    
+    @measure_time
+    def search_in_file(filename, search_term, max_results=5, workers=1):
+        """Поиск строк содержащих определенный термин"""
+        
+        print(f"   Поиск строк содержащих '{search_term}' (потоков: {workers}):")
+        
+        result = MappedFileScanner(filename, workers=workers).search(search_term, max_results)
         
-        print(f"\n   Найдено {found_count} строк из {total_lines:,} (показано {min(found_count, max_results)})")
+        for line_num, line in result['matches']:
+            print(f"     {line_num:6d}: {line.decode('utf-8', errors='replace').strip()[:80]}...")
+        
+        found_count = result['found_count']
+        print(f"   Найдено {found_count} строк из {result['total_lines']:,} "
+              f"(показано {min(found_count, max_results)})")
     
     # Ищем строки с определенными номерами
     search_in_file(large_file, "001000")  # Строки с номерами вида 001000
+    # Регистронезависимый поиск по кириллице, диапазоны в нескольких потоках
+    search_in_file(large_file, "строка номер 00200", workers=4)
     
     print("\n5. Статистика файла:")
     
-    def analyze_file_stats(filename):
+    @measure_time
+    def analyze_file_stats(filename, workers=1):
         """Сбор статистики по файлу"""
         
-        stats = {
-            'total_lines': 0,
-            'total_chars': 0,
-            'total_words': 0,
-            'min_line_length': float('inf'),
-            'max_line_length': 0,
-            'empty_lines': 0,
-            'lines_with_numbers': 0
-        }
-        
         print("   Сбор статистики...")
         
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line_num, line in enumerate(file, 1):
-                line_length = len(line.strip())
-                word_count = len(line.split())
-                
-                stats['total_lines'] += 1
-                stats['total_chars'] += len(line)
-                stats['total_words'] += word_count
-                
-                if line_length == 0:
-                    stats['empty_lines'] += 1
-                else:
-                    stats['min_line_length'] = min(stats['min_line_length'], line_length)
-                    stats['max_line_length'] = max(stats['max_line_length'], line_length)
-                
-                if any(char.isdigit() for char in line):
-                    stats['lines_with_numbers'] += 1
-                
-                # Прогресс
-                if line_num % 5000 == 0:
-                    print(f"\r   Обработано: {line_num:,} строк", end='', flush=True)
+        stats = MappedFileScanner(filename, workers=workers).stats()
         
-        print(f"\n   Статистика файла:")
+        print(f"   Статистика файла:")
         print(f"     Всего строк: {stats['total_lines']:,}")
         print(f"     Всего символов: {stats['total_chars']:,}")
         print(f"     Всего слов: {stats['total_words']:,}")
-        print(f"     Средняя длина строки: {stats['total_chars']/stats['total_lines']:.1f}")
-        print(f"     Мин. длина строки: {stats['min_line_length']}")
-        print(f"     Макс. длина строки: {stats['max_line_length']}")
+        print(f"     Средняя длина строки: {stats['total_chars']/max(stats['total_lines'], 1):.1f}")
+        print(f"     Мин. длина строки (байт): {stats['min_line_length']}")
+        print(f"     Макс. длина строки (байт): {stats['max_line_length']}")
         print(f"     Пустых строк: {stats['empty_lines']}")
         print(f"     Строк с числами: {stats['lines_with_numbers']}")
     
@@ -624,39 +1219,11 @@ def example_03_large_file_processing():
         
         print(f"   Последние {num_lines} строк файла:")
         
-        with open(filename, 'rb') as file:
-            # Переходим в конец файла
-            file.seek(0, 2)
-            file_size = file.tell()
-            
-            lines = []
-            buffer = b''
-            position = file_size
-            
-            # Читаем файл блоками с конца
-            while position > 0 and len(lines) < num_lines:
-                # Определяем размер блока для чтения
-                read_size = min(4096, position)
-                position -= read_size
-                
-                file.seek(position)
-                chunk = file.read(read_size)
-                buffer = chunk + buffer
-                
-                # Извлекаем строки из буфера
-                while b'\n' in buffer and len(lines) < num_lines:
-                    line, buffer = buffer.rsplit(b'\n', 1)
-                    if line:  # Пропускаем пустые строки
-                        try:
-                            decoded_line = line.decode('utf-8')
-                            lines.append(decoded_line)
-                        except UnicodeDecodeError:
-                            pass
-            
-            # Показываем строки в правильном порядке
-            for i, line in enumerate(reversed(lines), 1):
-                line_from_end = i
-                print(f"     -{line_from_end:2d}: {line[:80]}...")
+        lines = MappedFileScanner(filename).tail(num_lines)
+        
+        # Показываем строки в правильном порядке
+        for i, line in enumerate(lines, 1):
+            print(f"     -{i:2d}: {line[:80]}...")
     
     read_file_reverse(large_file)
     
@@ -828,51 +1395,69 @@ def example_04_structured_data_formats():
         """Операции с XML файлами"""
         
         import xml.etree.ElementTree as ET
+        from xml.sax.saxutils import XMLGenerator
         
         xml_file = 'users.xml'
         
-        # Создание XML структуры
-        root = ET.Element('database')
-        
-        # Метаданные
-        metadata_elem = ET.SubElement(root, 'metadata')
-        for key, value in sample_data['metadata'].items():
-            meta_elem = ET.SubElement(metadata_elem, key)
-            meta_elem.text = str(value)
-        
-        # Пользователи
-        users_elem = ET.SubElement(root, 'users')
-        
-        for user in sample_data['users']:
-            user_elem = ET.SubElement(users_elem, 'user', {'id': str(user['id'])})
+        def text_element(xml, tag, value, attributes=None):
+            """Элемент с текстом как последовательность событий"""
+            xml.startElement(tag, attributes or {})
+            xml.characters(str(value))
+            xml.endElement(tag)
+        
+        # Запись XML потоком событий: дерево документа в памяти не строится,
+        # поэтому так можно выгружать сколько угодно записей
+        with open(xml_file, 'wb') as f:
+            xml = XMLGenerator(f, encoding='utf-8', short_empty_elements=True)
+            xml.startDocument()
+            xml.startElement('database', {})
             
-            for key, value in user.items():
-                if key == 'id':
-                    continue
+            # Метаданные
+            xml.startElement('metadata', {})
+            for key, value in sample_data['metadata'].items():
+                text_element(xml, key, value)
+            xml.endElement('metadata')
+            
+            # Пользователи
+            xml.startElement('users', {})
+            
+            for user in sample_data['users']:
+                xml.startElement('user', {'id': str(user['id'])})
                 
-                elem = ET.SubElement(user_elem, key)
+                for key, value in user.items():
+                    if key == 'id':
+                        continue
+                    
+                    if key == 'skills':
+                        xml.startElement(key, {})
+                        for skill in value:
+                            text_element(xml, 'skill', skill)
+                        xml.endElement(key)
+                    else:
+                        text_element(xml, key, value)
                 
-                if key == 'skills':
-                    for skill in value:
-                        skill_elem = ET.SubElement(elem, 'skill')
-                        skill_elem.text = skill
-                else:
-                    elem.text = str(value)
-        
-        # Запись XML
-        tree = ET.ElementTree(root)
-        tree.write(xml_file, encoding='utf-8', xml_declaration=True)
+                xml.endElement('user')
+            
+            xml.endElement('users')
+            xml.endElement('database')
+            xml.endDocument()
         
         print(f"   ✅ XML данные сохранены в {xml_file}")
         
-        # Чтение XML
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        
-        # Извлечение пользователей
+        # Потоковое чтение XML: элементы user обрабатываются по мере разбора
         users_from_xml = []
+        users_elem = None
         
-        for user_elem in root.find('users').findall('user'):
+        for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == 'users':
+                    users_elem = elem
+                continue
+            
+            if elem.tag != 'user':
+                continue
+            
+            user_elem = elem
             user = {
                 'id': int(user_elem.get('id')),
                 'name': user_elem.find('name').text,
@@ -884,6 +1469,11 @@ def example_04_structured_data_formats():
                 'skills': [skill.text for skill in user_elem.find('skills').findall('skill')]
             }
             users_from_xml.append(user)
+            
+            # Обработанный элемент больше не нужен - освобождаем память
+            user_elem.clear()
+            if users_elem is not None:
+                users_elem.remove(user_elem)
         
         print(f"   ✅ Загружено {len(users_from_xml)} пользователей из XML")
         
@@ -1181,7 +1771,7 @@ def example_05_secure_file_operations():
     print("2. Атомарные операции с файлами:")
     
     @contextmanager
-    def atomic_write(filepath, mode='w', encoding='utf-8', **kwargs):
+    def atomic_write(filepath, mode='w', encoding='utf-8', verbose=True, **kwargs):
         """Контекстный менеджер для атомарной записи"""
         
         # Создаем временный файл в той же директории
@@ -1198,8 +1788,9 @@ def example_05_secure_file_operations():
             temp_filepath = temp_file.name
             
             try:
-                print(f"   📝 Атомарная запись в {filepath}")
-                print(f"     Временный файл: {temp_filepath}")
+                if verbose:
+                    print(f"   📝 Атомарная запись в {filepath}")
+                    print(f"     Временный файл: {temp_filepath}")
                 
                 yield temp_file
                 
@@ -1220,7 +1811,8 @@ def example_05_secure_file_operations():
                     os.unlink(filepath)
             
             shutil.move(temp_filepath, filepath)
-            print(f"     ✅ Файл атомарно записан")
+            if verbose:
+                print(f"     ✅ Файл атомарно записан")
             
         except Exception as e:
             if os.path.exists(temp_filepath):
@@ -1251,6 +1843,274 @@ def example_05_secure_file_operations():
     
     test_atomic_write()
     
+    class JournaledFileWriter:
+        """
+        Журналируемая запись часто обновляемого JSON-файла состояния
+        
+        Каждое изменение - одна строка в журнале (filepath + '.wal'):
+        контрольная сумма CRC32 и JSON-запись операции. Журнал
+        синхронизируется на диск группами (group commit): один fsync
+        фоновой потока покрывает все записи, добавленные с прошлого
+        fsync. Журнал открыт в двоичном режиме, поэтому перевод строки
+        не превращается в CRLF и на Windows. Каждые compact_every записей
+        состояние сохраняется в сам файл (временный файл + os.replace),
+        после чего журнал обнуляется.
+        При открытии снимок загружается и журнал проигрывается;
+        оборванная последняя строка отбрасывается.
+        
+        durability задает компромисс между надежностью и задержкой:
+        'sync'  - запись возвращается после fsync своей группы;
+        'batch' - запись возвращается сразу, потеря не более
+                  commit_interval секунд изменений;
+        'none'  - fsync только при сжатии журнала и закрытии.
+        """
+        
+        DURABILITY_MODES = ('sync', 'batch', 'none')
+        
+        def __init__(self, filepath, durability='batch', commit_interval=0.005,
+                     compact_every=1000):
+            if durability not in self.DURABILITY_MODES:
+                raise ValueError(f"durability должен быть одним из {self.DURABILITY_MODES}")
+            
+            self.filepath = filepath
+            self.journal_path = filepath + '.wal'
+            self.durability = durability
+            self.commit_interval = commit_interval
+            self.compact_every = compact_every
+            
+            self.state = {}
+            self.seq = 0
+            self.synced_seq = 0
+            self.since_compaction = 0
+            self.fsync_count = 0
+            
+            self.condition = threading.Condition()
+            self.closed = False
+            
+            self._recover()
+            self.journal = open(self.journal_path, 'ab')
+            
+            self.flusher = None
+            if durability != 'none':
+                self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self.flusher.start()
+        
+        def _recover(self):
+            """Загрузка снимка и проигрывание журнала"""
+            if os.path.exists(self.filepath):
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            
+            if not os.path.exists(self.journal_path):
+                return
+            
+            valid_size = 0
+            with open(self.journal_path, 'rb') as f:
+                for raw_line in f:
+                    record = self._decode_record(raw_line)
+                    if record is None:
+                        break  # Оборванная или поврежденная запись - конец журнала
+                    self._apply(record)
+                    valid_size += len(raw_line)
+            
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_size)
+        
+        @staticmethod
+        def _encode_record(record):
+            payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+            return b'%08x %s\n' % (zlib.crc32(payload), payload)
+        
+        @staticmethod
+        def _decode_record(raw_line):
+            if not raw_line.endswith(b'\n'):
+                return None
+            
+            line = raw_line[:-1]
+            if line.endswith(b'\r'):
+                # Журнал, записанный в текстовом режиме на Windows
+                line = line[:-1]
+            
+            checksum, _, payload = line.partition(b' ')
+            try:
+                if int(checksum, 16) != zlib.crc32(payload):
+                    return None
+                return json.loads(payload)
+            except ValueError:
+                return None
+        
+        def _apply(self, record):
+            if record['op'] == 'set':
+                self.state[record['key']] = record['value']
+            elif record['op'] == 'delete':
+                self.state.pop(record['key'], None)
+        
+        def _append(self, record):
+            """Добавление записи в журнал с ожиданием согласно durability"""
+            with self.condition:
+                if self.closed:
+                    raise ValueError("Журнал закрыт")
+                
+                self.journal.write(self._encode_record(record))
+                self._apply(record)
+                self.seq += 1
+                self.since_compaction += 1
+                seq = self.seq
+                
+                if self.durability == 'sync':
+                    self.condition.notify_all()
+                    while self.synced_seq < seq:
+                        self.condition.wait()
+                elif self.durability == 'none' and self.since_compaction >= self.compact_every:
+                    self._compact()
+        
+        def set(self, key, value):
+            self._append({'op': 'set', 'key': key, 'value': value})
+        
+        def delete(self, key):
+            self._append({'op': 'delete', 'key': key})
+        
+        def get(self, key, default=None):
+            with self.condition:
+                return self.state.get(key, default)
+        
+        def _flush_loop(self):
+            """Фоновый поток group commit"""
+            with self.condition:
+                while not self.closed:
+                    if self.durability == 'batch' or self.synced_seq == self.seq:
+                        self.condition.wait(self.commit_interval)
+                    
+                    if self.synced_seq == self.seq:
+                        continue
+                    
+                    # fsync без блокировки: новые записи копятся в следующую группу
+                    self.journal.flush()
+                    target_seq = self.seq
+                    self.condition.release()
+                    try:
+                        os.fsync(self.journal.fileno())
+                    finally:
+                        self.condition.acquire()
+                    
+                    self.fsync_count += 1
+                    self.synced_seq = max(self.synced_seq, target_seq)
+                    
+                    if self.since_compaction >= self.compact_every:
+                        self._compact()
+                    
+                    self.condition.notify_all()
+        
+        def _compact(self):
+            """Снимок состояния через атомарное переименование и очистка журнала"""
+            # Журнал синхронизируется до снимка: сбой между шагами не теряет данных,
+            # а повторное проигрывание set/delete поверх снимка идемпотентно
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            
+            # os.replace, а не atomic_write: тот на Windows удаляет файл перед
+            # переименованием, и сбой в этот момент потерял бы снимок
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.filepath)),
+                                             suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.state, f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.filepath)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            
+            self.journal.seek(0)
+            self.journal.truncate()
+            os.fsync(self.journal.fileno())
+            
+            self.fsync_count += 3
+            self.synced_seq = self.seq
+            self.since_compaction = 0
+            self.condition.notify_all()
+        
+        def flush(self):
+            """Принудительная синхронизация журнала"""
+            with self.condition:
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.fsync_count += 1
+                self.synced_seq = self.seq
+                self.condition.notify_all()
+        
+        def close(self):
+            """Сжатие журнала в снимок и остановка фонового потока"""
+            with self.condition:
+                if self.closed:
+                    return
+                self.closed = True
+                self.condition.notify_all()
+            
+            if self.flusher:
+                self.flusher.join()
+            
+            with self.condition:
+                self._compact()
+                self.journal.close()
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self.close()
+            return False
+    
+    def benchmark_state_writes(updates=300, threads=4):
+        """Сравнение atomic_write на каждое изменение и журналируемой записи"""
+        
+        state_file = "state_benchmark.json"
+        results = []
+        
+        start_time = time.perf_counter()
+        state = {}
+        for i in range(updates):
+            state[f"key_{i % 10}"] = i
+            with atomic_write(state_file, verbose=False) as f:
+                json.dump(state, f)
+        results.append(("atomic_write на каждое изменение", time.perf_counter() - start_time, updates))
+        
+        for durability in JournaledFileWriter.DURABILITY_MODES:
+            os.remove(state_file)
+            
+            with JournaledFileWriter(state_file, durability=durability, compact_every=100) as writer:
+                def worker(offset):
+                    for i in range(offset, updates, threads):
+                        writer.set(f"key_{i % 10}", i)
+                
+                start_time = time.perf_counter()
+                pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+                for thread in pool:
+                    thread.start()
+                for thread in pool:
+                    thread.join()
+                elapsed = time.perf_counter() - start_time
+            
+            # fsync с учетом финального сжатия при закрытии
+            results.append((f"журнал, durability='{durability}'", elapsed, writer.fsync_count))
+        
+        # Восстановление: снимок после close совпадает с последним состоянием
+        with JournaledFileWriter(state_file, durability='none') as writer:
+            recovered = len(writer.state)
+        
+        for path in (state_file, state_file + '.wal'):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        print(f"   ⏱️ {updates} изменений состояния ({threads} потока для журнала):")
+        for name, elapsed, fsyncs in results:
+            print(f"     {name:<34} {updates / elapsed:>10,.0f} изм/с, fsync: {fsyncs}")
+        print(f"     Ключей после восстановления: {recovered}")
+    
+    benchmark_state_writes()
+    
     print("\n3. Безопасная работа с временными файлами:")
     
     def secure_temp_operations():
@@ -1351,73 +2211,328 @@ def example_05_secure_file_operations():
     print("\n5. Мониторинг файловых операций:")
     
     class FileOperationMonitor:
-        """Монитор файловых операций"""
+        """
+        Монитор файловых операций
+        
+        Статистика хранится в фиксированном объеме памяти: для каждой
+        пары (префикс пути, тип операции) - счетчики вызовов, ошибок,
+        байтов, суммарное время и гистограмма задержек с логарифмическими
+        корзинами (корзина k - до 2**k микросекунд). Число префиксов
+        ограничено max_prefixes, остальные пути попадают в '<other>'.
+        
+        Кроме явного monitor_operation, монитор может перехватывать
+        open, read/write файловых объектов и os.fsync - через контекстный
+        менеджер instrument() или глобально через install()/uninstall().
+        """
+        
+        HISTOGRAM_BUCKETS = 32
+        OTHER_PREFIX = '<other>'
+        
+        def __init__(self, prefixes=None, prefix_depth=2, max_prefixes=64, verbose=True):
+            # Явные префиксы: абсолютный путь -> метка, длинные проверяются первыми
+            self.prefixes = sorted(
+                ((os.path.abspath(prefix), prefix) for prefix in (prefixes or [])),
+                key=lambda item: len(item[0]),
+                reverse=True
+            )
+            self.prefix_depth = prefix_depth
+            self.max_prefixes = max_prefixes
+            self.verbose = verbose
+            
+            self.series = {}
+            self.known_prefixes = set()
+            self.operation_count = 0
+            self.fd_prefixes = {}
+            self.exported_totals = {}  # значения счетчиков на момент прошлого экспорта
+            self.lock = threading.Lock()
+            self.originals = None
+        
+        def _prefix(self, path):
+            """Префикс пути, по которому агрегируется статистика"""
+            try:
+                path = os.path.abspath(os.fspath(path))
+            except TypeError:
+                # open() по файловому дескриптору
+                return self.fd_prefixes.get(path, self.OTHER_PREFIX)
+            
+            for absolute, label in self.prefixes:
+                if path == absolute or path.startswith(absolute + os.sep):
+                    return label
+            
+            parts = Path(path).parent.parts[:self.prefix_depth + 1]
+            return str(Path(*parts))
         
-        def __init__(self):
-            self.operations = []
+        def record(self, operation_type, prefix, duration, nbytes=0, success=True):
+            """Учет одной операции в агрегатах (префикс, операция)"""
+            bucket = min(int(duration * 1_000_000).bit_length(), self.HISTOGRAM_BUCKETS - 1)
+            
+            with self.lock:
+                if prefix not in self.known_prefixes:
+                    if len(self.known_prefixes) >= self.max_prefixes:
+                        prefix = self.OTHER_PREFIX
+                    self.known_prefixes.add(prefix)
+                
+                series = self.series.get((prefix, operation_type))
+                if series is None:
+                    series = self.series[(prefix, operation_type)] = {
+                        'count': 0,
+                        'errors': 0,
+                        'bytes': 0,
+                        'duration': 0.0,
+                        'max_duration': 0.0,
+                        'histogram': [0] * self.HISTOGRAM_BUCKETS
+                    }
+                
+                series['count'] += 1
+                series['errors'] += not success
+                series['bytes'] += nbytes
+                series['duration'] += duration
+                series['max_duration'] = max(series['max_duration'], duration)
+                series['histogram'][bucket] += 1
         
         @contextmanager
         def monitor_operation(self, operation_type, filepath):
             """Мониторинг файловой операции"""
             
             start_time = time.perf_counter()
-            operation_id = len(self.operations) + 1
+            self.operation_count += 1
+            operation_id = self.operation_count
             
-            print(f"   🔍 [{operation_id}] Начало: {operation_type} {filepath}")
+            if self.verbose:
+                print(f"   🔍 [{operation_id}] Начало: {operation_type} {filepath}")
             
             try:
                 yield
-                
-                end_time = time.perf_counter()
-                duration = end_time - start_time
-                
-                self.operations.append({
-                    'id': operation_id,
-                    'type': operation_type,
-                    'filepath': filepath,
-                    'duration': duration,
-                    'success': True,
-                    'timestamp': time.time()
-                })
-                
-                print(f"   ✅ [{operation_id}] Успех: {duration:.3f}s")
-                
+            
             except Exception as e:
-                end_time = time.perf_counter()
-                duration = end_time - start_time
-                
-                self.operations.append({
-                    'id': operation_id,
-                    'type': operation_type,
-                    'filepath': filepath,
-                    'duration': duration,
-                    'success': False,
-                    'error': str(e),
-                    'timestamp': time.time()
-                })
+                duration = time.perf_counter() - start_time
+                self.record(operation_type, self._prefix(filepath), duration, success=False)
                 
-                print(f"   ❌ [{operation_id}] Ошибка: {e} ({duration:.3f}s)")
+                if self.verbose:
+                    print(f"   ❌ [{operation_id}] Ошибка: {e} ({duration:.3f}s)")
                 raise
+            
+            duration = time.perf_counter() - start_time
+            self.record(operation_type, self._prefix(filepath), duration)
+            
+            if self.verbose:
+                print(f"   ✅ [{operation_id}] Успех: {duration:.3f}s")
+        
+        def _timed(self, operation_type, prefix, func, *args, **kwargs):
+            """Вызов func с учетом времени и объема операции"""
+            start_time = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self.record(operation_type, prefix, time.perf_counter() - start_time, success=False)
+                raise
+            
+            nbytes = self._result_size(operation_type, args, result)
+            self.record(operation_type, prefix, time.perf_counter() - start_time, nbytes)
+            return result
+        
+        @staticmethod
+        def _result_size(operation_type, args, result):
+            """Объем read/write: байты, для текстовых файлов - символы"""
+            if operation_type == 'read':
+                return result if isinstance(result, int) else len(result)
+            if operation_type == 'write':
+                return len(args[0]) if result is None else result
+            return 0
+        
+        def _open(self, file, *args, **kwargs):
+            """Замена open: учет открытия и обертка файлового объекта"""
+            prefix = self._prefix(file)
+            handle = self._timed('open', prefix, self.originals['open'], file, *args, **kwargs)
+            
+            try:
+                self.fd_prefixes[handle.fileno()] = prefix
+            except (AttributeError, OSError, ValueError):
+                pass
+            
+            return InstrumentedFile(handle, self, prefix)
+        
+        def _fsync(self, fd):
+            """Замена os.fsync: префикс определяется по дескриптору"""
+            fileno = fd if isinstance(fd, int) else fd.fileno()
+            prefix = self.fd_prefixes.get(fileno, self.OTHER_PREFIX)
+            return self._timed('fsync', prefix, self.originals['fsync'], fd)
+        
+        def install(self):
+            """Глобальная подмена open и os.fsync"""
+            if self.originals is not None:
+                return
+            
+            self.originals = {'open': builtins.open, 'fsync': os.fsync}
+            builtins.open = io.open = self._open
+            os.fsync = self._fsync
+        
+        def uninstall(self):
+            """Восстановление оригинальных open и os.fsync"""
+            if self.originals is None:
+                return
+            
+            builtins.open = io.open = self.originals['open']
+            os.fsync = self.originals['fsync']
+            self.originals = None
+        
+        @contextmanager
+        def instrument(self):
+            """Перехват файлового ввода-вывода внутри блока with"""
+            self.install()
+            try:
+                yield self
+            finally:
+                self.uninstall()
+        
+        def _percentile(self, histogram, p):
+            """Верхняя граница корзины, содержащей p-й процентиль (в секундах)"""
+            target = p * sum(histogram)
+            seen = 0
+            for bucket, count in enumerate(histogram):
+                seen += count
+                if count and seen >= target:
+                    return (2 ** bucket) / 1_000_000
+            return 0.0
         
         def get_stats(self):
             """Получить статистику операций"""
-            if not self.operations:
-                return {}
+            with self.lock:
+                series = [dict(item, histogram=list(item['histogram']))
+                          for item in self.series.values()]
             
-            successful = [op for op in self.operations if op['success']]
-            failed = [op for op in self.operations if not op['success']]
+            if not series:
+                return {}
             
-            total_duration = sum(op['duration'] for op in self.operations)
-            avg_duration = total_duration / len(self.operations)
+            total = sum(item['count'] for item in series)
+            failed = sum(item['errors'] for item in series)
+            total_duration = sum(item['duration'] for item in series)
             
             return {
-                'total_operations': len(self.operations),
-                'successful': len(successful),
-                'failed': len(failed),
-                'success_rate': len(successful) / len(self.operations) * 100,
+                'total_operations': total,
+                'successful': total - failed,
+                'failed': failed,
+                'success_rate': (total - failed) / total * 100,
                 'total_duration': total_duration,
-                'average_duration': avg_duration
+                'average_duration': total_duration / total,
+                'total_bytes': sum(item['bytes'] for item in series)
             }
+        
+        def top_prefixes(self, limit=5):
+            """Префиксы путей, отсортированные по суммарному времени ввода-вывода"""
+            totals = defaultdict(lambda: {'duration': 0.0, 'bytes': 0, 'calls': 0})
+            
+            with self.lock:
+                for (prefix, _), item in self.series.items():
+                    totals[prefix]['duration'] += item['duration']
+                    totals[prefix]['bytes'] += item['bytes']
+                    totals[prefix]['calls'] += item['count']
+            
+            ranked = sorted(totals.items(), key=lambda entry: entry[1]['duration'], reverse=True)
+            return ranked[:limit]
+        
+        def export_metrics(self, collector=None):
+            """
+            Экспорт в формат метрик: {(имя, префикс): значение}
+            
+            collector - сборщик с интерфейсом increment_counter/set_gauge
+            (как MetricsCollector из главы о мониторинге). Возвращаются
+            накопленные итоги, а в счетчики сборщика передается только
+            прирост с прошлого экспорта - повторный экспорт не удваивает их.
+            """
+            metrics = {}
+            
+            with self.lock:
+                for (prefix, operation_type), item in self.series.items():
+                    base = f"file_io.{operation_type.lower()}"
+                    metrics[(f"{base}.calls", prefix)] = item['count']
+                    metrics[(f"{base}.errors", prefix)] = item['errors']
+                    metrics[(f"{base}.bytes", prefix)] = item['bytes']
+                    metrics[(f"{base}.seconds", prefix)] = item['duration']
+                    metrics[(f"{base}.p99_seconds", prefix)] = self._percentile(item['histogram'], 0.99)
+                
+                if collector is not None:
+                    deltas = {}
+                    for key, value in metrics.items():
+                        if key[0].endswith(('.calls', '.errors', '.bytes')):
+                            deltas[key] = value - self.exported_totals.get(key, 0)
+                            self.exported_totals[key] = value
+            
+            if collector is not None:
+                for (name, prefix), value in metrics.items():
+                    tags = {'prefix': prefix}
+                    if (name, prefix) in deltas:
+                        if deltas[(name, prefix)]:
+                            collector.increment_counter(name, deltas[(name, prefix)], tags)
+                    else:
+                        collector.set_gauge(name, value, tags)
+            
+            return metrics
+        
+        def log_summary(self, logger=None, level=logging.INFO):
+            """Запись сводки по префиксам в logging"""
+            logger = logger or logging.getLogger(__name__)
+            
+            with self.lock:
+                items = sorted(self.series.items(), key=lambda entry: entry[1]['duration'], reverse=True)
+            
+            for (prefix, operation_type), item in items:
+                logger.log(
+                    level,
+                    "file_io prefix=%s op=%s calls=%d errors=%d bytes=%d seconds=%.6f p50=%.6f p99=%.6f",
+                    prefix, operation_type, item['count'], item['errors'], item['bytes'],
+                    item['duration'], self._percentile(item['histogram'], 0.5),
+                    self._percentile(item['histogram'], 0.99)
+                )
+    
+    class InstrumentedFile:
+        """Обертка файлового объекта, учитывающая read/write и их объем"""
+        
+        def __init__(self, handle, monitor, prefix):
+            self._handle = handle
+            self._monitor = monitor
+            self._prefix = prefix
+        
+        def read(self, *args):
+            return self._monitor._timed('read', self._prefix, self._handle.read, *args)
+        
+        def readline(self, *args):
+            return self._monitor._timed('read', self._prefix, self._handle.readline, *args)
+        
+        def readinto(self, buffer):
+            return self._monitor._timed('read', self._prefix, self._handle.readinto, buffer)
+        
+        def write(self, data):
+            return self._monitor._timed('write', self._prefix, self._handle.write, data)
+        
+        def __iter__(self):
+            return self
+        
+        def __next__(self):
+            line = self.readline()
+            if not line:
+                raise StopIteration
+            return line
+        
+        def close(self):
+            self._monitor.fd_prefixes.pop(self._fileno(), None)
+            return self._handle.close()
+        
+        def _fileno(self):
+            try:
+                return self._handle.fileno()
+            except (AttributeError, OSError, ValueError):
+                return None
+        
+        def __enter__(self):
+            return self
+        
+        def __exit__(self, *exc_info):
+            self.close()
+        
+        def __getattr__(self, name):
+            # Остальные методы (seek, flush, fileno...) - без учета
+            return getattr(self._handle, name)
     
     # Тестируем мониторинг
     monitor = FileOperationMonitor()
@@ -1449,6 +2564,53 @@ def example_05_secure_file_operations():
     print(f"     Общее время: {stats['total_duration']:.3f}s")
     print(f"     Среднее время: {stats['average_duration']:.3f}s")
     
+    print("\n   Инструментирование файлового ввода-вывода:")
+    
+    logs_dir = os.path.join('io_demo', 'logs')
+    data_dir = os.path.join('io_demo', 'data')
+    os.makedirs(logs_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    
+    io_monitor = FileOperationMonitor(prefixes=[logs_dir, data_dir], verbose=False)
+    
+    with io_monitor.instrument():
+        # Журнал: частые мелкие записи с fsync
+        for i in range(200):
+            with open(os.path.join(logs_dir, f'app_{i % 4}.log'), 'a', encoding='utf-8') as f:
+                f.write(f"Запись журнала {i}\n")
+                f.flush()
+                os.fsync(f.fileno())
+        
+        # Данные: редкие крупные записи и чтение блоками
+        payload = os.urandom(256 * 1024)
+        for i in range(4):
+            path = os.path.join(data_dir, f'blob_{i}.bin')
+            with open(path, 'wb') as f:
+                f.write(payload)
+            with open(path, 'rb') as f:
+                while f.read(64 * 1024):
+                    pass
+    
+    print("   Префиксы с наибольшим временем ввода-вывода:")
+    for prefix, totals in io_monitor.top_prefixes():
+        print(f"     {prefix}: {totals['duration'] * 1000:.1f} ms, "
+              f"{totals['calls']} вызовов, {totals['bytes']:,} байт")
+    
+    metrics = io_monitor.export_metrics()
+    print(f"   Экспортировано метрик: {len(metrics)}")
+    
+    # Сводка в logging
+    io_logger = logging.getLogger('file_io')
+    io_handler = logging.StreamHandler(sys.stdout)
+    io_handler.setFormatter(logging.Formatter('     %(message)s'))
+    io_logger.addHandler(io_handler)
+    io_logger.setLevel(logging.INFO)
+    
+    try:
+        io_monitor.log_summary(io_logger)
+    finally:
+        io_logger.removeHandler(io_handler)
+    
     # Очистка
     print("\n6. Очистка:")
     test_files = ["monitored_file.txt"]
@@ -1457,6 +2619,8 @@ def example_05_secure_file_operations():
         if os.path.exists(filepath):
             os.remove(filepath)
             print(f"   🗑️ Удален {filepath}")
+    
+    shutil.rmtree('io_demo', ignore_errors=True)
 
 
 def main():
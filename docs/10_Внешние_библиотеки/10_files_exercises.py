@@ -12,6 +12,8 @@
 """
 
 import os
+import re
+import fnmatch
 import json
 import csv
 import time
@@ -21,6 +23,7 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Generator
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 
 def exercise_01_log_analyzer():
@@ -388,6 +391,17 @@ def exercise_01_log_analyzer():
     print("✅ Все тестовые файлы удалены")
 
 
+# Конвертер для дочерних процессов batch_convert. Классы упражнения
+# объявлены внутри функции и не сериализуются pickle, поэтому воркер
+# на уровне модуля берет конвертер, унаследованный процессом через fork.
+_batch_converter = None
+
+
+def _batch_convert_worker(task):
+    """Конвертация одного файла в дочернем процессе"""
+    return _batch_converter._convert_task(task)
+
+
 def exercise_02_data_converter():
     """
     Упражнение 2: Универсальный конвертер данных
@@ -407,6 +421,7 @@ def exercise_02_data_converter():
     # РЕШЕНИЕ:
     
     import xml.etree.ElementTree as ET
+    from xml.sax.saxutils import XMLGenerator
     from abc import ABC, abstractmethod
     
     class DataFormat(ABC):
@@ -427,6 +442,18 @@ def exercise_02_data_converter():
             """Запись данных в файл"""
             pass
         
+        def read_records(self, filename):
+            """Потоковое чтение записей (по умолчанию - через read)"""
+            data = self.read(filename)
+            if isinstance(data, list):
+                yield from data
+            elif data is not None:
+                yield data
+        
+        def write_records(self, records, filename):
+            """Потоковая запись записей (по умолчанию - через write)"""
+            self.write(list(records), filename)
+        
         @property
         @abstractmethod
         def extension(self):
@@ -436,6 +463,8 @@ def exercise_02_data_converter():
     class JSONFormat(DataFormat):
         """Формат JSON"""
         
+        chunk_size = 64 * 1024
+        
         def can_read(self, filename):
             return filename.lower().endswith('.json')
         
@@ -447,10 +476,99 @@ def exercise_02_data_converter():
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
         
+        def read_records(self, filename):
+            """Инкрементальный разбор массива JSON по одному элементу"""
+            decoder = json.JSONDecoder()
+            
+            with open(filename, 'r', encoding='utf-8') as f:
+                buffer = f.read(self.chunk_size)
+                pos = len(buffer) - len(buffer.lstrip())
+                
+                if not buffer[pos:pos + 1] == '[':
+                    # Не массив - документ придется разобрать целиком
+                    data = json.loads(buffer + f.read())
+                    if data is not None:
+                        yield data
+                    return
+                
+                pos += 1
+                eof = False
+                
+                while True:
+                    # Пропускаем пробелы и разделители между элементами
+                    while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                        pos += 1
+                    
+                    if pos < len(buffer) and buffer[pos] == ']':
+                        return
+                    
+                    try:
+                        record, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        record = None
+                    else:
+                        # За значением должен идти разделитель: иначе число
+                        # на границе буфера могло быть прочитано не полностью
+                        if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]'):
+                            yield record
+                            pos = end
+                            continue
+                    
+                    # Элемент не поместился в буфер - дочитываем следующий блок
+                    chunk = f.read(self.chunk_size)
+                    eof = not chunk
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    
+                    if eof and not buffer.strip():
+                        raise ValueError(f"Незавершенный массив JSON: {filename}")
+        
+        def write_records(self, records, filename):
+            """Запись массива JSON по одному элементу"""
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write('[')
+                separator = '\n'
+                
+                for record in records:
+                    text = json.dumps(record, indent=2, ensure_ascii=False)
+                    f.write(separator + '  ' + text.replace('\n', '\n  '))
+                    separator = ',\n'
+                
+                f.write('\n]' if separator != '\n' else ']')
+        
         @property
         def extension(self):
             return '.json'
     
+    class NDJSONFormat(DataFormat):
+        """Формат NDJSON (JSON Lines): одна запись на строку"""
+        
+        def can_read(self, filename):
+            return filename.lower().endswith(('.ndjson', '.jsonl'))
+        
+        def read(self, filename):
+            return list(self.read_records(filename))
+        
+        def write(self, data, filename):
+            self.write_records(data if isinstance(data, list) else [data], filename)
+        
+        def read_records(self, filename):
+            with open(filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        
+        def write_records(self, records, filename):
+            with open(filename, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        
+        @property
+        def extension(self):
+            return '.ndjson'
+    
     class CSVFormat(DataFormat):
         """Формат CSV"""
         
@@ -465,6 +583,29 @@ def exercise_02_data_converter():
                     data.append(dict(row))
             return data
         
+        def read_records(self, filename):
+            with open(filename, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    yield dict(row)
+        
+        def write_records(self, records, filename):
+            """Запись по одной строке; заголовок берется из первой записи"""
+            records = iter(records)
+            first = next(records, None)
+            if first is None:
+                return
+            
+            with open(filename, 'w', newline='', encoding='utf-8') as f:
+                if isinstance(first, dict):
+                    writer = csv.DictWriter(f, fieldnames=first.keys())
+                    writer.writeheader()
+                else:
+                    writer = csv.writer(f)
+                
+                writer.writerow(first)
+                for record in records:
+                    writer.writerow(record)
+        
         def write(self, data, filename):
             if not data:
                 return
@@ -484,7 +625,20 @@ def exercise_02_data_converter():
             return '.csv'
     
     class XMLFormat(DataFormat):
-        """Формат XML"""
+        """
+        Формат XML
+        
+        Чтение записей идет через iterparse: запись - элемент с тегом
+        record_tag (по умолчанию - каждый дочерний элемент корня),
+        обработанные элементы очищаются. Запись выполняется потоком
+        событий XMLGenerator без построения дерева. Преобразования
+        между элементами и словарями не рекурсивны, поэтому глубина
+        документа не ограничена лимитом рекурсии.
+        """
+        
+        def __init__(self, record_tag=None, root_tag='root'):
+            self.record_tag = record_tag
+            self.root_tag = root_tag
         
         def can_read(self, filename):
             return filename.lower().endswith('.xml')
@@ -495,37 +649,112 @@ def exercise_02_data_converter():
             return self._xml_to_dict(root)
         
         def write(self, data, filename):
-            root = self._dict_to_xml(data, 'root')
-            tree = ET.ElementTree(root)
-            tree.write(filename, encoding='utf-8', xml_declaration=True)
+            with open(filename, 'wb') as f:
+                generator = XMLGenerator(f, encoding='utf-8', short_empty_elements=True)
+                generator.startDocument()
+                self._write_element(generator, self.root_tag, data)
+                generator.endDocument()
+        
+        def read_records(self, filename, record_tag=None):
+            """Записи по тегу record_tag; обработанные элементы удаляются из дерева"""
+            record_tag = record_tag or self.record_tag
+            path = []          # Открытые элементы от корня до текущего
+            open_records = 0   # Записи, внутри которых мы находимся
+            
+            for event, element in ET.iterparse(filename, events=('start', 'end')):
+                if event == 'start':
+                    path.append(element)
+                    if element.tag == record_tag:
+                        open_records += 1
+                    continue
+                
+                path.pop()
+                
+                if record_tag:
+                    if element.tag != record_tag:
+                        if not open_records:
+                            # Элемент вне записей (обертка, служебные поля) - не нужен
+                            self._release(element, path)
+                        continue
+                    open_records -= 1
+                    if open_records:
+                        continue  # Вложенная запись остается частью внешней
+                elif len(path) != 1:
+                    continue
+                
+                yield self._xml_to_dict(element)
+                self._release(element, path)
+        
+        @staticmethod
+        def _release(element, path):
+            """Освобождение памяти: содержимое элемента и ссылка родителя на него"""
+            element.clear()
+            if path:
+                # iterparse читает пачками: за элементом в родителе могут уже
+                # стоять следующие, поэтому удаляем именно его, а не последний
+                try:
+                    path[-1].remove(element)
+                except ValueError:
+                    pass
+        
+        def write_records(self, records, filename, record_tag=None):
+            """Запись элементов по одному без построения дерева"""
+            record_tag = record_tag or self.record_tag or 'record'
+            
+            with open(filename, 'wb') as f:
+                generator = XMLGenerator(f, encoding='utf-8', short_empty_elements=True)
+                generator.startDocument()
+                generator.startElement(self.root_tag, {})
+                for record in records:
+                    self._write_element(generator, record_tag, record)
+                generator.endElement(self.root_tag)
+                generator.endDocument()
         
         def _xml_to_dict(self, element):
-            """Преобразование XML элемента в словарь"""
+            """Преобразование XML элемента в словарь (обход без рекурсии)"""
+            # Значение элемента собирается, когда значения всех детей уже готовы
+            values = {}
+            stack = [(element, False)]
+            
+            while stack:
+                node, children_ready = stack.pop()
+                
+                if not children_ready:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node)
+                    continue
+                
+                children = [(child.tag, values.pop(id(child))) for child in node]
+                values[id(node)] = self._element_value(node, children)
+            
+            return values[id(element)]
+        
+        @staticmethod
+        def _element_value(element, children):
+            """Значение элемента по его атрибутам, тексту и значениям детей"""
             result = {}
             
-            # Атрибуты элемента
+            # Атрибуты копируются: элемент может быть очищен после чтения
             if element.attrib:
-                result['@attributes'] = element.attrib
+                result['@attributes'] = dict(element.attrib)
             
             # Текст элемента
             if element.text and element.text.strip():
-                if len(element) == 0:
+                if not children:
                     return element.text.strip()
                 result['#text'] = element.text.strip()
             
-            # Дочерние элементы
-            children = {}
-            for child in element:
-                child_data = self._xml_to_dict(child)
-                
-                if child.tag in children:
-                    if not isinstance(children[child.tag], list):
-                        children[child.tag] = [children[child.tag]]
-                    children[child.tag].append(child_data)
+            # Дочерние элементы: повторяющиеся теги собираются в список
+            merged = {}
+            for tag, child_data in children:
+                if tag in merged:
+                    if not isinstance(merged[tag], list):
+                        merged[tag] = [merged[tag]]
+                    merged[tag].append(child_data)
                 else:
-                    children[child.tag] = child_data
+                    merged[tag] = child_data
             
-            result.update(children)
+            result.update(merged)
             
             # Если только текст, возвращаем его
             if len(result) == 1 and '#text' in result:
@@ -533,28 +762,42 @@ def exercise_02_data_converter():
             
             return result if result else None
         
-        def _dict_to_xml(self, data, root_tag):
-            """Преобразование словаря в XML элемент"""
-            element = ET.Element(root_tag)
-            
-            if isinstance(data, dict):
-                for key, value in data.items():
-                    if key == '@attributes':
-                        element.attrib.update(value)
-                    elif key == '#text':
-                        element.text = str(value)
+        @staticmethod
+        def _write_element(generator, tag, data):
+            """Вывод значения как XML элемента через XMLGenerator (без рекурсии)"""
+            # В стеке - элементы для вывода (тег, значение) и закрывающие теги (строки)
+            stack = [(tag, data)]
+            
+            while stack:
+                item = stack.pop()
+                if isinstance(item, str):
+                    generator.endElement(item)
+                    continue
+                
+                tag, value = item
+                
+                if not isinstance(value, dict):
+                    generator.startElement(tag, {})
+                    generator.characters(str(value))
+                    generator.endElement(tag)
+                    continue
+                
+                attributes = {name: str(attr) for name, attr in value.get('@attributes', {}).items()}
+                generator.startElement(tag, attributes)
+                if '#text' in value:
+                    generator.characters(str(value['#text']))
+                
+                children = []
+                for key, child in value.items():
+                    if key in ('@attributes', '#text'):
+                        continue
+                    if isinstance(child, list):
+                        children.extend((key, entry) for entry in child)
                     else:
-                        if isinstance(value, list):
-                            for item in value:
-                                sub_elem = self._dict_to_xml(item, key)
-                                element.append(sub_elem)
-                        else:
-                            sub_elem = self._dict_to_xml(value, key)
-                            element.append(sub_elem)
-            else:
-                element.text = str(data)
-            
-            return element
+                        children.append((key, child))
+                
+                stack.append(tag)
+                stack.extend(reversed(children))
         
         @property
         def extension(self):
@@ -563,9 +806,11 @@ def exercise_02_data_converter():
     class DataConverter:
         """Универсальный конвертер данных"""
         
-        def __init__(self):
+        def __init__(self, verbose=True):
+            self.verbose = verbose
             self.formats = {
                 'json': JSONFormat(),
+                'ndjson': NDJSONFormat(),
                 'csv': CSVFormat(),
                 'xml': XMLFormat()
             }
@@ -578,12 +823,23 @@ def exercise_02_data_converter():
             
             raise ValueError(f"Неподдерживаемый формат файла: {filename}")
         
-        def convert(self, input_file, output_format, output_file=None):
-            """Конвертация файла в другой формат"""
+        def _log(self, message):
+            """Вывод хода конвертации (отключается в пакетном режиме)"""
+            if self.verbose:
+                print(message)
+        
+        def convert(self, input_file, output_format, output_file=None, streaming=False,
+                    detected=None):
+            """Конвертация файла в другой формат
+            
+            streaming=True - записи читаются и пишутся по одной,
+            поэтому память не зависит от размера файла.
+            detected - уже определенный формат (имя, обработчик).
+            """
             
             # Определяем входной формат
-            input_format_name, input_format = self.detect_format(input_file)
-            print(f"Входной формат: {input_format_name}")
+            input_format_name, input_format = detected or self.detect_format(input_file)
+            self._log(f"Входной формат: {input_format_name}")
             
             # Проверяем выходной формат
             if output_format not in self.formats:
@@ -596,80 +852,238 @@ def exercise_02_data_converter():
                 base_name = os.path.splitext(input_file)[0]
                 output_file = base_name + output_format_handler.extension
             
-            print(f"Выходной формат: {output_format}")
-            print(f"Выходной файл: {output_file}")
+            self._log(f"Выходной формат: {output_format}")
+            self._log(f"Выходной файл: {output_file}")
+            
+            if streaming:
+                return self._convert_streaming(input_file, input_format,
+                                               output_file, output_format_handler)
             
             # Конвертация
-            print("Чтение данных...")
+            self._log("Чтение данных...")
             start_time = time.time()
             
             try:
                 data = input_format.read(input_file)
                 read_time = time.time() - start_time
                 
-                print(f"Данные прочитаны за {read_time:.3f}с")
+                self._log(f"Данные прочитаны за {read_time:.3f}с")
                 
                 if isinstance(data, list):
-                    print(f"Записей в данных: {len(data)}")
+                    self._log(f"Записей в данных: {len(data)}")
                 elif isinstance(data, dict):
-                    print(f"Ключей в данных: {len(data)}")
+                    self._log(f"Ключей в данных: {len(data)}")
                 
-                print("Запись данных...")
+                self._log("Запись данных...")
                 write_start = time.time()
                 
                 output_format_handler.write(data, output_file)
                 write_time = time.time() - write_start
                 
-                print(f"Данные записаны за {write_time:.3f}с")
+                self._log(f"Данные записаны за {write_time:.3f}с")
                 
                 # Сравниваем размеры файлов
                 input_size = os.path.getsize(input_file)
                 output_size = os.path.getsize(output_file)
                 
-                print(f"Размер входного файла: {input_size:,} байт")
-                print(f"Размер выходного файла: {output_size:,} байт")
-                print(f"Изменение размера: {(output_size/input_size-1)*100:+.1f}%")
+                self._log(f"Размер входного файла: {input_size:,} байт")
+                self._log(f"Размер выходного файла: {output_size:,} байт")
+                self._log(f"Изменение размера: {(output_size/input_size-1)*100:+.1f}%")
                 
                 return output_file
                 
             except Exception as e:
-                print(f"Ошибка конвертации: {e}")
+                self._log(f"Ошибка конвертации: {e}")
                 raise
         
-        def batch_convert(self, input_dir, output_format, output_dir=None):
-            """Пакетная конвертация файлов в директории"""
+        def _convert_streaming(self, input_file, input_format, output_file, output_format_handler):
+            """Потоковая конвертация: запись за записью"""
+            
+            self._log("Потоковая конвертация...")
+            start_time = time.time()
+            counter = {'records': 0}
+            
+            def counted(records):
+                for record in records:
+                    counter['records'] += 1
+                    yield record
+            
+            try:
+                output_format_handler.write_records(
+                    counted(input_format.read_records(input_file)), output_file
+                )
+            except Exception as e:
+                self._log(f"Ошибка конвертации: {e}")
+                raise
+            
+            elapsed = time.time() - start_time
+            input_size = os.path.getsize(input_file)
+            output_size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+            
+            self._log(f"Записей обработано: {counter['records']:,} за {elapsed:.3f}с")
+            self._log(f"Размер входного файла: {input_size:,} байт")
+            self._log(f"Размер выходного файла: {output_size:,} байт")
+            
+            return output_file
+        
+        def _convert_task(self, task):
+            """Конвертация одного файла пакета: (вход, выход, время, ошибка)"""
+            input_file, output_format, output_file, streaming, detected_name = task
+            start_time = time.time()
+            
+            try:
+                self.convert(input_file, output_format, output_file, streaming=streaming,
+                             detected=(detected_name, self.formats[detected_name]))
+                return input_file, output_file, time.time() - start_time, None
+            except Exception as e:
+                return input_file, output_file, time.time() - start_time, str(e)
+        
+        def _load_manifest(self, manifest_file):
+            """Манифест пакета: какие файлы уже сконвертированы"""
+            if os.path.exists(manifest_file):
+                try:
+                    with open(manifest_file, 'r', encoding='utf-8') as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    pass
+            return {}
+        
+        def _save_manifest(self, manifest, manifest_file):
+            """Атомарное сохранение манифеста (переживает падение процесса)"""
+            temp_file = manifest_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, manifest_file)
+        
+        def batch_convert(self, input_dir, output_format, output_dir=None,
+                          parallel=False, max_workers=None, streaming=False):
+            """Пакетная конвертация файлов в директории
+            
+            parallel=True - файлы конвертируются в пуле процессов,
+            начиная с самых больших. Прогресс сохраняется в манифест,
+            поэтому после сбоя повторный запуск обработает только
+            несконвертированные файлы.
+            """
+            
+            if output_format not in self.formats:
+                raise ValueError(f"Неподдерживаемый выходной формат: {output_format}")
             
             if output_dir is None:
                 output_dir = input_dir + f"_converted_to_{output_format}"
             
             os.makedirs(output_dir, exist_ok=True)
             
+            manifest_file = os.path.join(output_dir, '.batch_manifest.json')
+            manifest = self._load_manifest(manifest_file)
+            output_ext = self.formats[output_format].extension
+            
             converted_files = []
+            tasks = []
             
             for filename in os.listdir(input_dir):
                 input_file = os.path.join(input_dir, filename)
                 
-                if os.path.isfile(input_file):
-                    try:
-                        # Пытаемся определить формат
-                        self.detect_format(input_file)
-                        
-                        # Конвертируем
-                        base_name = os.path.splitext(filename)[0]
-                        output_ext = self.formats[output_format].extension
-                        output_file = os.path.join(output_dir, base_name + output_ext)
-                        
-                        print(f"\nКонвертация: {filename}")
-                        self.convert(input_file, output_format, output_file)
-                        converted_files.append(output_file)
-                        
-                    except ValueError:
-                        print(f"Пропускаем файл неподдерживаемого формата: {filename}")
-                    except Exception as e:
-                        print(f"Ошибка конвертации {filename}: {e}")
+                if not os.path.isfile(input_file):
+                    continue
+                
+                try:
+                    # Формат определяется один раз и передается в convert
+                    detected_name, _ = self.detect_format(input_file)
+                except ValueError:
+                    print(f"Пропускаем файл неподдерживаемого формата: {filename}")
+                    continue
+                
+                base_name = os.path.splitext(filename)[0]
+                output_file = os.path.join(output_dir, base_name + output_ext)
+                stat = os.stat(input_file)
+                
+                # Файл уже сконвертирован и с тех пор не менялся
+                entry = manifest.get(filename)
+                if (entry and entry['status'] == 'done' and
+                        entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime and
+                        os.path.exists(output_file)):
+                    converted_files.append(output_file)
+                    continue
+                
+                tasks.append((stat.st_size, filename, stat.st_mtime,
+                              (input_file, output_format, output_file, streaming, detected_name)))
+            
+            if converted_files:
+                print(f"Уже сконвертировано ранее: {len(converted_files)} файлов")
+            
+            # Большие файлы первыми: пул не простаивает в конце пакета
+            tasks.sort(key=lambda item: item[0], reverse=True)
+            task_info = {item[3][0]: item for item in tasks}
+            
+            def on_result(index, result):
+                input_file, output_file, elapsed, error = result
+                size, filename, mtime, _ = task_info[input_file]
+                
+                manifest[filename] = {
+                    'status': 'failed' if error else 'done',
+                    'output': output_file,
+                    'size': size,
+                    'mtime': mtime,
+                    'elapsed': round(elapsed, 6)
+                }
+                if error:
+                    manifest[filename]['error'] = error
+                    print(f"[{index}/{len(tasks)}] ❌ {filename}: {error}")
+                else:
+                    converted_files.append(output_file)
+                    print(f"[{index}/{len(tasks)}] {filename}: {size:,} байт за {elapsed:.3f}с")
+                
+                self._save_manifest(manifest, manifest_file)
+            
+            start_time = time.time()
             
-            print(f"\nПакетная конвертация завершена: {len(converted_files)} файлов")
+            if not parallel:
+                for index, item in enumerate(tasks, 1):
+                    print(f"\nКонвертация: {item[1]}")
+                    on_result(index, self._convert_task(item[3]))
+            elif tasks:
+                self._run_parallel([item[3] for item in tasks], max_workers, on_result)
+            
+            elapsed = time.time() - start_time
+            print(f"\nПакетная конвертация завершена: {len(converted_files)} файлов за {elapsed:.3f}с")
             return converted_files
+        
+        def _run_parallel(self, tasks, max_workers, on_result):
+            """Выполнение задач в пуле процессов (или потоков без fork)"""
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+            global _batch_converter
+            
+            if max_workers is None:
+                max_workers = os.cpu_count() or 1
+            max_workers = min(max_workers, len(tasks))
+            
+            verbose, self.verbose = self.verbose, False
+            
+            try:
+                if 'fork' in multiprocessing.get_all_start_methods():
+                    # Дочерние процессы наследуют конвертер через fork
+                    _batch_converter = self
+                    executor = ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        mp_context=multiprocessing.get_context('fork')
+                    )
+                    worker = _batch_convert_worker
+                    mode = 'процессов'
+                else:
+                    executor = ThreadPoolExecutor(max_workers=max_workers)
+                    worker = self._convert_task
+                    mode = 'потоков'
+                
+                print(f"Параллельная конвертация: {len(tasks)} файлов, {max_workers} {mode}")
+                
+                with executor:
+                    futures = [executor.submit(worker, task) for task in tasks]
+                    for index, future in enumerate(as_completed(futures), 1):
+                        on_result(index, future.result())
+            finally:
+                self.verbose = verbose
+                _batch_converter = None
     
     print("1. Создание тестовых данных:")
     
@@ -798,6 +1212,12 @@ def exercise_02_data_converter():
     verify_conversion(csv_file, json_from_csv)
     verify_conversion(xml_file, csv_from_xml)
     
+    print("\nПотоковая конвертация CSV → NDJSON → JSON → XML:")
+    ndjson_file = converter.convert(csv_file, 'ndjson', 'streamed.ndjson', streaming=True)
+    json_streamed = converter.convert(ndjson_file, 'json', 'streamed.json', streaming=True)
+    xml_streamed = converter.convert(json_streamed, 'xml', 'streamed.xml', streaming=True)
+    verify_conversion(csv_file, json_streamed)
+    
     print("\n4. Пакетная конвертация:")
     
     # Создаем директорию с несколькими файлами
@@ -812,9 +1232,19 @@ def exercise_02_data_converter():
     # Пакетная конвертация в JSON
     converted_files = converter.batch_convert(test_dir, 'json')
     
+    # Параллельная пакетная конвертация в NDJSON
+    print()
+    ndjson_dir = test_dir + "_converted_to_ndjson"
+    converted_files += converter.batch_convert(test_dir, 'ndjson', parallel=True)
+    
+    # Повторный запуск: манифест пропускает уже сконвертированные файлы
+    print()
+    converter.batch_convert(test_dir, 'ndjson', parallel=True)
+    
     print("\n5. Статистика конвертации:")
     
-    all_files = [json_file, csv_file, xml_file, json_from_csv, csv_from_xml] + converted_files
+    all_files = [json_file, csv_file, xml_file, json_from_csv, csv_from_xml,
+                 ndjson_file, json_streamed, xml_streamed] + converted_files
     
     formats_count = {}
     total_size = 0
@@ -837,7 +1267,7 @@ def exercise_02_data_converter():
     print("\n6. Очистка:")
     
     # Удаляем все созданные файлы
-    cleanup_files = all_files + [test_dir]
+    cleanup_files = all_files + [test_dir, test_dir + "_converted_to_json", ndjson_dir]
     
     for item in cleanup_files:
         try:
@@ -851,6 +1281,81 @@ def exercise_02_data_converter():
     print("✅ Все тестовые файлы и директории удалены")
 
 
+def compile_exclude_patterns(patterns):
+    """Объединяет glob-шаблоны исключений в одно регулярное выражение"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+def scan_tree(root, exclude=None, workers=8, follow_symlinks=False):
+    """
+    Параллельный рекурсивный обход директории
+    
+    Генератор пар (путь относительно root, os.DirEntry) для всех файлов.
+    Каждая директория читается через os.scandir в пуле потоков, и там же
+    вызывается stat(): результат кешируется в DirEntry, поэтому повторный
+    entry.stat() у вызывающего кода системного вызова не делает.
+    
+    exclude - glob-шаблоны или результат compile_exclude_patterns;
+    они проверяются по пути записи (для директорий - и с разделителем
+    на конце), исключенные директории не обходятся вовсе.
+    
+    Символические ссылки на файлы возвращаются всегда (stat - цели ссылки),
+    а в ссылки на директории обход заходит только при follow_symlinks=True:
+    так по умолчанию исключены циклы и повторный обход одного дерева.
+    """
+    if exclude is not None and not hasattr(exclude, 'match'):
+        exclude = compile_exclude_patterns(exclude)
+    
+    def excluded(entry, is_dir):
+        if exclude is None:
+            return False
+        return bool(exclude.match(entry.path) or is_dir and exclude.match(entry.path + os.sep))
+    
+    def scan_one(path, relative):
+        files = []
+        subdirs = []
+        
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    entry_relative = os.path.join(relative, entry.name) if relative else entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                        if excluded(entry, is_dir):
+                            continue
+                        
+                        if is_dir:
+                            subdirs.append((entry.path, entry_relative))
+                        elif entry.is_file():
+                            entry.stat()  # Заполняем кеш DirEntry в рабочем потоке
+                            files.append((entry_relative, entry))
+                    except OSError:
+                        continue  # Файл удален во время обхода или нет доступа
+        except OSError:
+            pass  # Директория недоступна
+        
+        return files, subdirs
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_one, os.fspath(root), '')}
+        
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    files, subdirs = future.result()
+                    for path, relative in subdirs:
+                        pending.add(executor.submit(scan_one, path, relative))
+                    yield from files
+        finally:
+            # Генератор закрыт досрочно - незапущенные задачи не нужны
+            for future in pending:
+                future.cancel()
+
+
 def exercise_03_backup_system():
     """
     Упражнение 3: Система резервного копирования
@@ -918,23 +1423,16 @@ def exercise_03_backup_system():
             """Сканирование директории и создание индекса файлов"""
             file_index = {}
             
-            for root, dirs, files in os.walk(source_dir):
-                for file in files:
-                    filepath = os.path.join(root, file)
-                    relative_path = os.path.relpath(filepath, source_dir)
-                    
-                    try:
-                        stat = os.stat(filepath)
-                        file_hash = self._calculate_file_hash(filepath)
-                        
-                        file_index[relative_path] = {
-                            'size': stat.st_size,
-                            'mtime': stat.st_mtime,
-                            'hash': file_hash,
-                            'full_path': filepath
-                        }
-                    except OSError:
-                        continue
+            # stat уже получен сканером и закеширован в DirEntry
+            for relative_path, entry in scan_tree(source_dir):
+                stat = entry.stat()
+                
+                file_index[relative_path] = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'hash': self._calculate_file_hash(entry.path),
+                    'full_path': entry.path
+                }
             
             return file_index
         
@@ -1197,46 +1695,190 @@ def exercise_03_backup_system():
             
             return chain
         
-        def verify_backup(self, backup_name):
-            """Проверка целостности резервной копии"""
+        @staticmethod
+        def _is_sampled(member_name, sample_rate, seed):
+            """Детерминированный выбор файла для выборочной проверки"""
+            if sample_rate >= 1.0:
+                return True
+            
+            # Хеш от (seed, имя) равномерно распределен, поэтому при смене
+            # seed (например, номера дня) проверяются разные файлы
+            digest = hashlib.md5(f"{seed}:{member_name}".encode('utf-8')).digest()
+            return int.from_bytes(digest[:4], 'big') / 2**32 < sample_rate
+        
+        def _verify_archive(self, backup_info, sample_rate=1.0, seed=0, chunk_size=1024 * 1024):
+            """Потоковая проверка архива с хешированием содержимого файлов
+            
+            Данные файлов, не попавших в выборку, не читаются из архива:
+            tarfile пропускает их сам, большими блоками bufsize. Распаковка
+            gzip при этом неизбежна (поток сжат целиком), но без копирования
+            в Python и хеширования. Копия без индекса файлов помечается как
+            непроверяемая (ok=None), а не как архив из одних лишних файлов.
+            """
+            
+            result = {
+                'name': backup_info['name'],
+                'ok': False,
+                'verifiable': True,
+                'members': 0,
+                'verified': 0,
+                'skipped': 0,
+                'errors': [],
+                'elapsed': 0.0
+            }
+            
+            backup_file = Path(backup_info['backup_file'])
+            
+            if not backup_file.exists():
+                result['errors'].append(f"Файл резервной копии не найден: {backup_file}")
+                return result
+            
+            file_index = backup_info.get('file_index')
+            if not file_index:
+                result['verifiable'] = False
+            
+            seen = set()
+            start_time = time.time()
+            
+            try:
+                # Режим 'r|gz' читает архив одним проходом, не строя
+                # список всех членов в памяти, как getmembers()
+                with tarfile.open(backup_file, 'r|gz', bufsize=chunk_size) as tar:
+                    for member in tar:
+                        if not member.isfile():
+                            continue
+                        
+                        result['members'] += 1
+                        seen.add(member.name)
+                        
+                        if not result['verifiable']:
+                            # Сверять не с чем: только проверяем, что архив читается
+                            result['skipped'] += 1
+                            continue
+                        
+                        expected = file_index.get(member.name)
+                        if expected is None:
+                            result['errors'].append(f"Лишний файл в архиве: {member.name}")
+                            continue
+                        
+                        if member.size != expected['size']:
+                            result['errors'].append(
+                                f"Размер не совпадает: {member.name} "
+                                f"({member.size} != {expected['size']})"
+                            )
+                            continue
+                        
+                        if not self._is_sampled(member.name, sample_rate, seed):
+                            result['skipped'] += 1
+                            continue
+                        
+                        # Хешируем содержимое по частям прямо из потока
+                        hash_md5 = hashlib.md5()
+                        source = tar.extractfile(member)
+                        for chunk in iter(lambda: source.read(chunk_size), b""):
+                            hash_md5.update(chunk)
+                        
+                        if hash_md5.hexdigest() != expected['hash']:
+                            result['errors'].append(f"Хеш не совпадает: {member.name}")
+                        else:
+                            result['verified'] += 1
+            
+            except (tarfile.TarError, OSError, EOFError) as e:
+                result['errors'].append(f"Ошибка чтения архива: {e}")
+            
+            missing = set(file_index or ()) - seen
+            for name in sorted(missing):
+                result['errors'].append(f"Файл отсутствует в архиве: {name}")
+            
+            expected_count = backup_info['files_count']
+            if result['members'] != expected_count:
+                result['errors'].append(
+                    f"Ожидалось {expected_count} файлов, найдено {result['members']}"
+                )
+            
+            result['elapsed'] = time.time() - start_time
+            if result['errors']:
+                result['ok'] = False
+            else:
+                result['ok'] = True if result['verifiable'] else None
+            return result
+        
+        def _print_verification(self, result):
+            """Вывод результата проверки одного архива"""
+            
+            print(f"Архив содержит {result['members']} файлов")
+            print(f"Проверено хешей: {result['verified']}, пропущено выборкой: {result['skipped']}")
+            
+            for error in result['errors'][:10]:
+                print(f"❌ {error}")
+            if len(result['errors']) > 10:
+                print(f"... и еще {len(result['errors']) - 10} ошибок")
+            
+            if result['ok']:
+                print(f"✅ Резервная копия прошла проверку целостности ({result['elapsed']:.3f}с)")
+            elif result['ok'] is None:
+                print("⚠️ Нет индекса файлов: архив читается, но содержимое проверить нельзя")
+        
+        def verify_backup(self, backup_name, sample_rate=1.0, seed=0):
+            """Проверка целостности резервной копии
+            
+            sample_rate - доля файлов, содержимое которых хешируется
+            (1.0 - все файлы). seed задает, какие именно файлы попадут в выборку:
+            меняя его каждую ночь, можно за несколько ночей проверить весь архив.
+            """
             
             print(f"Проверка целостности: {backup_name}")
             
-            backup_info = next((b for b in self.metadata['backups'] 
+            backup_info = next((b for b in self.metadata['backups']
                               if b['name'] == backup_name), None)
             
             if not backup_info:
                 print(f"Резервная копия {backup_name} не найдена")
                 return False
             
-            backup_file = Path(backup_info['backup_file'])
+            result = self._verify_archive(backup_info, sample_rate, seed)
+            self._print_verification(result)
+            return result['ok']
+        
+        def verify_all_backups(self, backup_names=None, sample_rate=1.0, seed=None, max_workers=None):
+            """Параллельная проверка нескольких резервных копий
             
-            if not backup_file.exists():
-                print(f"Файл резервной копии не найден: {backup_file}")
-                return False
+            Распаковка gzip и вычисление md5 отпускают GIL, поэтому
+            архивы эффективно проверяются в пуле потоков.
+            """
+            from concurrent.futures import ThreadPoolExecutor
             
-            # Проверяем архив
-            try:
-                with tarfile.open(backup_file, 'r:gz') as tar:
-                    members = tar.getmembers()
-                
-                print(f"Архив содержит {len(members)} файлов")
-                
-                # Проверяем соответствие метаданным
-                expected_count = backup_info['files_count']
-                
-                if len(members) == expected_count:
-                    print("✅ Количество файлов соответствует метаданным")
-                else:
-                    print(f"❌ Ожидалось {expected_count} файлов, найдено {len(members)}")
-                    return False
-                
-                print("✅ Резервная копия прошла проверку целостности")
-                return True
-                
-            except Exception as e:
-                print(f"❌ Ошибка проверки архива: {e}")
-                return False
+            if seed is None:
+                seed = datetime.now().date().toordinal()
+            
+            if backup_names is None:
+                backups = list(self.metadata['backups'])
+            else:
+                backups = [b for b in self.metadata['backups'] if b['name'] in backup_names]
+            
+            if not backups:
+                print("Нет резервных копий для проверки")
+                return {}
+            
+            if max_workers is None:
+                max_workers = min(len(backups), os.cpu_count() or 1)
+            
+            print(f"Проверка {len(backups)} резервных копий "
+                  f"(выборка {sample_rate:.0%}, потоков: {max_workers})")
+            
+            start_time = time.time()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(
+                    lambda backup: self._verify_archive(backup, sample_rate, seed),
+                    backups
+                ))
+            
+            for result in results:
+                print(f"\n{result['name']}:")
+                self._print_verification(result)
+            
+            print(f"\nОбщее время проверки: {time.time() - start_time:.3f}с")
+            return {result['name']: result['ok'] for result in results}
         
         def cleanup_old_backups(self, keep_days=30):
             """Очистка старых резервных копий"""
@@ -1348,6 +1990,10 @@ def exercise_03_backup_system():
     if incremental_backup_name:
         backup_system.verify_backup(incremental_backup_name)
     
+    # Выборочная параллельная проверка всех копий (например, ночная задача)
+    print()
+    backup_system.verify_all_backups(sample_rate=0.5)
+    
     print("\n8. Восстановление из резервной копии:")
     
     # Восстанавливаем полную копию
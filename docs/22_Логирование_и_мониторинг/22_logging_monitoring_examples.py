@@ -7,19 +7,23 @@
 
 import logging
 import logging.handlers
+import os
 import sys
 import json
 import time
 import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Callable
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 from pathlib import Path
 import traceback
 import functools
 import inspect
+import importlib
+import math
 import psutil
 import queue
+import heapq
 import smtplib
 from email.mime.text import MimeText
 from email.mime.multipart import MimeMultipart
@@ -28,21 +32,44 @@ from contextlib import contextmanager
 import tempfile
 import warnings
 from collections import defaultdict, deque
+from array import array
 import asyncio
 import aiohttp
 import weakref
+import atexit
 
 # =============================================================================
 # Пример 1: Структурированное логирование
 # =============================================================================
 
 class StructuredLogger:
-    """Структурированный логгер с JSON форматом"""
-    
-    def __init__(self, name: str, log_file: str = None, level: str = "INFO"):
+    """
+    Структурированный логгер с JSON форматом
+    
+    В неблокирующем режиме (async_mode=True) вызывающий поток только
+    кладет кортеж с данными записи в кольцевой буфер (deque), а фоновый
+    поток форматирует записи и пишет их пачками: один write и один flush
+    на пачку для каждого обработчика. overflow задает поведение при
+    заполненном буфере: 'drop_new' - отбросить новую запись, 'drop_oldest' -
+    вытеснить самую старую, 'block' - ждать, пока писатель освободит место.
+    Писатель, как и logging, учитывает уровень и фильтры каждого обработчика
+    и передает записи обработчикам предков (propagate).
+    """
+    
+    OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+    
+    def __init__(self, name: str, log_file: str = None, level: str = "INFO",
+                 async_mode: bool = False, buffer_size: int = 10000, batch_size: int = 512,
+                 flush_interval: float = 0.05, overflow: str = 'drop_new', console: bool = True):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"overflow должен быть одним из {self.OVERFLOW_POLICIES}")
+        
         self.logger = logging.getLogger(name)
         self.logger.setLevel(getattr(logging, level.upper()))
         
+        # PID не меняется за время жизни процесса - получаем один раз
+        self.pid = os.getpid()
+        
         # Удаляем существующие обработчики
         for handler in self.logger.handlers[:]:
             self.logger.removeHandler(handler)
@@ -51,9 +78,10 @@ class StructuredLogger:
         self.formatter = JsonFormatter()
         
         # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(self.formatter)
-        self.logger.addHandler(console_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(self.formatter)
+            self.logger.addHandler(console_handler)
         
         # File handler
         if log_file:
@@ -62,34 +90,306 @@ class StructuredLogger:
             )
             file_handler.setFormatter(self.formatter)
             self.logger.addHandler(file_handler)
+        
+        # Неблокирующий режим
+        self.async_mode = async_mode
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._writing = False  # Писатель забрал пачку из буфера, но еще не записал
+        self._closed = False
+        self._writer = None
+        
+        if async_mode:
+            # deque.append/popleft атомарны - producer и writer обходятся без блокировок
+            maxlen = buffer_size if overflow == 'drop_oldest' else None
+            self._buffer = deque(maxlen=maxlen)
+            self._wake = threading.Event()
+            self._space = threading.Event()
+            self._own_codes = {
+                method.__code__ for method in (
+                    StructuredLogger.log, StructuredLogger.info, StructuredLogger.error,
+                    StructuredLogger.warning, StructuredLogger.debug
+                )
+            }
+            self._writer = threading.Thread(target=self._writer_loop, name=f"{name}-log-writer",
+                                            daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
     
-    def log(self, level: str, message: str, **kwargs):
+    def log(self, level: str, message: str, /, **kwargs):
         """Логирование с дополнительными полями"""
+        if self.async_mode:
+            self._enqueue(getattr(logging, level.upper()), message, kwargs)
+            return
+        
         extra = {
             'custom_fields': kwargs,
             'timestamp_iso': datetime.utcnow().isoformat(),
-            'process_id': psutil.Process().pid,
+            'process_id': self.pid,
             'thread_id': threading.get_ident()
         }
         
         getattr(self.logger, level.lower())(message, extra=extra)
     
-    def info(self, message: str, **kwargs):
+    def _enqueue(self, levelno: int, message: str, fields: Dict[str, Any]):
+        """Быстрая часть на потоке вызывающего: фильтр уровня и кортеж в буфер"""
+        if self._closed or not self.logger.isEnabledFor(levelno):
+            return
+        
+        # Место вызова - первый кадр вне методов логгера
+        frame = sys._getframe(1)
+        while frame.f_code in self._own_codes:
+            frame = frame.f_back
+        code = frame.f_code
+        
+        item = (time.time(), levelno, message, fields, threading.get_ident(),
+                code.co_filename, frame.f_lineno, code.co_name)
+        
+        if self.overflow == 'drop_oldest':
+            if len(self._buffer) >= self.buffer_size:
+                self._count_dropped()  # deque сам вытеснит самую старую запись
+        elif len(self._buffer) >= self.buffer_size:
+            if self.overflow == 'drop_new':
+                self._count_dropped()
+                return
+            # 'block': ждем, пока писатель разгрузит буфер
+            while len(self._buffer) >= self.buffer_size and not self._closed:
+                self._wake.set()
+                self._space.wait(self.flush_interval)
+                self._space.clear()
+        
+        self._buffer.append(item)
+        
+        # Будим писателя только когда накопилась пачка - не на каждую запись
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+    
+    def _count_dropped(self):
+        """Счетчик потерь: += не атомарен, а производителей может быть много"""
+        with self._dropped_lock:
+            self.dropped += 1
+    
+    def _make_record(self, item) -> logging.LogRecord:
+        """Восстановление LogRecord из кортежа (на потоке писателя)"""
+        created, levelno, message, fields, thread_id, pathname, lineno, func_name = item
+        
+        record = self.logger.makeRecord(self.logger.name, levelno, pathname, lineno,
+                                        message, None, None, func=func_name)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        record.custom_fields = fields
+        record.timestamp_iso = datetime.utcfromtimestamp(created).isoformat()
+        record.process_id = self.pid
+        record.thread_id = thread_id
+        return record
+    
+    def _writer_loop(self):
+        """Фоновый поток: форматирование и запись пачками"""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            
+            wrote = False
+            while self._buffer:
+                # Флаг ставится до извлечения: flush() не должен увидеть пустой
+                # буфер, пока пачка еще не записана
+                self._writing = True
+                try:
+                    batch = []
+                    while self._buffer and len(batch) < self.batch_size:
+                        batch.append(self._buffer.popleft())
+                    self._write_batch(batch)
+                finally:
+                    self._writing = False
+                self._space.set()
+                wrote = True
+            
+            if self._closed and not wrote:
+                break
+    
+    def _target_handlers(self):
+        """Обработчики логгера и его предков - тот же обход, что в Logger.callHandlers"""
+        handlers = []
+        logger = self.logger
+        while logger:
+            handlers.extend(logger.handlers)
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        
+        if not handlers and logging.lastResort:
+            handlers.append(logging.lastResort)
+        return handlers
+    
+    def _write_batch(self, batch):
+        """Одна запись и один flush на пачку для каждого обработчика"""
+        if self.logger.disabled:
+            return
+        
+        records = [self._make_record(item) for item in batch]
+        records = [record for record in records if self.logger.filter(record)]
+        
+        for handler in self._target_handlers():
+            records_for_handler = [record for record in records if record.levelno >= handler.level]
+            if not records_for_handler:
+                continue
+            
+            # Пачкой пишем только в открытый поток. Остальные обработчики
+            # (и FileHandler с delay=True, который сам откроет файл)
+            # получают записи через handle - он же применит их фильтры
+            if not isinstance(handler, logging.StreamHandler) or handler.stream is None:
+                for record in records_for_handler:
+                    handler.handle(record)
+                continue
+            
+            records_for_handler = [record for record in records_for_handler if handler.filter(record)]
+            if not records_for_handler:
+                continue
+            
+            data = ''.join(handler.format(record) + handler.terminator
+                           for record in records_for_handler)
+            
+            handler.acquire()
+            try:
+                if (isinstance(handler, logging.handlers.RotatingFileHandler)
+                        and handler.maxBytes > 0
+                        and handler.stream.tell() + len(data) >= handler.maxBytes):
+                    handler.doRollover()
+                
+                handler.stream.write(data)
+                handler.flush()
+            except Exception:
+                handler.handleError(records_for_handler[-1])
+            finally:
+                handler.release()
+    
+    def flush(self, timeout: float = 5.0):
+        """Ожидание, пока писатель запишет все записи, поставленные до вызова"""
+        if not self.async_mode:
+            return
+        
+        deadline = time.monotonic() + timeout
+        while (self._buffer or self._writing) and time.monotonic() < deadline:
+            self._wake.set()
+            self._space.wait(self.flush_interval)
+            self._space.clear()
+    
+    def close(self):
+        """Дописывает буфер и останавливает фоновый поток"""
+        if self._writer is None or self._closed:
+            return
+        
+        self._closed = True
+        self._wake.set()
+        self._writer.join()
+        atexit.unregister(self.close)
+    
+    def info(self, message: str, /, **kwargs):
         self.log('INFO', message, **kwargs)
     
-    def error(self, message: str, **kwargs):
+    def error(self, message: str, /, **kwargs):
         self.log('ERROR', message, **kwargs)
     
-    def warning(self, message: str, **kwargs):
+    def warning(self, message: str, /, **kwargs):
         self.log('WARNING', message, **kwargs)
     
-    def debug(self, message: str, **kwargs):
+    def debug(self, message: str, /, **kwargs):
         self.log('DEBUG', message, **kwargs)
 
+def get_json_backend(preferred=('orjson', 'ujson')):
+    """Выбор самой быстрой доступной JSON библиотеки с fallback на json"""
+    for module_name in preferred:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        
+        if module_name == 'orjson':
+            # orjson возвращает bytes
+            return (lambda obj, _dumps=module.dumps: _dumps(obj).decode('utf-8')), module_name
+        if module_name == 'ujson':
+            return functools.partial(module.dumps, escape_forward_slashes=False), module_name
+        return module.dumps, module_name
+    
+    return json.dumps, 'json'
+
+class TimestampCache:
+    """
+    Кэш ISO-времени с точностью до секунды
+    
+    Результат совпадает с datetime.utcfromtimestamp(created).isoformat(),
+    но форматирование даты выполняется один раз в секунду: для остальных
+    записей к готовому префиксу дописываются только микросекунды.
+    """
+    
+    def __init__(self):
+        # (секунда, префикс) - одним кортежем, чтобы потоки не видели половину обновления
+        self._cached = (None, '')
+    
+    def format(self, created: float) -> str:
+        # Округление микросекунд как в datetime.utcfromtimestamp
+        frac, second = math.modf(created)
+        us = round(frac * 1e6)
+        if us >= 1000000:
+            second += 1
+            us -= 1000000
+        elif us < 0:
+            second -= 1
+            us += 1000000
+        
+        second = int(second)
+        cached_second, prefix = self._cached
+        if cached_second != second:
+            prefix = datetime.utcfromtimestamp(second).isoformat()
+            self._cached = (second, prefix)
+        
+        if us:
+            return f"{prefix}.{us:06d}"
+        return prefix
+
 class JsonFormatter(logging.Formatter):
-    """JSON форматтер для логов"""
+    """
+    JSON форматтер для логов
+    
+    Быстрый путь собирает строку по шаблону с фиксированным порядком ключей.
+    Повторяющиеся фрагменты (уровень и логгер, место вызова, статические
+    поля) сериализуются один раз и берутся из кэша, время - из TimestampCache,
+    а через JSON библиотеку (orjson/ujson, если установлены) проходят только
+    динамические поля записи.
+    """
+    
+    FIXED_KEYS = frozenset(('timestamp', 'level', 'logger', 'message',
+                            'module', 'function', 'line'))
+    CACHE_LIMIT = 4096
+    
+    def __init__(self, static_fields: Dict[str, Any] = None, fast: bool = True,
+                 backend: str = None):
+        super().__init__()
+        self.fast = fast
+        self.static_fields = dict(static_fields or {})
+        self.dumps, self.backend = get_json_backend((backend,) if backend else ('orjson', 'ujson'))
+        
+        # Статические поля сериализуются один раз
+        self._static_fragment = (', ' + json.dumps(self.static_fields)[1:-1]
+                                 if self.static_fields else '')
+        self._reserved_keys = self.FIXED_KEYS | set(self.static_fields)
+        
+        self._encode_str = json.encoder.encode_basestring_ascii
+        self._timestamps = TimestampCache()
+        self._head_cache = {}
+        self._location_cache = {}
     
     def format(self, record):
+        if self.fast:
+            return self._format_fast(record)
+        return self._format_simple(record)
+    
+    def _format_simple(self, record):
+        """Сборка словаря и json.dumps на каждую запись"""
         log_entry = {
             'timestamp': datetime.utcfromtimestamp(record.created).isoformat(),
             'level': record.levelname,
@@ -100,6 +400,8 @@ class JsonFormatter(logging.Formatter):
             'line': record.lineno,
         }
         
+        log_entry.update(self.static_fields)
+        
         # Добавляем дополнительные поля
         if hasattr(record, 'custom_fields'):
             log_entry.update(record.custom_fields)
@@ -122,6 +424,101 @@ class JsonFormatter(logging.Formatter):
             }
         
         return json.dumps(log_entry)
+    
+    def _format_fast(self, record):
+        """Сборка строки по шаблону из кэшированных фрагментов"""
+        attrs = record.__dict__
+        fields = attrs.get('custom_fields')
+        
+        # Поле, перекрывающее ключ шаблона, - редкий случай, отдаем медленному пути
+        if fields and not self._reserved_keys.isdisjoint(fields):
+            return self._format_simple(record)
+        
+        head_key = (record.name, record.levelname)
+        head = self._head_cache.get(head_key)
+        if head is None:
+            if len(self._head_cache) >= self.CACHE_LIMIT:
+                self._head_cache.clear()
+            head = (f'", "level": {self._encode_str(record.levelname)}, '
+                    f'"logger": {self._encode_str(record.name)}, "message": ')
+            self._head_cache[head_key] = head
+        
+        location_key = (record.module, record.funcName, record.lineno)
+        location = self._location_cache.get(location_key)
+        if location is None:
+            if len(self._location_cache) >= self.CACHE_LIMIT:
+                self._location_cache.clear()
+            location = (f', "module": {self._encode_str(record.module)}, '
+                        f'"function": {json.dumps(record.funcName)}, "line": {record.lineno}')
+            self._location_cache[location_key] = location
+        
+        # Динамические поля - единственное, что проходит через JSON библиотеку
+        dynamic = dict(fields) if fields else {}
+        for name in ('timestamp_iso', 'process_id', 'thread_id'):
+            if name in attrs:
+                dynamic[name] = attrs[name]
+        
+        if record.exc_info:
+            dynamic['exception'] = {
+                'type': record.exc_info[0].__name__,
+                'message': str(record.exc_info[1]),
+                'traceback': traceback.format_exception(*record.exc_info)
+            }
+        
+        tail = '}'
+        if dynamic:
+            try:
+                serialized = self.dumps(dynamic)
+            except (TypeError, OverflowError):
+                # Типы, которые не поддерживает быстрая библиотека
+                serialized = json.dumps(dynamic)
+            tail = ', ' + serialized[1:]
+        
+        return ''.join((
+            '{"timestamp": "', self._timestamps.format(record.created), head,
+            self._encode_str(record.getMessage()), location, self._static_fragment, tail
+        ))
+
+def json_formatter_benchmark(records: int = 20000) -> Dict[str, float]:
+    """Микробенчмарк JSON форматтеров: записей в секунду"""
+    print("\n--- JSON Formatter Benchmark ---")
+    
+    bench_logger = logging.getLogger('formatter_bench')
+    log_records = []
+    for i in range(records):
+        record = bench_logger.makeRecord('formatter_bench', logging.INFO, __file__, 42,
+                                         "Request handled", None, None, func='handle_request')
+        record.custom_fields = {'request_id': i, 'status': 200, 'path': '/api/users'}
+        record.timestamp_iso = datetime.utcfromtimestamp(record.created).isoformat()
+        record.process_id = os.getpid()
+        record.thread_id = threading.get_ident()
+        log_records.append(record)
+    
+    variants = [
+        ('dict + json.dumps', JsonFormatter(fast=False)),
+        ('template + json', JsonFormatter(backend='json')),
+    ]
+    for backend in ('ujson', 'orjson'):
+        formatter = JsonFormatter(backend=backend)
+        if formatter.backend == backend:
+            variants.append((f'template + {backend}', formatter))
+    
+    reference = json.loads(variants[0][1].format(log_records[0]))
+    results = {}
+    
+    for name, formatter in variants:
+        # Вывод всех вариантов должен разбираться в одинаковые объекты
+        assert json.loads(formatter.format(log_records[0])) == reference
+        
+        start = time.perf_counter()
+        for record in log_records:
+            formatter.format(record)
+        elapsed = time.perf_counter() - start
+        
+        results[name] = records / elapsed
+        print(f"{name:<20} {results[name]:>12,.0f} записей/с")
+    
+    return results
 
 def structured_logging_demo():
     """Демонстрация структурированного логирования"""
@@ -154,6 +551,22 @@ def structured_logging_demo():
                      operands=[10, 0],
                      error_type=type(e).__name__)
     
+    # Сравнение синхронного и неблокирующего режимов на запись в файл
+    sync_logger = StructuredLogger('demo_app_sync', 'demo_sync.log', 'INFO', console=False)
+    async_logger = StructuredLogger('demo_app_async', 'demo_async.log', 'INFO',
+                                    async_mode=True, console=False)
+    
+    for name, bench_logger in (('sync', sync_logger), ('async', async_logger)):
+        start = time.perf_counter()
+        for i in range(10000):
+            bench_logger.info("Request handled", request_id=i, status=200)
+        caller_time = time.perf_counter() - start
+        bench_logger.close()
+        print(f"{name}: 10000 записей, время в вызывающем потоке {caller_time * 1000:.1f} мс, "
+              f"потеряно {bench_logger.dropped}")
+    
+    json_formatter_benchmark()
+    
     return logger
 
 # =============================================================================
@@ -307,15 +720,123 @@ def logging_decorators_demo():
 # Пример 3: Мониторинг производительности
 # =============================================================================
 
+class MetricRing:
+    """
+    Кольцевой буфер сэмплов: по массиву array('d') на каждое поле
+    
+    Память выделяется один раз при создании; запись - присваивание по
+    индексу. Окно за период находится бинарным поиском по времени и
+    возвращается срезами массивов, так что sum/min/max по окну выполняются
+    на уровне C, без разбора строк и вложенных словарей.
+    """
+    
+    def __init__(self, fields: List[str], capacity: int = 3600):
+        self.fields = ('timestamp',) + tuple(fields)
+        self.capacity = capacity
+        self.columns = {name: array('d', bytes(8 * capacity)) for name in self.fields}
+        self.size = 0
+        self.head = 0  # позиция следующей записи
+        self._lock = threading.Lock()
+    
+    def append(self, timestamp: float, **values: float):
+        """Запись сэмпла (вытесняет самый старый при заполнении)"""
+        with self._lock:
+            position = self.head
+            self.columns['timestamp'][position] = timestamp
+            for name in self.fields[1:]:
+                self.columns[name][position] = values.get(name, math.nan)
+            
+            self.head = (position + 1) % self.capacity
+            if self.size < self.capacity:
+                self.size += 1
+    
+    def _first_after(self, since: float) -> int:
+        """Логический индекс первого сэмпла новее since"""
+        timestamps = self.columns['timestamp']
+        base = (self.head - self.size) % self.capacity
+        low, high = 0, self.size
+        
+        while low < high:
+            middle = (low + high) // 2
+            if timestamps[(base + middle) % self.capacity] > since:
+                high = middle
+            else:
+                low = middle + 1
+        
+        return low
+    
+    def _segments(self, since: float = None) -> List[tuple]:
+        """Физические диапазоны окна (вызывается под блокировкой)"""
+        start = self._first_after(since) if since is not None else 0
+        first = (self.head - self.size + start) % self.capacity
+        end = first + self.size - start
+        
+        if end <= self.capacity:
+            return [(first, end)]
+        # Окно переходит через конец буфера - две части
+        return [(first, self.capacity), (0, end - self.capacity)]
+    
+    def window(self, since: float = None, fields: List[str] = None) -> Dict[str, array]:
+        """Копия сэмплов новее since (все, если since не задан) по полям"""
+        columns = {name: self.columns[name] for name in fields} if fields else self.columns
+        
+        with self._lock:
+            segments = self._segments(since)
+            if len(segments) == 1:
+                (first, end), = segments
+                return {name: column[first:end] for name, column in columns.items()}
+            
+            # Окно переходит через конец буфера - склеиваем две части
+            (first, _), (_, end) = segments
+            return {name: column[first:] + column[:end] for name, column in columns.items()}
+    
+    def reduce_window(self, since: float, field: str, reducer: Callable):
+        """
+        Агрегат поля за окно без копирования сэмплов
+        
+        reducer(column, segments) вызывается под блокировкой буфера, поэтому
+        запись не перезапишет окно во время чтения: column - массив поля,
+        segments - один или два диапазона (start, end) окна в нем.
+        """
+        with self._lock:
+            return reducer(self.columns[field], self._segments(since))
+    
+    def last(self, field: str) -> Optional[tuple]:
+        """(время, значение) последнего сэмпла или None, если буфер пуст"""
+        with self._lock:
+            if not self.size:
+                return None
+            position = (self.head - 1) % self.capacity
+            return self.columns['timestamp'][position], self.columns[field][position]
+
 class PerformanceMonitor:
-    """Монитор производительности приложения"""
+    """
+    Монитор производительности приложения
+    
+    Сэмплер не блокируется: загрузка CPU считается psutil как разница с
+    предыдущим вызовом, а объект psutil.Process создается один раз.
+    Сэмплы хранятся в MetricRing, поэтому сводка за любой период -
+    это срезы массивов.
+    """
+    
+    SAMPLE_FIELDS = (
+        'cpu_percent', 'memory_percent', 'memory_available_gb', 'disk_percent',
+        'disk_free_gb', 'process_cpu_percent', 'process_memory_rss_mb',
+        'process_memory_vms_mb', 'process_threads_count'
+    )
     
-    def __init__(self, collection_interval: float = 10.0):
+    def __init__(self, collection_interval: float = 10.0, history_size: int = 3600):
         self.collection_interval = collection_interval
-        self.metrics = defaultdict(list)
+        self.samples = MetricRing(self.SAMPLE_FIELDS, capacity=history_size)
         self.running = False
         self.thread = None
+        self._stop_event = threading.Event()
         self.logger = StructuredLogger('performance_monitor')
+        
+        self.process = psutil.Process()
+        # Первый вызов cpu_percent без интервала задает точку отсчета для дельт
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
     
     def start_monitoring(self):
         """Запуск мониторинга"""
@@ -323,6 +844,7 @@ class PerformanceMonitor:
             return
         
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._collect_metrics, daemon=True)
         self.thread.start()
         
@@ -332,80 +854,64 @@ class PerformanceMonitor:
     def stop_monitoring(self):
         """Остановка мониторинга"""
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=2.0)
         
         self.logger.info("Performance monitoring stopped")
     
+    def sample(self) -> Dict[str, float]:
+        """Один неблокирующий сэмпл, сохраняемый в кольцевой буфер"""
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        process_memory = self.process.memory_info()
+        
+        values = {
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': memory.percent,
+            'memory_available_gb': memory.available / (1024**3),
+            'disk_percent': (disk.used / disk.total) * 100,
+            'disk_free_gb': disk.free / (1024**3),
+            'process_cpu_percent': self.process.cpu_percent(interval=None),
+            'process_memory_rss_mb': process_memory.rss / (1024**2),
+            'process_memory_vms_mb': process_memory.vms / (1024**2),
+            'process_threads_count': self.process.num_threads()
+        }
+        
+        self.samples.append(time.time(), **values)
+        return values
+    
     def _collect_metrics(self):
         """Сбор метрик производительности"""
         while self.running:
             try:
-                timestamp = datetime.utcnow()
-                
-                # Системные метрики
-                cpu_percent = psutil.cpu_percent(interval=1)
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                
-                # Метрики процесса
-                process = psutil.Process()
-                process_memory = process.memory_info()
-                process_cpu = process.cpu_percent()
-                
-                metrics = {
-                    'timestamp': timestamp.isoformat(),
-                    'system': {
-                        'cpu_percent': cpu_percent,
-                        'memory_percent': memory.percent,
-                        'memory_available_gb': memory.available / (1024**3),
-                        'disk_percent': (disk.used / disk.total) * 100,
-                        'disk_free_gb': disk.free / (1024**3)
-                    },
-                    'process': {
-                        'cpu_percent': process_cpu,
-                        'memory_rss_mb': process_memory.rss / (1024**2),
-                        'memory_vms_mb': process_memory.vms / (1024**2),
-                        'threads_count': process.num_threads()
-                    }
-                }
-                
-                # Сохраняем метрики
-                self.metrics['system_metrics'].append(metrics)
+                values = self.sample()
                 
                 # Логируем если есть проблемы
-                if cpu_percent > 80:
+                if values['cpu_percent'] > 80:
                     self.logger.warning("High CPU usage detected", 
-                                      cpu_percent=cpu_percent)
+                                      cpu_percent=values['cpu_percent'])
                 
-                if memory.percent > 85:
+                if values['memory_percent'] > 85:
                     self.logger.warning("High memory usage detected", 
-                                      memory_percent=memory.percent)
-                
-                # Ограничиваем размер истории метрик
-                if len(self.metrics['system_metrics']) > 100:
-                    self.metrics['system_metrics'] = self.metrics['system_metrics'][-50:]
-                
-                time.sleep(self.collection_interval)
+                                      memory_percent=values['memory_percent'])
                 
             except Exception as e:
                 self.logger.error("Error collecting performance metrics", 
                                 error=str(e))
-                time.sleep(self.collection_interval)
+            
+            # Event вместо sleep: остановка не ждет конца интервала
+            self._stop_event.wait(self.collection_interval)
     
     def get_current_metrics(self) -> Dict[str, Any]:
         """Получение текущих метрик"""
         try:
-            cpu_percent = psutil.cpu_percent()
-            memory = psutil.virtual_memory()
-            process = psutil.Process()
-            
             return {
                 'timestamp': datetime.utcnow().isoformat(),
-                'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
-                'process_memory_mb': process.memory_info().rss / (1024**2),
-                'process_cpu_percent': process.cpu_percent()
+                'cpu_percent': psutil.cpu_percent(interval=None),
+                'memory_percent': psutil.virtual_memory().percent,
+                'process_memory_mb': self.process.memory_info().rss / (1024**2),
+                'process_cpu_percent': self.process.cpu_percent(interval=None)
             }
         except Exception as e:
             self.logger.error("Error getting current metrics", error=str(e))
@@ -413,61 +919,127 @@ class PerformanceMonitor:
     
     def get_metrics_summary(self, hours: int = 1) -> Dict[str, Any]:
         """Получение сводки метрик за период"""
-        if not self.metrics['system_metrics']:
+        if not self.samples.size:
             return {'error': 'No metrics available'}
         
-        # Фильтруем метрики за указанный период
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-        recent_metrics = [
-            m for m in self.metrics['system_metrics']
-            if datetime.fromisoformat(m['timestamp']) > cutoff_time
-        ]
+        # Окно за период - срезы массивов, без разбора строк времени
+        recent = self.samples.window(since=time.time() - hours * 3600)
+        count = len(recent['timestamp'])
         
-        if not recent_metrics:
+        if not count:
             return {'error': 'No recent metrics available'}
         
-        # Вычисляем статистику
-        cpu_values = [m['system']['cpu_percent'] for m in recent_metrics]
-        memory_values = [m['system']['memory_percent'] for m in recent_metrics]
+        cpu_values = recent['cpu_percent']
+        memory_values = recent['memory_percent']
         
         return {
             'period_hours': hours,
-            'metrics_count': len(recent_metrics),
+            'metrics_count': count,
             'cpu': {
-                'avg': sum(cpu_values) / len(cpu_values),
+                'avg': sum(cpu_values) / count,
                 'max': max(cpu_values),
                 'min': min(cpu_values)
             },
             'memory': {
-                'avg': sum(memory_values) / len(memory_values),
+                'avg': sum(memory_values) / count,
                 'max': max(memory_values),
                 'min': min(memory_values)
             }
         }
 
+class RequestBucket:
+    """Посекундная корзина статистики запросов"""
+    
+    def __init__(self, second: int):
+        self.second = second
+        self.count = 0
+        self.status_codes = defaultdict(int)
+        self.methods = defaultdict(int)
+        self.client_errors = 0
+        self.server_errors = 0
+        self.duration_sum = 0.0
+        self.duration_min = math.inf
+        self.duration_max = 0.0
+        # Разреженная гистограмма: номер корзины -> число запросов
+        self.histogram = defaultdict(int)
+
 class RequestTracker:
-    """Трекер HTTP запросов"""
+    """
+    Трекер HTTP запросов
+    
+    Статистика хранится в циклическом массиве посекундных корзин глубиной
+    в час: счетчики по статусам и методам, ошибки по классам (4xx/5xx) и
+    гистограмма длительностей с логарифмическими границами. Статистика за
+    окно - слияние его корзин, время которого не зависит от частоты запросов.
+    Гистограмма хранится разреженно: корзин много (относительная ошибка
+    процентилей ~1%), но занятых из них за секунду - единицы.
+    """
+    
+    WINDOW_SECONDS = 3600
+    # Гистограмма длительностей: корзины с шагом x1.02 от 0.1 мс до ~1 часа
+    # (0.1 * 1.02**879 мс); более долгие запросы попадают в последнюю корзину
+    DURATION_MIN_MS = 0.1
+    DURATION_RATIO = 1.02
+    HISTOGRAM_BINS = 880
     
     def __init__(self):
-        self.requests = deque(maxlen=1000)  # Последние 1000 запросов
+        self.buckets = [None] * self.WINDOW_SECONDS
+        self._log_ratio = math.log(self.DURATION_RATIO)
+        self._lock = threading.Lock()
         self.logger = StructuredLogger('request_tracker')
     
+    def _duration_bin(self, duration_ms: float) -> int:
+        if duration_ms <= self.DURATION_MIN_MS:
+            return 0
+        index = int(math.log(duration_ms / self.DURATION_MIN_MS) / self._log_ratio) + 1
+        return min(index, self.HISTOGRAM_BINS - 1)
+    
+    def _bin_value(self, index: int) -> float:
+        """Оценка длительности корзины - среднее геометрическое ее границ"""
+        if index == 0:
+            return self.DURATION_MIN_MS
+        return self.DURATION_MIN_MS * self.DURATION_RATIO ** (index - 0.5)
+    
     def track_request(self, method: str, path: str, status_code: int, 
                      duration: float, user_id: str = None, 
                      ip_address: str = None):
         """Трекинг HTTP запроса"""
+        duration_ms = duration * 1000
+        now = time.time()
+        second = int(now)
+        
+        with self._lock:
+            slot = second % self.WINDOW_SECONDS
+            bucket = self.buckets[slot]
+            if bucket is None or bucket.second != second:
+                # Корзина часовой давности переиспользуется под текущую секунду
+                bucket = self.buckets[slot] = RequestBucket(second)
+            
+            bucket.count += 1
+            bucket.status_codes[status_code] += 1
+            bucket.methods[method] += 1
+            if 400 <= status_code < 500:
+                bucket.client_errors += 1
+            elif status_code >= 500:
+                bucket.server_errors += 1
+            
+            bucket.duration_sum += duration_ms
+            if duration_ms < bucket.duration_min:
+                bucket.duration_min = duration_ms
+            if duration_ms > bucket.duration_max:
+                bucket.duration_max = duration_ms
+            bucket.histogram[self._duration_bin(duration_ms)] += 1
+        
         request_data = {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': datetime.utcfromtimestamp(now).isoformat(),
             'method': method,
             'path': path,
             'status_code': status_code,
-            'duration_ms': duration * 1000,
+            'duration_ms': duration_ms,
             'user_id': user_id,
             'ip_address': ip_address
         }
         
-        self.requests.append(request_data)
-        
         # Логируем запрос
         self.logger.info(f"{method} {path} - {status_code}", **request_data)
         
@@ -475,39 +1047,70 @@ class RequestTracker:
         if duration > 2.0:  # Более 2 секунд
             self.logger.warning("Slow request detected", **request_data)
     
+    def _percentile(self, histogram: Dict[int, int], total: int, p: float,
+                    low: float, high: float) -> float:
+        """Процентиль по объединенной гистограмме"""
+        rank = p * (total - 1)
+        cumulative = 0
+        for index, count in sorted(histogram.items()):
+            cumulative += count
+            if cumulative > rank:
+                return min(max(self._bin_value(index), low), high)
+        return high
+    
     def get_request_stats(self, minutes: int = 10) -> Dict[str, Any]:
-        """Статистика запросов за период"""
-        cutoff_time = datetime.utcnow() - timedelta(minutes=minutes)
+        """Статистика запросов за период (не больше часа)"""
+        window = min(int(minutes * 60), self.WINDOW_SECONDS)
+        now_second = int(time.time())
         
-        recent_requests = [
-            req for req in self.requests
-            if datetime.fromisoformat(req['timestamp']) > cutoff_time
-        ]
-        
-        if not recent_requests:
-            return {'total_requests': 0}
-        
-        # Статистика по статус кодам
+        total = 0
+        client_errors = server_errors = 0
+        duration_sum = 0.0
+        duration_min = math.inf
+        duration_max = 0.0
         status_codes = defaultdict(int)
-        durations = []
         methods = defaultdict(int)
+        histogram = defaultdict(int)
+        
+        # Слияние корзин окна: O(окно), а не O(число запросов)
+        with self._lock:
+            for second in range(now_second - window + 1, now_second + 1):
+                bucket = self.buckets[second % self.WINDOW_SECONDS]
+                if bucket is None or bucket.second != second:
+                    continue
+                
+                total += bucket.count
+                client_errors += bucket.client_errors
+                server_errors += bucket.server_errors
+                duration_sum += bucket.duration_sum
+                duration_min = min(duration_min, bucket.duration_min)
+                duration_max = max(duration_max, bucket.duration_max)
+                for code, count in bucket.status_codes.items():
+                    status_codes[code] += count
+                for method, count in bucket.methods.items():
+                    methods[method] += count
+                for index, count in bucket.histogram.items():
+                    histogram[index] += count
         
-        for req in recent_requests:
-            status_codes[req['status_code']] += 1
-            durations.append(req['duration_ms'])
-            methods[req['method']] += 1
+        if not total:
+            return {'total_requests': 0}
         
         return {
             'period_minutes': minutes,
-            'total_requests': len(recent_requests),
+            'total_requests': total,
             'status_codes': dict(status_codes),
             'methods': dict(methods),
             'duration_stats': {
-                'avg_ms': sum(durations) / len(durations),
-                'max_ms': max(durations),
-                'min_ms': min(durations)
+                'avg_ms': duration_sum / total,
+                'max_ms': duration_max,
+                'min_ms': duration_min,
+                'p50_ms': self._percentile(histogram, total, 0.5, duration_min, duration_max),
+                'p95_ms': self._percentile(histogram, total, 0.95, duration_min, duration_max),
+                'p99_ms': self._percentile(histogram, total, 0.99, duration_min, duration_max)
             },
-            'error_rate': (status_codes.get(500, 0) + status_codes.get(400, 0)) / len(recent_requests)
+            'error_rate': (client_errors + server_errors) / total,
+            'client_error_rate': client_errors / total,
+            'server_error_rate': server_errors / total
         }
 
 def performance_monitoring_demo():
@@ -540,6 +1143,9 @@ def performance_monitoring_demo():
     current_metrics = monitor.get_current_metrics()
     print(f"Текущие метрики: {json.dumps(current_metrics, indent=2)}")
     
+    metrics_summary = monitor.get_metrics_summary(hours=1)
+    print(f"Сводка системных метрик: {json.dumps(metrics_summary, indent=2)}")
+    
     request_stats = request_tracker.get_request_stats(minutes=1)
     print(f"Статистика запросов: {json.dumps(request_stats, indent=2)}")
     
@@ -563,15 +1169,55 @@ class Alert:
     timestamp: datetime
     tags: Dict[str, str]
     resolved: bool = False
+    fingerprint: str = ''
+    occurrences: int = 1
+    last_seen: Optional[datetime] = None
 
 class AlertManager:
-    """Менеджер системы оповещений"""
-    
-    def __init__(self):
+    """
+    Менеджер системы оповещений
+    
+    Активные оповещения индексируются по уровню и по отпечатку (источник,
+    заголовок, теги). Повторное срабатывание с тем же отпечатком не создает
+    новое оповещение, а увеличивает счетчик; обработчики уведомляются снова
+    не чаще renotify_interval секунд или сразу при смене уровня. Обработчики
+    вызываются в пуле потоков с ограниченной очередью, поэтому медленный
+    обработчик (например, SMTP) не задерживает проверку метрик. В очередь
+    попадает снимок оповещения, а не живой объект; close() дожидается
+    доставки и останавливает пул.
+    """
+    
+    def __init__(self, renotify_interval: float = 300.0, dispatch_workers: int = 4,
+                 dispatch_queue_size: int = 1000):
         self.alerts = {}
         self.handlers = []
         self.rules = []
+        self.renotify_interval = renotify_interval
         self.logger = StructuredLogger('alert_manager')
+        
+        # Индексы активных оповещений; словари сохраняют порядок создания
+        self._active_by_level = defaultdict(dict)  # уровень -> {id: Alert}
+        self._active_by_fingerprint = {}  # отпечаток -> Alert
+        self._last_notified = {}  # отпечаток -> время последнего уведомления
+        self._lock = threading.RLock()
+        self._closed = False
+        
+        self.stats = {
+            'created': 0,
+            'deduplicated': 0,
+            'notifications': 0,
+            'dropped_notifications': 0,
+            'handler_errors': 0
+        }
+        
+        # Пул обработчиков с ограниченной очередью
+        self._dispatch_queue = queue.Queue(maxsize=dispatch_queue_size)
+        self._workers = [
+            threading.Thread(target=self._dispatch_worker, name=f"alert-dispatch-{i}", daemon=True)
+            for i in range(dispatch_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
     
     def add_handler(self, handler):
         """Добавление обработчика оповещений"""
@@ -581,60 +1227,171 @@ class AlertManager:
         """Добавление правила для генерации оповещений"""
         self.rules.append(rule)
     
+    @staticmethod
+    def make_fingerprint(source: str, title: str, tags: Dict[str, str] = None) -> str:
+        """Отпечаток для группировки повторных оповещений"""
+        tag_str = ','.join(f"{k}={v}" for k, v in sorted((tags or {}).items()))
+        return f"{source}|{title}|{tag_str}"
+    
     def create_alert(self, level: str, title: str, message: str, 
                     source: str, tags: Dict[str, str] = None) -> Alert:
-        """Создание оповещения"""
-        alert = Alert(
-            id=f"alert_{int(time.time())}_{len(self.alerts)}",
-            level=level,
-            title=title,
-            message=message,
-            source=source,
-            timestamp=datetime.utcnow(),
-            tags=tags or {}
-        )
+        """Создание оповещения (или обновление активного с тем же отпечатком)"""
+        fingerprint = self.make_fingerprint(source, title, tags)
+        now = time.time()
         
-        self.alerts[alert.id] = alert
+        with self._lock:
+            alert = self._active_by_fingerprint.get(fingerprint)
+            
+            if alert is not None:
+                # Повторное срабатывание: группируем с активным оповещением
+                alert.occurrences += 1
+                alert.last_seen = datetime.utcnow()
+                alert.message = message
+                self.stats['deduplicated'] += 1
+                
+                escalated = alert.level != level
+                if escalated:
+                    del self._active_by_level[alert.level][alert.id]
+                    alert.level = level
+                    self._index_by_level(alert)
+                
+                notify = escalated or now - self._last_notified[fingerprint] >= self.renotify_interval
+            else:
+                alert = Alert(
+                    id=f"alert_{int(now)}_{len(self.alerts)}",
+                    level=level,
+                    title=title,
+                    message=message,
+                    source=source,
+                    timestamp=datetime.utcnow(),
+                    tags=tags or {},
+                    fingerprint=fingerprint
+                )
+                alert.last_seen = alert.timestamp
+                
+                self.alerts[alert.id] = alert
+                self._index_by_level(alert)
+                self._active_by_fingerprint[fingerprint] = alert
+                self.stats['created'] += 1
+                notify = True
+                
+                # Логируем создание оповещения
+                self.logger.info(f"Alert created: {alert.title}", 
+                                alert_id=alert.id,
+                                level=alert.level,
+                                source=alert.source,
+                                tags=alert.tags)
+            
+            if notify:
+                self._last_notified[fingerprint] = now
+                # Снимок под блокировкой: обработчик в пуле не должен видеть
+                # изменения от последующих срабатываний
+                snapshot = replace(alert, tags=dict(alert.tags))
         
-        # Логируем создание оповещения
-        self.logger.info(f"Alert created: {alert.title}", 
-                        alert_id=alert.id,
-                        level=alert.level,
-                        source=alert.source,
-                        tags=alert.tags)
+        if notify:
+            self._dispatch(snapshot)
+        
+        return alert
+    
+    def _index_by_level(self, alert: Alert):
+        """Добавление в индекс уровня с сохранением порядка по времени"""
+        alerts = self._active_by_level[alert.level]
+        newest = next(reversed(alerts.values()), None)
+        alerts[alert.id] = alert
+        
+        if newest is not None and newest.timestamp > alert.timestamp:
+            # Редкий случай (смена уровня старого оповещения) - пересортировка
+            self._active_by_level[alert.level] = dict(
+                sorted(alerts.items(), key=lambda item: item[1].timestamp)
+            )
+    
+    def _dispatch(self, alert: Alert):
+        """Постановка уведомлений в очередь пула (без ожидания)"""
+        if self._closed:
+            return
         
-        # Отправляем оповещение всем обработчикам
         for handler in self.handlers:
+            try:
+                self._dispatch_queue.put_nowait((handler, alert))
+            except queue.Full:
+                self.stats['dropped_notifications'] += 1
+                self.logger.warning("Alert dispatch queue is full, notification dropped",
+                                    alert_id=alert.id,
+                                    handler=handler.__class__.__name__)
+    
+    def _dispatch_worker(self):
+        """Поток пула: вызов обработчиков"""
+        while True:
+            item = self._dispatch_queue.get()
+            if item is None:
+                # Сигнал остановки от close()
+                self._dispatch_queue.task_done()
+                break
+            
+            handler, alert = item
             try:
                 handler.handle_alert(alert)
+                with self._lock:
+                    self.stats['notifications'] += 1
             except Exception as e:
+                with self._lock:
+                    self.stats['handler_errors'] += 1
                 self.logger.error(f"Alert handler failed: {handler.__class__.__name__}", 
                                 error=str(e))
+            finally:
+                self._dispatch_queue.task_done()
+    
+    def flush(self):
+        """Ожидание доставки всех поставленных уведомлений"""
+        self._dispatch_queue.join()
+    
+    def close(self, timeout: float = None):
+        """Доставка поставленных уведомлений и остановка пула обработчиков"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
         
-        return alert
+        # По одному сигналу на поток: каждый выходит после своего None,
+        # уведомления, поставленные раньше, доставляются
+        for _ in self._workers:
+            self._dispatch_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
     
     def resolve_alert(self, alert_id: str) -> bool:
         """Разрешение оповещения"""
-        if alert_id in self.alerts:
-            self.alerts[alert_id].resolved = True
-            self.logger.info(f"Alert resolved", alert_id=alert_id)
-            return True
-        return False
+        with self._lock:
+            alert = self.alerts.get(alert_id)
+            if alert is None:
+                return False
+            
+            if not alert.resolved:
+                alert.resolved = True
+                self._active_by_level[alert.level].pop(alert_id, None)
+                if self._active_by_fingerprint.get(alert.fingerprint) is alert:
+                    del self._active_by_fingerprint[alert.fingerprint]
+                    self._last_notified.pop(alert.fingerprint, None)
+        
+        self.logger.info(f"Alert resolved", alert_id=alert_id)
+        return True
+    
+    def get_active_alert(self, fingerprint: str) -> Optional[Alert]:
+        """Активное оповещение с данным отпечатком"""
+        with self._lock:
+            return self._active_by_fingerprint.get(fingerprint)
     
     def get_active_alerts(self, level: str = None) -> List[Alert]:
-        """Получение активных оповещений"""
-        active_alerts = [
-            alert for alert in self.alerts.values()
-            if not alert.resolved
-        ]
-        
-        if level:
-            active_alerts = [
-                alert for alert in active_alerts
-                if alert.level == level
-            ]
-        
-        return sorted(active_alerts, key=lambda a: a.timestamp, reverse=True)
+        """Получение активных оповещений (новые первыми)"""
+        with self._lock:
+            if level:
+                return list(reversed(self._active_by_level[level].values()))
+            
+            # Индексы уровней упорядочены по времени - слияние через кучу
+            return list(heapq.merge(
+                *(reversed(alerts.values()) for alerts in self._active_by_level.values()),
+                key=lambda a: a.timestamp, reverse=True
+            ))
     
     def check_metrics_for_alerts(self, metrics: Dict[str, Any]):
         """Проверка метрик на соответствие правилам оповещений"""
@@ -698,6 +1455,218 @@ class HighMemoryRule(AlertRule):
             'tags': {'metric': 'memory_usage', 'threshold': str(self.threshold)}
         }
 
+@dataclass
+class RuleSpec:
+    """Декларативное правило: metric <comparator> threshold"""
+    name: str
+    metric: str
+    comparator: str  # >, >=, <, <=, ==, !=
+    threshold: float
+    for_seconds: float = 0.0  # сколько условие должно держаться до срабатывания
+    window: float = 0.0  # окно агрегации в секундах (0 - последнее значение)
+    aggregation: str = 'avg'  # avg, max, min, last
+    hysteresis: float = 0.0  # запас, на который метрика должна вернуться для сброса
+    level: str = 'WARNING'
+
+class RuleEngine:
+    """
+    Движок правил оповещений над кольцевыми буферами метрик
+    
+    Правила компилируются в группы по (метрика, окно, агрегация): агрегат
+    считается один раз на серию для всей группы, а сравнение с порогами
+    выполняется одной операцией NumPy над матрицей серии x правила.
+    Состояние (ожидание for_seconds и срабатывание с гистерезисом) хранится
+    в массивах по каждой паре серия/правило.
+    
+    Агрегат окна считается по np.frombuffer-представлению массивов
+    MetricRing под его блокировкой, без копирования сэмплов. Последнее
+    значение старше stale_after секунд считается отсутствием данных.
+    NumPy импортируется при создании движка: остальному модулю он не нужен.
+    """
+    
+    # Имена функций NumPy - модуль импортируется только в __init__
+    COMPARATORS = {
+        '>': 'greater', '>=': 'greater_equal',
+        '<': 'less', '<=': 'less_equal',
+        '==': 'equal', '!=': 'not_equal'
+    }
+    AGGREGATIONS = {'avg': 'nanmean', 'max': 'nanmax', 'min': 'nanmin', 'last': None}
+    
+    def __init__(self, rules: List[RuleSpec], stale_after: float = 60.0):
+        self._np = np = importlib.import_module('numpy')
+        
+        for rule in rules:
+            if rule.comparator not in self.COMPARATORS:
+                raise ValueError(f"Неизвестный оператор сравнения: {rule.comparator}")
+            if rule.aggregation not in self.AGGREGATIONS:
+                raise ValueError(f"Неизвестная агрегация: {rule.aggregation}")
+        
+        self.rules = list(rules)
+        self.stale_after = stale_after
+        self.groups = self._compile(self.rules)
+        self._for_seconds = np.array([rule.for_seconds for rule in self.rules])
+        
+        # Состояние: строка - серия, столбец - правило
+        self._rows = {}
+        self._firing = np.zeros((0, len(self.rules)), dtype=bool)
+        self._pending_since = np.full((0, len(self.rules)), np.nan)
+    
+    def _compile(self, rules: List[RuleSpec]) -> List[Dict[str, Any]]:
+        """Группировка правил и подготовка массивов порогов"""
+        np = self._np
+        grouped = defaultdict(list)
+        for index, rule in enumerate(rules):
+            aggregation = 'last' if rule.window <= 0 else rule.aggregation
+            grouped[(rule.metric, rule.window, aggregation)].append(index)
+        
+        groups = []
+        for (metric, window, aggregation), indexes in grouped.items():
+            by_comparator = defaultdict(list)
+            for index in indexes:
+                by_comparator[rules[index].comparator].append(index)
+            
+            comparisons = []
+            for comparator, rule_indexes in by_comparator.items():
+                thresholds = np.array([rules[i].threshold for i in rule_indexes])
+                hysteresis = np.array([rules[i].hysteresis for i in rule_indexes])
+                
+                # Порог сброса: для "больше" ниже порога, для "меньше" - выше
+                if comparator in ('>', '>='):
+                    clear_thresholds = thresholds - hysteresis
+                elif comparator in ('<', '<='):
+                    clear_thresholds = thresholds + hysteresis
+                else:
+                    clear_thresholds = thresholds
+                
+                comparisons.append((getattr(np, self.COMPARATORS[comparator]), np.array(rule_indexes),
+                                    thresholds, clear_thresholds))
+            
+            groups.append({
+                'metric': metric,
+                'window': window,
+                'aggregation': aggregation,
+                'comparisons': comparisons
+            })
+        
+        return groups
+    
+    def _row_indexes(self, names: List[str]):
+        """Строки состояния для серий (новые серии добавляются)"""
+        np = self._np
+        new_names = [name for name in names if name not in self._rows]
+        if new_names:
+            for name in new_names:
+                self._rows[name] = len(self._rows)
+            extra = len(new_names)
+            self._firing = np.vstack([self._firing, np.zeros((extra, len(self.rules)), dtype=bool)])
+            self._pending_since = np.vstack([self._pending_since,
+                                             np.full((extra, len(self.rules)), np.nan)])
+        
+        return np.array([self._rows[name] for name in names], dtype=np.intp)
+    
+    def _aggregate(self, ring: MetricRing, metric: str, window: float,
+                   aggregation: str, now: float) -> float:
+        """Агрегат метрики серии за окно"""
+        np = self._np
+        
+        if aggregation == 'last':
+            last = ring.last(metric)
+            if last is None or now - last[0] > self.stale_after:
+                return np.nan
+            return last[1]
+        
+        def reducer(column, segments):
+            # Представления над памятью array('d') - сэмплы не копируются
+            data = np.frombuffer(column)
+            parts = [data[start:end] for start, end in segments if end > start]
+            if not parts:
+                return np.nan
+            
+            if aggregation == 'avg':
+                count = sum(part.size - np.count_nonzero(np.isnan(part)) for part in parts)
+                return sum(np.nansum(part) for part in parts) / count if count else np.nan
+            
+            reduce = getattr(np, self.AGGREGATIONS[aggregation])
+            return reduce([reduce(part) for part in parts])
+        
+        return ring.reduce_window(now - window, metric, reducer)
+    
+    def evaluate(self, series: Dict[str, MetricRing], now: float = None):
+        """
+        Оценка всех правил по всем сериям
+        
+        Возвращает (сработавшие, сброшенные) - списки (правило, серия, значение).
+        """
+        np = self._np
+        now = time.time() if now is None else now
+        names = list(series)
+        rows = self._row_indexes(names)
+        
+        shape = (len(names), len(self.rules))
+        values = np.full(shape, np.nan)
+        breach = np.zeros(shape, dtype=bool)
+        clear = np.zeros(shape, dtype=bool)
+        
+        for group in self.groups:
+            # Один агрегат на серию для всех правил группы
+            column = np.array([
+                self._aggregate(series[name], group['metric'], group['window'],
+                                group['aggregation'], now)
+                for name in names
+            ])[:, None]
+            has_data = ~np.isnan(column)
+            
+            for compare, rule_indexes, thresholds, clear_thresholds in group['comparisons']:
+                values[:, rule_indexes] = column
+                breach[:, rule_indexes] = compare(column, thresholds)
+                # Без данных состояние не меняется
+                clear[:, rule_indexes] = ~compare(column, clear_thresholds) & has_data
+        
+        firing = self._firing[rows]
+        pending_since = self._pending_since[rows]
+        
+        # Ожидание for_seconds: отсчет с первого нарушения, сброс при его отсутствии
+        pending_since = np.where(breach & np.isnan(pending_since), now, pending_since)
+        pending_since = np.where(breach, pending_since, np.nan)
+        
+        fired = ~firing & breach & (now - pending_since >= self._for_seconds)
+        resolved = firing & clear
+        
+        self._firing[rows] = (firing & ~clear) | fired
+        self._pending_since[rows] = pending_since
+        
+        return (
+            [(self.rules[r], names[s], float(values[s, r])) for s, r in zip(*np.nonzero(fired))],
+            [(self.rules[r], names[s], float(values[s, r])) for s, r in zip(*np.nonzero(resolved))]
+        )
+    
+    @staticmethod
+    def _alert_tags(rule: RuleSpec) -> Dict[str, str]:
+        return {'metric': rule.metric, 'threshold': str(rule.threshold)}
+    
+    def apply(self, alert_manager: 'AlertManager', series: Dict[str, MetricRing],
+              now: float = None):
+        """Оценка правил с созданием и разрешением оповещений"""
+        fired, resolved = self.evaluate(series, now)
+        
+        for rule, name, value in fired:
+            alert_manager.create_alert(
+                level=rule.level,
+                title=rule.name,
+                message=f"{rule.metric} ({rule.aggregation}) = {value:.2f} "
+                        f"{rule.comparator} {rule.threshold}",
+                source=name,
+                tags=self._alert_tags(rule)
+            )
+        
+        for rule, name, value in resolved:
+            fingerprint = alert_manager.make_fingerprint(name, rule.name, self._alert_tags(rule))
+            alert = alert_manager.get_active_alert(fingerprint)
+            if alert:
+                alert_manager.resolve_alert(alert.id)
+        
+        return fired, resolved
+
 class ConsoleAlertHandler:
     """Обработчик оповещений для консоли"""
     
@@ -804,6 +1773,13 @@ def alerting_system_demo():
     for i, metrics in enumerate(test_metrics):
         print(f"\nТест {i+1}: CPU={metrics['cpu_percent']}%, Memory={metrics['memory_percent']}%")
         alert_manager.check_metrics_for_alerts(metrics)
+        alert_manager.flush()
+    
+    # Повторная проверка: те же оповещения группируются, а не создаются заново
+    for metrics in test_metrics:
+        alert_manager.check_metrics_for_alerts(metrics)
+    alert_manager.flush()
+    print(f"Статистика оповещений: {alert_manager.stats}")
     
     # Создание ручного оповещения
     manual_alert = alert_manager.create_alert(
@@ -813,6 +1789,7 @@ def alerting_system_demo():
         source='database_monitor',
         tags={'database': 'primary', 'service': 'user_api'}
     )
+    alert_manager.flush()
     
     # Получение активных оповещений
     active_alerts = alert_manager.get_active_alerts()
@@ -826,8 +1803,79 @@ def alerting_system_demo():
         alert_manager.resolve_alert(active_alerts[0].id)
         print(f"\nРазрешено оповещение: {active_alerts[0].id}")
     
+    alert_manager.close()
     return alert_manager
 
+def rule_engine_demo():
+    """Демонстрация движка правил над кольцевыми буферами"""
+    print("\n=== Rule Engine Demo ===")
+    
+    # 200 серий (например, хостов) с историей метрик за 2 минуты
+    now = time.time()
+    series = {}
+    for host in range(200):
+        ring = MetricRing(['cpu_percent', 'memory_percent'], capacity=120)
+        base_cpu = 40 + host % 50
+        for second in range(120):
+            ring.append(now - 119 + second,
+                        cpu_percent=base_cpu + 10 * math.sin(second / 10 + host),
+                        memory_percent=50 + host % 40)
+        series[f"host-{host}"] = ring
+    
+    # 2000 правил: разные пороги, окна и агрегации по двум метрикам
+    rules = []
+    for i in range(2000):
+        metric = 'cpu_percent' if i % 2 else 'memory_percent'
+        rules.append(RuleSpec(
+            name=f"{metric} rule {i}",
+            metric=metric,
+            comparator='>' if i % 3 else '>=',
+            threshold=60 + i % 35,
+            window=(0, 30, 60)[i % 3],
+            aggregation=('avg', 'max')[i % 2],
+            hysteresis=2.0
+        ))
+    
+    engine = RuleEngine(rules)
+    print(f"Правил: {len(rules)}, групп после компиляции: {len(engine.groups)}, серий: {len(series)}")
+    
+    start = time.perf_counter()
+    fired, resolved = engine.evaluate(series, now)
+    engine_time = time.perf_counter() - start
+    
+    # Для сравнения: каждое правило по каждой серии отдельно
+    import numpy as np
+    start = time.perf_counter()
+    naive_fired = 0
+    for ring in series.values():
+        for rule in rules:
+            if rule.window > 0:
+                data = ring.window(since=now - rule.window)[rule.metric]
+                value = {'avg': lambda v: sum(v) / len(v), 'max': max}[rule.aggregation](data)
+            else:
+                value = ring.last(rule.metric)[1]
+            naive_fired += getattr(np, RuleEngine.COMPARATORS[rule.comparator])(value, rule.threshold)
+    naive_time = time.perf_counter() - start
+    
+    print(f"Сработало: {len(fired)} (поштучная проверка: {naive_fired})")
+    print(f"Движок: {engine_time * 1000:.1f} мс, поштучно: {naive_time * 1000:.1f} мс")
+    
+    # Повторная оценка: уже сработавшие правила не срабатывают снова
+    fired_again, _ = engine.evaluate(series, now + 1)
+    print(f"Повторная оценка: новых срабатываний {len(fired_again)}")
+    
+    # Интеграция с AlertManager
+    alert_manager = AlertManager()
+    engine = RuleEngine([
+        RuleSpec('High CPU Usage', 'cpu_percent', '>', 80.0, window=30, hysteresis=5.0),
+        RuleSpec('High Memory Usage', 'memory_percent', '>', 85.0, level='ERROR')
+    ])
+    engine.apply(alert_manager, series, now)
+    print(f"Активных оповещений: {len(alert_manager.get_active_alerts())}")
+    alert_manager.close()
+    
+    return engine
+
 # =============================================================================
 # Пример 5: Мониторинг базы данных и запросов
 # =============================================================================
@@ -1070,6 +2118,7 @@ def main():
     
     # 4. Система оповещений
     alert_manager = alerting_system_demo()
+    rule_engine = rule_engine_demo()
     
     # 5. Мониторинг базы данных
     db_monitor = database_monitoring_demo()
@@ -1080,6 +2129,7 @@ def main():
     print("✅ Мониторинг производительности системы и приложения")
     print("✅ Трекинг HTTP запросов и метрик")
     print("✅ Система оповещений с правилами и обработчиками")
+    print("✅ Векторизованная проверка тысяч правил по кольцевым буферам")
     print("✅ Мониторинг базы данных и SQL запросов")
     print("✅ Сбор и анализ метрик в реальном времени")
     print("✅ Интеграция с системами уведомлений")
@@ -16,6 +16,8 @@ from dataclasses import dataclass, asdict
 from pathlib import Path
 import traceback
 import functools
+import importlib
+import math
 import psutil
 import queue
 import sqlite3
@@ -86,48 +88,119 @@ class AdvancedLogger:
 # Решение:
 import uuid
 import asyncio
-from threading import local
+import random
+import contextvars
+import itertools
+from collections import OrderedDict
+
+# Один ContextVar на модуль: переменные не удаляются и копируются в каждый
+# контекст, поэтому экземпляры LogContext хранят данные в общем словаре
+# {номер экземпляра: словарь контекста}
+_log_contexts = contextvars.ContextVar('log_contexts', default=None)
+_log_context_keys = itertools.count()
 
 class LogContext:
-    """Контекст логирования для хранения данных запроса"""
+    """
+    Контекст логирования для хранения данных запроса
+    
+    Данные хранятся в модульном contextvars.ContextVar: у каждой задачи
+    asyncio свой контекст, и значения одной корутины не видны другим на том
+    же цикле событий. Каждый экземпляр (логгер) - отдельный ключ в общем
+    словаре. Словари никогда не меняются на месте - set() и update()
+    подставляют новую копию (copy-on-write), поэтому новая задача получает
+    контекст родителя без копирования, а ее изменения не видны родителю.
+    """
     
     def __init__(self):
-        self.data = local()
+        self._key = next(_log_context_keys)
+    
+    def _current(self) -> Dict[str, Any]:
+        return (_log_contexts.get() or {}).get(self._key) or {}
+    
+    def _store(self, context: Optional[Dict[str, Any]]):
+        """Подстановка копии общего словаря с новым контекстом экземпляра"""
+        contexts = dict(_log_contexts.get() or {})
+        if context:
+            contexts[self._key] = context
+        else:
+            contexts.pop(self._key, None)
+        _log_contexts.set(contexts)
     
     def set(self, key: str, value: Any):
         """Установка значения в контекст"""
-        if not hasattr(self.data, 'context'):
-            self.data.context = {}
-        self.data.context[key] = value
+        self.update(**{key: value})
+    
+    def update(self, **values):
+        """Установка нескольких значений одной копией словаря"""
+        context = dict(self._current())
+        context.update(values)
+        self._store(context)
     
     def get(self, key: str, default: Any = None) -> Any:
         """Получение значения из контекста"""
-        if not hasattr(self.data, 'context'):
-            return default
-        return self.data.context.get(key, default)
+        return self._current().get(key, default)
     
     def clear(self):
         """Очистка контекста"""
-        if hasattr(self.data, 'context'):
-            self.data.context.clear()
+        self._store(None)
     
     def get_all(self) -> Dict[str, Any]:
         """Получение всего контекста"""
-        if not hasattr(self.data, 'context'):
-            return {}
-        return self.data.context.copy()
+        return dict(self._current())
+    
+    @contextmanager
+    def scope(self, **values):
+        """Значения только внутри блока with (например, на время запроса)"""
+        previous = self._current()
+        self._store(dict(previous, **values))
+        try:
+            yield self
+        finally:
+            # Восстанавливаем только свой ключ - контексты других логгеров,
+            # измененные внутри блока, не откатываются
+            self._store(previous)
+    
+    @staticmethod
+    def bind(func: Callable) -> Callable:
+        """Функция для executor'а, выполняемая в копии текущего контекста"""
+        context = contextvars.copy_context()
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.run(func, *args, **kwargs)
+        
+        return wrapper
 
 class TraceManager:
-    """Менеджер трассировки операций"""
+    """
+    Менеджер трассировки операций
     
-    def __init__(self):
+    Завершенные трассировки хранятся в OrderedDict с вытеснением самых
+    старых (поиск по id - O(1)). Логи сохраняются только для доли
+    log_sample_rate трассировок (решение наследуется дочерними) и не больше
+    max_logs_per_trace на трассировку.
+    """
+    
+    def __init__(self, max_completed: int = 1000, log_sample_rate: float = 1.0,
+                 max_logs_per_trace: int = 100):
         self.active_traces = {}
-        self.completed_traces = deque(maxlen=1000)
+        self.completed_traces = OrderedDict()
+        self.max_completed = max_completed
+        self.log_sample_rate = log_sample_rate
+        self.max_logs_per_trace = max_logs_per_trace
+        self._lock = threading.Lock()
     
     def start_trace(self, operation: str, parent_trace_id: str = None) -> str:
         """Начало новой трассировки"""
         trace_id = str(uuid.uuid4())
         
+        # Дочерняя трассировка следует решению родителя о сэмплировании
+        parent = self.active_traces.get(parent_trace_id) if parent_trace_id else None
+        if parent is not None:
+            sampled = parent['sampled']
+        else:
+            sampled = random.random() < self.log_sample_rate
+        
         trace_data = {
             'trace_id': trace_id,
             'operation': operation,
@@ -137,7 +210,9 @@ class TraceManager:
             'duration_ms': None,
             'success': None,
             'metadata': {},
-            'logs': []
+            'sampled': sampled,
+            'logs': [],
+            'dropped_logs': 0
         }
         
         self.active_traces[trace_id] = trace_data
@@ -145,64 +220,360 @@ class TraceManager:
     
     def end_trace(self, trace_id: str, success: bool = True, **metadata):
         """Завершение трассировки"""
-        if trace_id not in self.active_traces:
+        trace = self.active_traces.pop(trace_id, None)
+        if trace is None:
             return False
         
-        trace = self.active_traces[trace_id]
         trace['end_time'] = datetime.utcnow()
         trace['duration_ms'] = (trace['end_time'] - trace['start_time']).total_seconds() * 1000
         trace['success'] = success
         trace['metadata'].update(metadata)
         
-        # Перемещаем в завершенные
-        self.completed_traces.append(trace)
-        del self.active_traces[trace_id]
+        # Перемещаем в завершенные с вытеснением самых старых
+        with self._lock:
+            self.completed_traces[trace_id] = trace
+            while len(self.completed_traces) > self.max_completed:
+                self.completed_traces.popitem(last=False)
         
         return True
     
     def add_log_to_trace(self, trace_id: str, log_record: Dict[str, Any]):
         """Добавление лога к трассировке"""
-        if trace_id in self.active_traces:
-            self.active_traces[trace_id]['logs'].append(log_record)
+        trace = self.active_traces.get(trace_id)
+        if trace is None or not trace['sampled']:
+            return
+        
+        if len(trace['logs']) < self.max_logs_per_trace:
+            trace['logs'].append(log_record)
+        else:
+            trace['dropped_logs'] += 1
     
     def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
         """Получение трассировки"""
-        if trace_id in self.active_traces:
-            return self.active_traces[trace_id].copy()
-        
-        for trace in self.completed_traces:
-            if trace['trace_id'] == trace_id:
-                return trace.copy()
-        
-        return None
+        trace = self.active_traces.get(trace_id) or self.completed_traces.get(trace_id)
+        return trace.copy() if trace is not None else None
 
-class MetricsCollector:
-    """Сборщик метрик"""
+class DDSketch:
+    """
+    Потоковая гистограмма с ограниченной относительной ошибкой (DDSketch)
+    
+    Значение v попадает в корзину ceil(log_gamma(v)), поэтому любой
+    процентиль восстанавливается с относительной ошибкой не больше
+    relative_accuracy. Память ограничена max_buckets (при переполнении
+    сливаются корзины самых маленьких значений), а два скетча с одинаковой
+    точностью объединяются сложением счетчиков корзин.
+    """
+    
+    MIN_INDEXABLE = 1e-9
+    
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy должна быть в интервале (0, 1)")
+        
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        
+        self.positive = defaultdict(int)
+        self.negative = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+    
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+    
+    def _collapse(self, store: Dict[int, int]):
+        """Слияние корзин с наименьшими по модулю значениями"""
+        indexes = sorted(store)
+        excess = len(indexes) - self.max_buckets
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            store[target] += store.pop(index)
+    
+    def add(self, value: float, count: int = 1):
+        """Добавление значения"""
+        if value > self.MIN_INDEXABLE:
+            store = self.positive
+            store[self._index(value)] += count
+        elif value < -self.MIN_INDEXABLE:
+            store = self.negative
+            store[self._index(-value)] += count
+        else:
+            store = None
+            self.zero_count += count
+        
+        if store is not None and len(store) > self.max_buckets:
+            self._collapse(store)
+        
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    
+    def merge(self, other: 'DDSketch'):
+        """Объединение с другим скетчем той же точности"""
+        if other.gamma != self.gamma:
+            raise ValueError("Объединять можно только скетчи с одинаковой точностью")
+        
+        for store, other_store in ((self.positive, other.positive),
+                                   (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] += count
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+        
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def quantiles(self, qs: List[float]) -> List[Optional[float]]:
+        """Несколько процентилей за один проход по корзинам"""
+        if not self.count:
+            return [None] * len(qs)
+        
+        # Корзины в порядке возрастания значений
+        buckets = [(-self._value(index), count)
+                   for index, count in sorted(self.negative.items(), reverse=True)]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend((self._value(index), count)
+                       for index, count in sorted(self.positive.items()))
+        
+        results = [None] * len(qs)
+        order = sorted(range(len(qs)), key=lambda i: qs[i])
+        position = 0
+        cumulative = buckets[0][1]
+        
+        for i in order:
+            rank = qs[i] * (self.count - 1)
+            while cumulative <= rank and position < len(buckets) - 1:
+                position += 1
+                cumulative += buckets[position][1]
+            # Оценка корзины не выходит за реально наблюдавшиеся границы
+            results[i] = min(max(buckets[position][0], self.min), self.max)
+        
+        return results
+    
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализуемое состояние для передачи между процессами"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'positive': list(self.positive.items()),
+            'negative': list(self.negative.items()),
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max
+        }
     
-    def __init__(self):
-        self.counters = defaultdict(int)
-        self.histograms = defaultdict(list)
-        self.gauges = {}
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DDSketch':
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.positive.update((int(index), count) for index, count in data['positive'])
+        sketch.negative.update((int(index), count) for index, count in data['negative'])
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+class Counter:
+    """
+    Счетчик с шардами по потокам
+    
+    Каждый поток увеличивает собственную ячейку, поэтому inc() - это одно
+    сложение без блокировок и строковых операций. Ячейки суммируются только
+    при чтении value; ячейки завершившихся потоков сворачиваются в общий итог.
+    """
+    
+    def __init__(self, key: str):
+        self.key = key
+        self._local = threading.local()
+        self._cells = []  # [значение, поток-владелец]
+        self._cells_lock = threading.Lock()
+        self._retired = 0
+        self._offset = 0
+    
+    def inc(self, value: int = 1):
+        """Увеличение счетчика (пишет только в ячейку текущего потока)"""
+        try:
+            self._local.cell[0] += value
+        except AttributeError:
+            self._new_cell()[0] += value
+    
+    def _new_cell(self) -> list:
+        cell = [0, threading.current_thread()]
+        self._local.cell = cell
+        with self._cells_lock:
+            self._cells.append(cell)
+        return cell
+    
+    @property
+    def value(self) -> int:
+        """Сумма по всем потокам"""
+        with self._cells_lock:
+            total = self._retired
+            live_cells = []
+            for cell in self._cells:
+                total += cell[0]
+                if cell[1].is_alive():
+                    live_cells.append(cell)
+                else:
+                    # Поток завершился - в его ячейку больше никто не пишет
+                    self._retired += cell[0]
+            self._cells = live_cells
+        
+        return total - self._offset
+    
+    def reset(self):
+        """Сброс без записи в чужие ячейки: запоминаем текущее значение"""
+        self._offset += self.value
+
+class Gauge:
+    """Gauge: set() - одно присваивание атрибута"""
+    
+    def __init__(self, key: str):
+        self.key = key
+        self.value = None
+    
+    def set(self, value: float):
+        self.value = value
+
+class MetricsCollector:
+    """
+    Сборщик метрик
+    
+    Гистограммы хранятся как DDSketch по временным окнам window_seconds;
+    в сводку попадают последние windows окон. Память на метрику не зависит
+    от числа значений, а export_state/merge_state позволяют собрать метрики
+    нескольких процессов в одном сборщике: export_state отдает приращения
+    с прошлого экспорта, поэтому периодическое слияние не удваивает данные.
+    
+    Счетчики и gauges - это заранее связанные объекты (counter()/gauge()):
+    ключ метрики строится один раз, а горячий путь сводится к inc()/set().
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.01, window_seconds: float = 60.0,
+                 windows: int = 5):
+        self._counter_handles = {}  # ключ метрики -> Counter
+        self._gauge_handles = {}  # ключ метрики -> Gauge
+        self._handle_cache = {}  # (тип, имя, теги в порядке передачи) -> объект
+        self._registry_lock = threading.Lock()
+        self.histograms = defaultdict(deque)  # ключ -> deque[(начало окна, DDSketch)]
+        self.relative_accuracy = relative_accuracy
+        self.window_seconds = window_seconds
+        self.windows = windows
+        self._histogram_lock = threading.Lock()
+        # Приращения для export_state: значения счетчиков на момент прошлого
+        # экспорта и скетчи значений, записанных после него
+        self._exported_counters = {}
+        self._unexported_sketches = {}
         self.last_reset = datetime.utcnow()
     
+    def counter(self, name: str, **tags) -> Counter:
+        """Связанный счетчик: registry.counter("http", route="/x").inc()"""
+        return self._handle(self._counter_handles, Counter, name, tags)
+    
+    def gauge(self, name: str, **tags) -> Gauge:
+        """Связанный gauge"""
+        return self._handle(self._gauge_handles, Gauge, name, tags)
+    
+    def _handle(self, handles: Dict[str, Any], factory: type, name: str,
+                tags: Dict[str, str]):
+        """Поиск объекта метрики без сортировки тегов и форматирования строк"""
+        cache_key = (factory, name, tuple(tags.items()))
+        handle = self._handle_cache.get(cache_key)
+        if handle is None:
+            handle = self._handle_for_key(handles, factory, self._make_key(name, tags))
+            self._handle_cache[cache_key] = handle
+        return handle
+    
+    def _handle_for_key(self, handles: Dict[str, Any], factory: type, key: str):
+        handle = handles.get(key)
+        if handle is None:
+            with self._registry_lock:
+                handle = handles.get(key)
+                if handle is None:
+                    handle = handles[key] = factory(key)
+        return handle
+    
+    @property
+    def counters(self) -> Dict[str, int]:
+        """Значения счетчиков (шарды суммируются здесь, при чтении)"""
+        return {key: handle.value for key, handle in list(self._counter_handles.items())}
+    
+    @property
+    def gauges(self) -> Dict[str, float]:
+        return {key: handle.value for key, handle in list(self._gauge_handles.items())
+                if handle.value is not None}
+    
     def increment_counter(self, name: str, value: int = 1, tags: Dict[str, str] = None):
         """Увеличение счетчика"""
-        key = self._make_key(name, tags)
-        self.counters[key] += value
+        self._handle(self._counter_handles, Counter, name, tags or {}).inc(value)
+    
+    def _current_sketch(self, key: str, now: float) -> DDSketch:
+        """Скетч текущего окна (старые окна вытесняются)"""
+        window_start = now - now % self.window_seconds
+        windows = self.histograms[key]
+        
+        if not windows or windows[-1][0] != window_start:
+            windows.append((window_start, DDSketch(self.relative_accuracy)))
+        
+        horizon = now - self.window_seconds * self.windows
+        while windows[0][0] <= horizon:
+            windows.popleft()
+        
+        return windows[-1][1]
     
     def record_histogram(self, name: str, value: float, tags: Dict[str, str] = None):
         """Запись значения в гистограмму"""
         key = self._make_key(name, tags)
-        self.histograms[key].append(value)
+        with self._histogram_lock:
+            self._current_sketch(key, time.time()).add(value)
+            self._unexported_sketch(key).add(value)
+    
+    def _unexported_sketch(self, key: str) -> DDSketch:
+        """Скетч значений с прошлого export_state (вызывается под блокировкой)"""
+        sketch = self._unexported_sketches.get(key)
+        if sketch is None:
+            sketch = self._unexported_sketches[key] = DDSketch(self.relative_accuracy)
+        return sketch
+    
+    def get_histogram(self, name: str, tags: Dict[str, str] = None) -> DDSketch:
+        """Объединенный скетч по живым окнам"""
+        return self._merged_sketch(self._make_key(name, tags), time.time())
+    
+    def _merged_sketch(self, key: str, now: float) -> DDSketch:
+        merged = DDSketch(self.relative_accuracy)
+        horizon = now - self.window_seconds * self.windows
         
-        # Ограничиваем размер гистограммы
-        if len(self.histograms[key]) > 1000:
-            self.histograms[key] = self.histograms[key][-500:]
+        with self._histogram_lock:
+            for window_start, sketch in self.histograms.get(key, ()):
+                if window_start > horizon:
+                    merged.merge(sketch)
+        
+        return merged
     
     def set_gauge(self, name: str, value: float, tags: Dict[str, str] = None):
         """Установка значения gauge"""
-        key = self._make_key(name, tags)
-        self.gauges[key] = value
+        self._handle(self._gauge_handles, Gauge, name, tags or {}).set(value)
     
     def _make_key(self, name: str, tags: Dict[str, str] = None) -> str:
         """Создание ключа метрики"""
@@ -216,49 +587,146 @@ class MetricsCollector:
         """Получение сводки метрик"""
         summary = {
             'timestamp': datetime.utcnow().isoformat(),
-            'counters': dict(self.counters),
-            'gauges': dict(self.gauges),
+            'counters': self.counters,
+            'gauges': self.gauges,
             'histograms': {}
         }
         
-        # Статистика по гистограммам
-        for key, values in self.histograms.items():
-            if values:
+        # Статистика по гистограммам: процентили за один проход по корзинам
+        now = time.time()
+        for key in list(self.histograms):
+            sketch = self._merged_sketch(key, now)
+            if sketch.count:
+                p50, p95, p99 = sketch.quantiles([0.5, 0.95, 0.99])
                 summary['histograms'][key] = {
-                    'count': len(values),
-                    'min': min(values),
-                    'max': max(values),
-                    'avg': sum(values) / len(values),
-                    'p50': self._percentile(values, 0.5),
-                    'p95': self._percentile(values, 0.95),
-                    'p99': self._percentile(values, 0.99)
+                    'count': sketch.count,
+                    'min': sketch.min,
+                    'max': sketch.max,
+                    'avg': sketch.sum / sketch.count,
+                    'p50': p50,
+                    'p95': p95,
+                    'p99': p99
                 }
         
         return summary
     
-    def _percentile(self, values: List[float], p: float) -> float:
-        """Вычисление процентиля"""
-        sorted_values = sorted(values)
-        index = int(len(sorted_values) * p)
-        return sorted_values[min(index, len(sorted_values) - 1)]
+    def export_state(self) -> Dict[str, Any]:
+        """
+        Приращения с прошлого вызова для центрального сборщика (pickle/JSON)
+        
+        Счетчики - разность с прошлым экспортом (как смещение в Counter.reset),
+        гистограммы - скетчи значений, записанных после него, gauges - текущие
+        значения. Каждое экспортированное состояние сливается ровно один раз.
+        """
+        counters = {}
+        for key, value in self.counters.items():
+            previous = self._exported_counters.get(key, 0)
+            # После reset_counters значение меньше прошлого - приращение считаем с нуля
+            delta = value - previous if value >= previous else value
+            self._exported_counters[key] = value
+            if delta:
+                counters[key] = delta
+        
+        with self._histogram_lock:
+            sketches, self._unexported_sketches = self._unexported_sketches, {}
+        
+        return {
+            'counters': counters,
+            'gauges': self.gauges,
+            'histograms': {key: sketch.to_dict() for key, sketch in sketches.items()
+                           if sketch.count}
+        }
+    
+    def merge_state(self, state: Dict[str, Any]):
+        """Добавление приращений другого процесса (например, воркера)"""
+        for key, value in state['counters'].items():
+            self._handle_for_key(self._counter_handles, Counter, key).inc(value)
+        
+        for key, value in state['gauges'].items():
+            self._handle_for_key(self._gauge_handles, Gauge, key).set(value)
+        
+        now = time.time()
+        with self._histogram_lock:
+            for key, data in state['histograms'].items():
+                sketch = DDSketch.from_dict(data)
+                self._current_sketch(key, now).merge(sketch)
+                # Сборщик следующего уровня получит эти значения при своем экспорте
+                self._unexported_sketch(key).merge(sketch)
     
     def reset_counters(self):
         """Сброс счетчиков"""
-        self.counters.clear()
+        for handle in list(self._counter_handles.values()):
+            handle.reset()
         self.last_reset = datetime.utcnow()
 
 class AsyncLogHandler:
-    """Асинхронный обработчик логов"""
+    """
+    Асинхронный обработчик логов
+    
+    Записи забираются из очереди пачками: до batch_size записей, а неполная
+    пачка ждет пополнения не дольше batch_timeout секунд. Пачка передается
+    всем обработчикам одновременно через asyncio.gather; обработчик с методом
+    handle_many получает ее целиком, остальные - по записи через handle.
+    """
     
-    def __init__(self, max_queue_size: int = 10000):
+    OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+    
+    def __init__(self, max_queue_size: int = 10000, batch_size: int = 256,
+                 batch_timeout: float = 0.01, overflow: str = 'drop_new'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"overflow должен быть одним из {self.OVERFLOW_POLICIES}")
+        
         self.queue = asyncio.Queue(maxsize=max_queue_size)
         self.handlers = []
         self.running = False
         self.task = None
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.overflow = overflow
+        self.stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'processed': 0,
+            'batches': 0,
+            'handler_errors': 0
+        }
+        self._dispatchers = []
     
     def add_handler(self, handler):
         """Добавление обработчика"""
         self.handlers.append(handler)
+        self._dispatchers.append(self._make_dispatcher(handler))
+    
+    def _make_dispatcher(self, handler) -> Callable:
+        """Способ вызова обработчика определяется один раз, а не на каждую запись"""
+        handle_many = getattr(handler, 'handle_many', None)
+        
+        if handle_many is not None:
+            if asyncio.iscoroutinefunction(handle_many):
+                return handle_many
+            
+            async def dispatch(batch):
+                handle_many(batch)
+        elif asyncio.iscoroutinefunction(handler.handle):
+            async def dispatch(batch):
+                for log_record in batch:
+                    try:
+                        await handler.handle(log_record)
+                    except Exception as e:
+                        self._handler_error(e)
+        else:
+            async def dispatch(batch):
+                for log_record in batch:
+                    try:
+                        handler.handle(log_record)
+                    except Exception as e:
+                        self._handler_error(e)
+        
+        return dispatch
+    
+    def _handler_error(self, error: Exception):
+        self.stats['handler_errors'] += 1
+        print(f"Log handler error: {error}")
     
     async def start(self):
         """Запуск асинхронной обработки"""
@@ -271,33 +739,148 @@ class AsyncLogHandler:
         if self.task:
             await self.task
     
-    async def log_async(self, log_record: Dict[str, Any]):
-        """Асинхронное логирование"""
+    def log_nowait(self, log_record: Dict[str, Any]) -> bool:
+        """Постановка записи в очередь без ожидания; False - запись отброшена"""
         try:
-            await self.queue.put(log_record)
+            self.queue.put_nowait(log_record)
         except asyncio.QueueFull:
-            # В реальном приложении можно сбросить старые записи
-            pass
+            self.stats['dropped'] += 1
+            if self.overflow != 'drop_oldest':
+                return False
+            
+            # Вытесняем самую старую запись
+            self.queue.get_nowait()
+            self.queue.put_nowait(log_record)
+        
+        self.stats['enqueued'] += 1
+        return True
+    
+    async def log_async(self, log_record: Dict[str, Any]) -> bool:
+        """Асинхронное логирование"""
+        if self.overflow == 'block':
+            await self.queue.put(log_record)
+            self.stats['enqueued'] += 1
+            return True
+        
+        return self.log_nowait(log_record)
+    
+    def _drain(self, batch: List[Dict[str, Any]]):
+        queue = self.queue
+        while len(batch) < self.batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+    
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Пачка: до batch_size записей или batch_timeout ожидания"""
+        try:
+            batch = [await asyncio.wait_for(self.queue.get(), timeout=1.0)]
+        except asyncio.TimeoutError:
+            return []
+        
+        self._drain(batch)
+        if len(batch) < self.batch_size and self.running and self.batch_timeout > 0:
+            await asyncio.sleep(self.batch_timeout)
+            self._drain(batch)
+        
+        return batch
     
     async def _process_logs(self):
         """Обработка логов из очереди"""
         while self.running or not self.queue.empty():
             try:
-                log_record = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+                batch = await self._next_batch()
+                if not batch:
+                    continue
                 
-                for handler in self.handlers:
-                    try:
-                        if asyncio.iscoroutinefunction(handler.handle):
-                            await handler.handle(log_record)
-                        else:
-                            handler.handle(log_record)
-                    except Exception as e:
-                        print(f"Log handler error: {e}")
+                results = await asyncio.gather(
+                    *(dispatch(batch) for dispatch in self._dispatchers),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        self._handler_error(result)
                 
+                self.stats['processed'] += len(batch)
+                self.stats['batches'] += 1
+            
+            except Exception as e:
+                print(f"Log processing error: {e}")
+
+async def benchmark_async_log_handler(records: int = 20000, burst: int = 64) -> Dict[str, float]:
+    """
+    Пропускная способность: пачки + gather против обработки по одной записи
+    
+    Записи поступают, пока потребитель работает: производитель пишет их
+    сериями по burst и уступает цикл событий, поэтому пакетный режим
+    проходит и через ожидание batch_timeout при неполной пачке.
+    """
+    
+    class MemoryHandler:
+        def __init__(self):
+            self.records = []
+        
+        def handle(self, log_record):
+            self.records.append(log_record)
+        
+        def handle_many(self, batch):
+            self.records.extend(batch)
+    
+    class NetworkHandler:
+        # Имитация отправки по сети: одна уступка циклу событий на вызов
+        def __init__(self):
+            self.sent = 0
+        
+        async def handle(self, log_record):
+            await asyncio.sleep(0)
+            self.sent += 1
+        
+        async def handle_many(self, batch):
+            await asyncio.sleep(0)
+            self.sent += len(batch)
+    
+    async def one_by_one(handler: AsyncLogHandler):
+        # Прежний цикл: get на каждую запись и проверка типа обработчика
+        while handler.running or not handler.queue.empty():
+            try:
+                log_record = await asyncio.wait_for(handler.queue.get(), timeout=1.0)
+                for h in handler.handlers:
+                    if asyncio.iscoroutinefunction(h.handle):
+                        await h.handle(log_record)
+                    else:
+                        h.handle(log_record)
             except asyncio.TimeoutError:
                 continue
-            except Exception as e:
-                        print(f"Log processing error: {e}")
+    
+    async def produce(handler: AsyncLogHandler):
+        for i in range(records):
+            handler.log_nowait({'level': 'INFO', 'message': 'Request handled', 'request_id': i})
+            if i % burst == burst - 1:
+                await asyncio.sleep(0)
+    
+    results = {}
+    for mode in ('one_by_one', 'batched'):
+        handler = AsyncLogHandler(max_queue_size=records)
+        handler.add_handler(MemoryHandler())
+        handler.add_handler(NetworkHandler())
+        
+        start = time.perf_counter()
+        handler.running = True
+        task = asyncio.create_task(one_by_one(handler) if mode == 'one_by_one'
+                                   else handler._process_logs())
+        await produce(handler)
+        
+        # Производитель закончил - потребитель дорабатывает остаток очереди
+        handler.running = False
+        await task
+        elapsed = time.perf_counter() - start
+        
+        assert len(handler.handlers[0].records) == records
+        results[mode] = records / elapsed
+        line = f"   {mode:<12} {results[mode]:>12,.0f} записей/с"
+        if handler.stats['batches']:
+            line += f" ({records / handler.stats['batches']:.0f} записей на пачку)"
+        print(line)
+    
+    return results
 
 class AdvancedLoggerSolution:
     """Решение: Продвинутая система логирования"""
@@ -345,8 +928,7 @@ class AdvancedLoggerSolution:
     
     def set_context(self, **kwargs):
         """Установка контекста"""
-        for key, value in kwargs.items():
-            self.context.set(key, value)
+        self.context.update(**kwargs)
     
     def clear_context(self):
         """Очистка контекста"""
@@ -442,29 +1024,106 @@ class AdvancedLoggerSolution:
     def debug(self, message: str, **context):
         self.log_with_context('debug', message, **context)
 
+def get_json_backend(preferred=('orjson', 'ujson')):
+    """Выбор самой быстрой доступной JSON библиотеки с fallback на json"""
+    for module_name in preferred:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        
+        if module_name == 'orjson':
+            # orjson возвращает bytes
+            return (lambda obj, _dumps=module.dumps: _dumps(obj).decode('utf-8')), module_name
+        if module_name == 'ujson':
+            return functools.partial(module.dumps, escape_forward_slashes=False), module_name
+        return module.dumps, module_name
+    
+    return json.dumps, 'json'
+
+class TimestampCache:
+    """Кэш ISO-времени: дата форматируется один раз в секунду"""
+    
+    def __init__(self):
+        self._cached = (None, '')
+    
+    def format(self, created: float) -> str:
+        # Округление микросекунд как в datetime.utcfromtimestamp
+        frac, second = math.modf(created)
+        us = round(frac * 1e6)
+        if us >= 1000000:
+            second += 1
+            us -= 1000000
+        elif us < 0:
+            second -= 1
+            us += 1000000
+        
+        second = int(second)
+        cached_second, prefix = self._cached
+        if cached_second != second:
+            prefix = datetime.utcfromtimestamp(second).isoformat()
+            self._cached = (second, prefix)
+        
+        if us:
+            return f"{prefix}.{us:06d}"
+        return prefix
+
 class JsonLogFormatter(logging.Formatter):
     """JSON форматтер с поддержкой структурированных данных"""
     
-    def __init__(self, advanced_logger):
+    STRUCTURED_KEYS = {'timestamp', 'level', 'logger', 'message', 'context'}
+    CACHE_LIMIT = 4096
+    
+    def __init__(self, advanced_logger, backend: str = None):
         super().__init__()
         self.advanced_logger = advanced_logger
+        self.dumps, self.backend = get_json_backend((backend,) if backend else ('orjson', 'ujson'))
+        
+        self._encode_str = json.encoder.encode_basestring_ascii
+        self._timestamps = TimestampCache()
+        self._head_cache = {}
+    
+    def _head(self, level: str, logger_name: str) -> str:
+        """Сериализованный фрагмент с уровнем и именем логгера"""
+        key = (level, logger_name)
+        head = self._head_cache.get(key)
+        if head is None:
+            if len(self._head_cache) >= self.CACHE_LIMIT:
+                self._head_cache.clear()
+            head = (f', "level": {self._encode_str(level)}, '
+                    f'"logger": {self._encode_str(logger_name)}, "message": ')
+            self._head_cache[key] = head
+        return head
     
     def format(self, record):
-        if hasattr(record, 'structured_data'):
-            return json.dumps(record.structured_data)
+        data = getattr(record, 'structured_data', None)
+        if data is not None:
+            # Шаблон подходит, только если фильтры не поменяли состав записи
+            if (data.keys() != self.STRUCTURED_KEYS or type(data['timestamp']) is not str
+                    or type(data['level']) is not str or type(data['logger']) is not str
+                    or type(data['message']) is not str):
+                return json.dumps(data)
+            
+            try:
+                context = self.dumps(data['context'])
+            except (TypeError, OverflowError):
+                context = json.dumps(data['context'])
+            
+            return ''.join((
+                '{"timestamp": ', self._encode_str(data['timestamp']),
+                self._head(data['level'], data['logger']), self._encode_str(data['message']),
+                ', "context": ', context, '}'
+            ))
         
         # Стандартное форматирование
-        log_entry = {
-            'timestamp': datetime.utcfromtimestamp(record.created).isoformat(),
-            'level': record.levelname,
-            'logger': record.name,
-            'message': record.getMessage(),
-            'module': record.module,
-            'function': record.funcName,
-            'line': record.lineno,
-        }
-        
-        return json.dumps(log_entry)
+        return ''.join((
+            '{"timestamp": "', self._timestamps.format(record.created),
+            '"', self._head(record.levelname, record.name),
+            self._encode_str(record.getMessage()),
+            ', "module": ', self._encode_str(record.module),
+            ', "function": ', json.dumps(record.funcName),
+            ', "line": ', str(record.lineno), '}'
+        ))
 
 # Декораторы для трассировки
 def trace_function(logger: AdvancedLoggerSolution, operation: str = None):
@@ -553,6 +1212,141 @@ class TestAdvancedLogger:
         # Должен быть только один лог (ERROR)
         total_logs = sum(v for k, v in metrics['counters'].items() if k.startswith('logs_total'))
         assert total_logs == 1
+    
+    def test_json_formatter(self, logger):
+        """Тест быстрого JSON форматтера"""
+        formatter = JsonLogFormatter(logger)
+        log_record = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'level': 'INFO',
+            'logger': 'test_logger',
+            'message': 'Привет "мир"',
+            'context': {'user_id': 123, 'tags': ['a', 'b']}
+        }
+        record = logger.logger.makeRecord('test_logger', logging.INFO, __file__, 1,
+                                          'plain', None, None)
+        
+        # Шаблонный вывод разбирается в тот же объект, что и json.dumps
+        record.structured_data = log_record
+        assert json.loads(formatter.format(record)) == log_record
+        
+        del record.structured_data
+        plain = json.loads(formatter.format(record))
+        assert plain['message'] == 'plain'
+        assert plain['timestamp'] == datetime.utcfromtimestamp(record.created).isoformat()
+    
+    def test_histogram_sketch(self):
+        """Тест DDSketch: точность процентилей и объединение"""
+        values = [i * 0.37 for i in range(1, 20001)]
+        worker_a, worker_b = MetricsCollector(), MetricsCollector()
+        for i, value in enumerate(values):
+            (worker_a if i % 2 else worker_b).record_histogram('latency_ms', value)
+        
+        # Центральный сборщик объединяет состояния воркеров
+        central = MetricsCollector()
+        central.merge_state(json.loads(json.dumps(worker_a.export_state())))
+        central.merge_state(worker_b.export_state())
+        
+        stats = central.get_metrics_summary()['histograms']['latency_ms']
+        assert stats['count'] == len(values)
+        assert stats['max'] == values[-1]
+        
+        exact_p99 = values[int((len(values) - 1) * 0.99)]
+        assert abs(stats['p99'] - exact_p99) / exact_p99 <= 0.011
+    
+    def test_repeated_state_merge(self):
+        """Тест периодического слияния: экспортируются только приращения"""
+        worker, central = MetricsCollector(), MetricsCollector()
+        requests = worker.counter('requests')
+        
+        for _ in range(3):
+            requests.inc(5)
+            worker.record_histogram('latency_ms', 10.0)
+            central.merge_state(worker.export_state())
+        
+        # Пустой экспорт ничего не добавляет
+        central.merge_state(worker.export_state())
+        
+        assert central.counters['requests'] == 15
+        assert central.get_metrics_summary()['histograms']['latency_ms']['count'] == 3
+    
+    def test_counter_shards(self):
+        """Тест счетчиков с шардами по потокам"""
+        metrics = MetricsCollector()
+        counter = metrics.counter('http_requests', route='/x', method='GET')
+        
+        def worker():
+            for _ in range(10000):
+                counter.inc()
+            # Тот же ключ при другом порядке тегов
+            metrics.increment_counter('http_requests', tags={'method': 'GET', 'route': '/x'})
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert metrics.counters == {'http_requests[method=GET,route=/x]': 80008}
+        
+        metrics.reset_counters()
+        counter.inc(2)
+        assert counter.value == 2
+    
+    def test_context_isolation_between_tasks(self, logger):
+        """Тест изоляции контекста между задачами asyncio"""
+        async def handle_request(user_id):
+            logger.set_context(user_id=user_id)
+            await asyncio.sleep(0.01)
+            
+            # Контекст доступен и в потоке executor'а
+            loop = asyncio.get_running_loop()
+            in_executor = await loop.run_in_executor(
+                None, LogContext.bind(lambda: logger.context.get('user_id'))
+            )
+            return logger.context.get('user_id'), in_executor
+        
+        async def main():
+            return await asyncio.gather(*(handle_request(i) for i in range(10)))
+        
+        assert asyncio.run(main()) == [(i, i) for i in range(10)]
+        assert logger.context.get('user_id') is None
+    
+    def test_context_separate_per_logger(self, logger):
+        """Тест раздельных контекстов логгеров в общем ContextVar"""
+        other = AdvancedLoggerSolution('other_logger')
+        logger.context.clear()
+        
+        with logger.context.scope(user_id=1):
+            other.set_context(user_id=2)
+            assert logger.context.get('user_id') == 1
+        
+        # Выход из scope откатывает только свой контекст
+        assert logger.context.get('user_id') is None
+        assert other.context.get('user_id') == 2
+        other.clear_context()
+    
+    def test_trace_store_eviction_and_sampling(self):
+        """Тест вытеснения завершенных трассировок и сэмплирования логов"""
+        manager = TraceManager(max_completed=10, log_sample_rate=0.0, max_logs_per_trace=5)
+        
+        trace_ids = []
+        for i in range(20):
+            trace_id = manager.start_trace(f'operation_{i}')
+            manager.add_log_to_trace(trace_id, {'message': 'not sampled'})
+            manager.end_trace(trace_id)
+            trace_ids.append(trace_id)
+        
+        assert len(manager.completed_traces) == 10
+        assert manager.get_trace(trace_ids[0]) is None
+        assert manager.get_trace(trace_ids[-1])['logs'] == []
+        
+        manager.log_sample_rate = 1.0
+        trace_id = manager.start_trace('sampled')
+        for i in range(8):
+            manager.add_log_to_trace(trace_id, {'message': i})
+        trace = manager.get_trace(trace_id)
+        assert len(trace['logs']) == 5 and trace['dropped_logs'] == 3
 
 # =============================================================================
 # Упражнение 2: Application Performance Monitoring (APM)
@@ -928,6 +1722,9 @@ def run_exercises():
     metrics = logger.get_metrics()
     print(f"   Метрики логирования: {len(metrics['counters'])} счетчиков")
     
+    # Пропускная способность асинхронной обработки логов
+    asyncio.run(benchmark_async_log_handler())
+    
     # 2. APM Tracker
     print("\n2. Application Performance Monitoring...")
     apm = APMTrackerSolution()